@@ -66,6 +66,99 @@ def build_response(http_code, body):
     }
 
 
+# Parquet codecs an archive can be written with; see archive_glue.py.
+COMPRESSION_CODECS = ("snappy", "zstd", "gzip", "uncompressed")
+
+# Whether each table gets its own Glue job run or one run archives them all.
+JOB_MODES = ("table", "archive")
+
+# Granularities a date or timestamp partition column can be derived at.
+PARTITION_GRANULARITIES = ("year", "month", "day")
+
+
+def partition_error(table):
+    """Return why the table's output_partition is invalid, or None."""
+    partition = table.get("output_partition")
+    if not partition:
+        return None
+
+    column = partition.get("column")
+    if column not in [schema["key"] for schema in table.get("schema", [])]:
+        return f'Unknown partition column {column} for table {table["table"]}'
+
+    granularity = partition.get("granularity")
+    if granularity and granularity not in PARTITION_GRANULARITIES:
+        return f'Unsupported partition granularity: {granularity}'
+    return None
+
+
+def bucket_error(table):
+    """Return why the table's output_bucket is invalid, or None."""
+    bucket = table.get("output_bucket")
+    if not bucket:
+        return None
+
+    column = bucket.get("column")
+    if column not in [schema["key"] for schema in table.get("schema", [])]:
+        return f'Unknown bucket column {column} for table {table["table"]}'
+    # Partitioning on a column's own values leaves one value per partition.
+    partition = table.get("output_partition") or {}
+    if column == partition.get("column") and not partition.get("granularity"):
+        return f'Bucket column {column} is the partition column of table {table["table"]}'
+
+    buckets = bucket.get("buckets")
+    if not isinstance(buckets, int) or isinstance(buckets, bool) or buckets < 1:
+        return f'Invalid buckets for table {table["table"]}: {buckets}'
+    return None
+
+
+def incremental_error(table):
+    """Return why the table's incremental column is invalid, or None."""
+    incremental = table.get("incremental")
+    if not incremental:
+        return None
+
+    column = incremental.get("column")
+    if column not in [schema["key"] for schema in table.get("schema", [])]:
+        return f'Unknown incremental column {column} for table {table["table"]}'
+    return None
+
+
+def parquet_layout_error(table):
+    """Return why the table's parquet_layout is invalid, or None."""
+    layout = table.get("parquet_layout")
+    if not layout:
+        return None
+
+    for size in ("row_group_mb", "page_kb"):
+        value = layout.get(size)
+        if value is not None and (not isinstance(value, int) or value < 1):
+            return f'Invalid {size} for table {table["table"]}: {value}'
+
+    if not isinstance(layout.get("dictionary", True), bool):
+        return f'Invalid dictionary for table {table["table"]}: {layout["dictionary"]}'
+
+    columns = [schema["key"] for schema in table.get("schema", [])]
+    for column in layout.get("sort_by") or []:
+        if column not in columns:
+            return f'Unknown sort column {column} for table {table["table"]}'
+    return None
+
+
+def row_filter_error(table):
+    """Return why the table's row_filter is invalid, or None.
+
+    The filter is a condition that goes into the WHERE clause of the source
+    query, so it must be a single expression.
+    """
+    row_filter = table.get("row_filter")
+    if row_filter is None:
+        return None
+    if not isinstance(row_filter, str) or ";" in row_filter:
+        return f'Invalid row filter for table {table["table"]}'
+    return None
+
+
 def lambda_handler(event, context):
     logger.info(mask_sensitive_data(event))
 
@@ -85,6 +178,43 @@ def lambda_handler(event, context):
         database = body["database"]
         database_engine = body["database_engine"]
         table_details = body["tables"]
+        compression = body.get("compression", "snappy")
+        target_file_mb = body.get("target_file_mb", 128)
+        max_records_per_file = body.get("max_records_per_file")
+        job_mode = body.get("job_mode", "table")
+        small_table_mb = body.get("small_table_mb", 64)
+        lob_threshold_kb = body.get("lob_threshold_kb", 1024)
+
+        if compression not in COMPRESSION_CODECS:
+            return build_response(
+                400, json.dumps({"error": f"Unsupported compression: {compression}"}))
+
+        if job_mode not in JOB_MODES:
+            return build_response(
+                400, json.dumps({"error": f"Unsupported job mode: {job_mode}"}))
+
+        if not isinstance(small_table_mb, int) or small_table_mb < 0:
+            return build_response(
+                400, json.dumps({"error": f"Invalid small_table_mb: {small_table_mb}"}))
+
+        if not isinstance(lob_threshold_kb, int) or lob_threshold_kb < 0:
+            return build_response(
+                400, json.dumps({"error": f"Invalid lob_threshold_kb: {lob_threshold_kb}"}))
+
+        if not isinstance(target_file_mb, int) or target_file_mb < 1:
+            return build_response(
+                400, json.dumps({"error": f"Invalid target_file_mb: {target_file_mb}"}))
+
+        if max_records_per_file is not None and (
+                not isinstance(max_records_per_file, int) or max_records_per_file < 1):
+            return build_response(
+                400, json.dumps({"error": f"Invalid max_records_per_file: {max_records_per_file}"}))
+
+        for table in table_details:
+            error = (partition_error(table) or bucket_error(table) or row_filter_error(table)
+                     or incremental_error(table) or parquet_layout_error(table))
+            if error:
+                return build_response(400, json.dumps({"error": error}))
 
         for table in table_details:
             table["count_validation"] = {}
@@ -124,7 +254,16 @@ def lambda_handler(event, context):
                 "configuration": {"glue":
                                   {
                                       "glue_worker": "Standard",
-                                      "glue_capacity": 2
+                                      "glue_capacity": 2,
+                                      "job_mode": job_mode,
+                                      "small_table_mb": small_table_mb
+                                  },
+                                  "output":
+                                  {
+                                      "compression": compression,
+                                      "target_file_mb": target_file_mb,
+                                      "max_records_per_file": max_records_per_file,
+                                      "lob_threshold_kb": lob_threshold_kb
                                   }
                                   },
                 "counters": {"validation":
@@ -0,0 +1,55 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+from collections import OrderedDict
+import time
+
+
+class SchemaCache:
+    """In-memory cache of discovered schemas that lives for the warm container.
+
+    Entries are keyed by the source identity and stored with the catalog
+    fingerprint they were discovered under. A lookup only hits when the
+    entry is younger than the TTL and the source still reports the same
+    fingerprint. The least recently used entry is evicted once max_entries
+    is reached.
+    """
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key, fingerprint):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        stored_at, stored_fingerprint, value = entry
+        if time.monotonic() - stored_at > self.ttl_seconds or stored_fingerprint != fingerprint:
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, fingerprint, value):
+        if self.max_entries <= 0:
+            return
+
+        self.entries[key] = (time.monotonic(), fingerprint, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -0,0 +1,56 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+
+def table_key(table, fields):
+    """Return the values of fields that identify a table record, such as its schema and name."""
+    return tuple(table[field] for field in fields)
+
+
+def column_fingerprint(columns):
+    """Return the names and Glue types of a table's columns, in order."""
+    return [(column["key"], column["value"]) for column in columns]
+
+
+def changed_tables(table_list, previous_tables, fields, ddl_changed, compare_columns=True):
+    """Return the tables of table_list that changed since previous_tables was read.
+
+    Tables are matched on fields. A table counts as changed when it is not
+    in previous_tables, when its columns differ from the schema its
+    previous entry was sent with, or when its key is in ddl_changed, the
+    tables the catalog's DDL timestamps say changed. Comparing columns
+    catches the changes those timestamps miss, such as MySQL's INSTANT
+    ALTERs; entries sent without a schema, and tables read without their
+    columns, can only be compared by the timestamps.
+    """
+
+    previous = {table_key(table, fields): table for table in previous_tables}
+    changed = []
+    for table in table_list:
+        key = table_key(table, fields)
+        entry = previous.get(key)
+        if (entry is None or key in ddl_changed
+                or (compare_columns and "schema" in entry and column_fingerprint(entry["schema"])
+                    != column_fingerprint(table["schema"]))):
+            changed.append(table)
+    return changed
+
+
+def dropped_tables(table_list, previous_tables, fields):
+    """Return the fields of the entries of previous_tables no longer in table_list."""
+
+    current = {table_key(table, fields) for table in table_list}
+    return [{field: table[field] for field in fields} for table in previous_tables
+            if table_key(table, fields) not in current]
@@ -0,0 +1,89 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+# Upper bound on the table names of one IN list; Oracle takes at most 1000.
+NAME_BATCH_SIZE = 500
+
+
+def positional(params):
+    """Return a bind function for drivers that use %s placeholders."""
+
+    def bind(value):
+        params.append(value)
+        return "%s"
+    return bind
+
+
+def named(binds):
+    """Return a bind function for drivers that use :name placeholders."""
+
+    def bind(value):
+        name = f"f{len(binds)}"
+        binds[name] = value
+        return f":{name}"
+    return bind
+
+
+class TableFilter:
+    """Table selection pushed down into the catalog queries.
+
+    include and exclude are lists of SQL LIKE patterns matched against the
+    table name, so case sensitivity follows the catalog collation. schemas
+    limits the SQL Server schemas or Oracle owners that are read, and
+    tables_only returns tables without reading their columns.
+    """
+
+    def __init__(self, include=None, exclude=None, schemas=None, tables_only=False):
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.schemas = list(schemas or [])
+        self.tables_only = bool(tables_only)
+
+    @classmethod
+    def from_body(cls, body):
+        return cls(
+            include=body.get("include_tables"),
+            exclude=body.get("exclude_tables"),
+            schemas=body.get("schemas"),
+            tables_only=body.get("tables_only", False),
+        )
+
+    def key(self):
+        return (tuple(self.include), tuple(self.exclude),
+                tuple(self.schemas), self.tables_only)
+
+    def sql(self, table_column, schema_column, bind, names=None):
+        """Return the filter as AND-prefixed conditions on the given columns.
+
+        bind is called once per value, in the order the placeholders
+        appear, and returns the placeholder to put in the statement. Given
+        names, tables are also limited to those names.
+        """
+
+        conditions = []
+        if self.include:
+            conditions.append(
+                "(" + " OR ".join(f"{table_column} LIKE {bind(pattern)}"
+                                  for pattern in self.include) + ")")
+        for pattern in self.exclude:
+            conditions.append(f"{table_column} NOT LIKE {bind(pattern)}")
+        if self.schemas and schema_column:
+            conditions.append(
+                f"{schema_column} IN ("
+                + ", ".join(bind(schema) for schema in self.schemas) + ")")
+        if names is not None:
+            conditions.append(
+                f"{table_column} IN (" + ", ".join(bind(name) for name in names) + ")")
+        return "".join(f" AND {condition}" for condition in conditions)
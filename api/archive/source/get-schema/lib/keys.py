@@ -0,0 +1,34 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+
+def choose_split_key(candidates):
+    """Pick the index whose leading column is best for splitting reads into ranges.
+
+    candidates are (index, is_primary, column_count, column, kind) tuples for
+    the unique indexes of one table, where kind is "numeric", "date" or None
+    for a leading column that cannot be split into ranges. The primary key
+    wins, then the index with the fewest columns. The bounds are left for
+    the Glue job to read.
+    """
+
+    usable = [candidate for candidate in candidates if candidate[4]]
+    if not usable:
+        return None
+
+    index, _, _, column, kind = min(
+        usable, key=lambda candidate: (not candidate[1], candidate[2], candidate[0]))
+    return {"column": column, "type": kind, "index": index,
+            "lower": None, "upper": None}
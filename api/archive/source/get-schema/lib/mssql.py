@@ -14,8 +14,13 @@ permissions and limitations under the License.
 """
 
 from contextlib import nullcontext
-import pymssql
+from itertools import groupby
+from operator import itemgetter
+import source_connector
 import traceback
+from lib import changes
+from lib import keys
+from lib.filters import NAME_BATCH_SIZE, TableFilter, positional
 import os
 import logging
 
@@ -86,70 +91,348 @@ def convert_schema(type):
         return "string"
 
 
+# Key column types whose values can be split into ranges for parallel reads.
+NUMERIC_TYPES = ("tinyint", "smallint", "int", "bigint", "decimal", "numeric")
+DATE_TYPES = ("date", "datetime", "datetime2", "smalldatetime")
+
+
+def group_tables(rows):
+    """Group catalog rows ordered by (schema, table) into table records.
+
+    Rows without a column name stand for a table read without its columns.
+    """
+
+    table_list = []
+    for (mssql_schema, table_name), columns in groupby(rows, key=itemgetter(0, 1)):
+        row_list = []
+        for row in columns:
+            if row[2] is None:
+                continue
+            row_type = convert_schema(row[3])
+            row_list.append(
+                {
+                    "key": row[2],
+                    "value": row_type,
+                    "origin_type": row[3],
+                    "existing": True,
+                    "schema": table_name,
+                }
+            )
+        table_list.append(
+            {"table": table_name, "schema": row_list,
+                "mssql_schema": mssql_schema}
+        )
+    return table_list
+
+
 class Connection:
-    def __init__(self, hostname, port, username, password, database):
+    # Fields that identify a table in previous_tables and dropped.
+    TABLE_KEY = ("mssql_schema", "table")
+
+    def __init__(self, hostname, port, username, password, database, table_filter=None):
         self.hostname = hostname
         self.port = port
         self.username = username
         self.password = password
         self.database = database
+        self.table_filter = table_filter or TableFilter()
+
+    def connect(self):
+        return source_connector.connect("mssql", self.hostname, self.port,
+                                        self.username, self.password, self.database)
+
+    def catalog_sql(self, params, conditions=(), limit=None):
+        """Build the catalog query for the tables matching conditions and the table filter.
+
+        conditions are (sql, values) pairs on information_schema.tables t
+        with {} where each value goes. Tables are optionally limited to the
+        first limit tables in (schema, table) order, and joined to their
+        columns unless the filter asks for tables only.
+        """
+
+        bind = positional(params)
+        top = f"TOP ({bind(limit)}) " if limit is not None else ""
+        tables = (f"SELECT {top}t.table_schema, t.table_name "
+                  "FROM information_schema.tables t WHERE 1 = 1")
+        for condition, values in conditions:
+            tables += " AND " + condition.format(*[bind(value) for value in values])
+        tables += self.table_filter.sql("t.table_name", "t.table_schema", bind)
+        if limit is not None:
+            tables += " ORDER BY t.table_schema, t.table_name"
+
+        if self.table_filter.tables_only:
+            return ("SELECT p.table_schema, p.table_name, NULL, NULL "
+                    f"FROM ({tables}) p ORDER BY p.table_schema, p.table_name")
+
+        return ("SELECT c.table_schema, c.table_name, c.column_name, c.data_type "
+                "FROM information_schema.columns c "
+                f"JOIN ({tables}) p ON p.table_schema = c.table_schema "
+                "AND p.table_name = c.table_name "
+                "ORDER BY c.table_schema, c.table_name, c.ordinal_position")
+
+    def read_tables(self, sql, params=None, by_name=False):
+        """Run a catalog query over one connection and group the streamed rows."""
 
-    def get_schema(self):
+        try:
+            with self.connect() as connection:
+                cursor = connection.cursor()
+                cursor.execute(sql, params)
+                table_list = group_tables(cursor)
+                self.describe_tables(cursor, table_list, by_name)
+                return table_list
+
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            raise
+
+    def describe_tables(self, cursor, table_list, by_name=False):
+        """Attach statistics, split keys and partitioning to the table records.
+
+        by_name limits the catalog queries to the tables in table_list, in
+        batches of NAME_BATCH_SIZE names, for pages and changes that hold
+        a few tables of a large catalog; otherwise each query reads every
+        table the filter matches once. Tables-only requests skip them all.
+        """
+
+        if self.table_filter.tables_only:
+            return
+
+        batches = ([table_list[start:start + NAME_BATCH_SIZE]
+                    for start in range(0, len(table_list), NAME_BATCH_SIZE)]
+                   if by_name else [table_list])
+        for batch in batches:
+            names = sorted({table["table"] for table in batch}) if by_name else None
+            self.add_statistics(cursor, batch, names)
+            self.add_split_keys(cursor, batch, names)
+            self.add_partitioning(cursor, batch, names)
 
-        table_list = []
+    def add_statistics(self, cursor, table_list, names=None):
+        """Attach size estimates and primary key columns to each table record.
+
+        Row counts and used pages of the heap or clustered index come from
+        sys.dm_db_partition_stats, so no table is scanned. Reading it needs
+        VIEW DATABASE STATE; statistics are best effort and are left empty
+        when the catalog cannot be read.
+        """
+
+        params = []
+        conditions = self.table_filter.sql("t.name", "s.name", positional(params), names)
 
         try:
-            connection = pymssql.connect(
-                host=self.hostname,
-                user=self.username,
-                password=self.password,
-                database=self.database,
+            cursor.execute(
+                "SELECT s.name, t.name, ps.row_count, ps.data_bytes, "
+                "CASE WHEN lob.object_id IS NULL THEN 0 ELSE 1 END "
+                "FROM sys.tables t "
+                "JOIN sys.schemas s ON s.schema_id = t.schema_id "
+                "JOIN (SELECT object_id, "
+                "SUM(CASE WHEN index_id IN (0, 1) THEN row_count ELSE 0 END) AS row_count, "
+                "SUM(CASE WHEN index_id IN (0, 1) THEN used_page_count ELSE 0 END) * 8192 AS data_bytes "
+                "FROM sys.dm_db_partition_stats GROUP BY object_id) ps "
+                "ON ps.object_id = t.object_id "
+                "LEFT JOIN (SELECT DISTINCT c.object_id FROM sys.columns c "
+                "JOIN sys.types ty ON ty.user_type_id = c.user_type_id "
+                "WHERE c.max_length = -1 "
+                "OR ty.name IN ('text', 'ntext', 'image', 'xml')) lob "
+                "ON lob.object_id = t.object_id "
+                "WHERE 1 = 1" + conditions,
+                tuple(params)
             )
+            statistics = {(row[0], row[1]): row for row in cursor.fetchall()}
+
+            cursor.execute(
+                "SELECT s.name, t.name, c.name "
+                "FROM sys.indexes i "
+                "JOIN sys.index_columns ic "
+                "ON ic.object_id = i.object_id AND ic.index_id = i.index_id "
+                "JOIN sys.columns c "
+                "ON c.object_id = ic.object_id AND c.column_id = ic.column_id "
+                "JOIN sys.tables t ON t.object_id = i.object_id "
+                "JOIN sys.schemas s ON s.schema_id = t.schema_id "
+                "WHERE i.is_primary_key = 1" + conditions + " "
+                "ORDER BY s.name, t.name, ic.key_ordinal",
+                tuple(params)
+            )
+            primary_keys = {}
+            for row in cursor.fetchall():
+                primary_keys.setdefault((row[0], row[1]), []).append(row[2])
+
+        except Exception:
+            logger.warning(traceback.format_exc())
+            statistics, primary_keys = {}, {}
+
+        for table in table_list:
+            key = (table["mssql_schema"], table["table"])
+            row = statistics.get(key)
+            table["statistics"] = {
+                "estimated_rows": int(row[2]) if row else None,
+                "data_bytes": int(row[3]) if row else None,
+                "has_lob": bool(row[4]) if row else False,
+                "primary_key": primary_keys.get(key, []),
+            }
+
+    def add_split_keys(self, cursor, table_list, names=None):
+        """Attach the key each table's reads can be split on.
+
+        The key is the leading column of the primary key or of a unique
+        index, when it is numeric or a date. Its bounds are left to the
+        Glue job, which reads them at the source when it reads the table in
+        parallel, so discovery takes no per-table queries.
+        """
+
+        candidates = {}
+        try:
+            params = []
+            cursor.execute(
+                "SELECT s.name, t.name, i.name, i.is_primary_key, COUNT(*), "
+                "MAX(CASE WHEN ic.key_ordinal = 1 THEN c.name END), "
+                "MAX(CASE WHEN ic.key_ordinal = 1 THEN ty.name END) "
+                "FROM sys.indexes i "
+                "JOIN sys.index_columns ic "
+                "ON ic.object_id = i.object_id AND ic.index_id = i.index_id "
+                "AND ic.key_ordinal > 0 "
+                "JOIN sys.columns c "
+                "ON c.object_id = ic.object_id AND c.column_id = ic.column_id "
+                "JOIN sys.types ty ON ty.user_type_id = c.system_type_id "
+                "JOIN sys.tables t ON t.object_id = i.object_id "
+                "JOIN sys.schemas s ON s.schema_id = t.schema_id "
+                "WHERE i.is_unique = 1"
+                + self.table_filter.sql("t.name", "s.name", positional(params), names)
+                + " GROUP BY s.name, t.name, i.name, i.is_primary_key",
+                tuple(params)
+            )
+            for row in cursor.fetchall():
+                kind = ("numeric" if row[6] in NUMERIC_TYPES
+                        else "date" if row[6] in DATE_TYPES else None)
+                candidates.setdefault((row[0], row[1]), []).append(
+                    (row[2], bool(row[3]), int(row[4]), row[5], kind))
+
+        except Exception:
+            logger.warning(traceback.format_exc())
+
+        for table in table_list:
+            key = (table["mssql_schema"], table["table"])
+            table["split_key"] = keys.choose_split_key(candidates.get(key, []))
+
+    def add_partitioning(self, cursor, table_list, names=None):
+        """Attach the partition scheme of each partitioned table."""
+
+        partitioning = {}
+        try:
+            params = []
+            cursor.execute(
+                "SELECT s.name, t.name, pf.type_desc, c.name, pf.fanout "
+                "FROM sys.tables t "
+                "JOIN sys.schemas s ON s.schema_id = t.schema_id "
+                "JOIN sys.indexes i ON i.object_id = t.object_id AND i.index_id IN (0, 1) "
+                "JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id "
+                "JOIN sys.partition_functions pf ON pf.function_id = ps.function_id "
+                "JOIN sys.index_columns ic "
+                "ON ic.object_id = i.object_id AND ic.index_id = i.index_id "
+                "AND ic.partition_ordinal = 1 "
+                "JOIN sys.columns c "
+                "ON c.object_id = ic.object_id AND c.column_id = ic.column_id "
+                "WHERE 1 = 1"
+                + self.table_filter.sql("t.name", "s.name", positional(params), names),
+                tuple(params)
+            )
+            for row in cursor.fetchall():
+                partitioning[(row[0], row[1])] = {
+                    "type": row[2], "key": row[3], "count": int(row[4])}
+
+        except Exception:
+            logger.warning(traceback.format_exc())
+
+        for table in table_list:
+            table["partitioning"] = partitioning.get((table["mssql_schema"], table["table"]))
 
+    def get_catalog_fingerprint(self):
+        """Return a cheap summary of the catalog that changes when its tables do.
+
+        ALTER, CREATE and DROP all move the object count or the latest
+        sys.objects modify_date of user tables and views.
+        """
+
+        with self.connect() as connection:
             cursor = connection.cursor()
-            cursor.execute("SELECT table_name FROM information_schema.columns")
-            tables = cursor.fetchall()
+            cursor.execute(
+                "SELECT COUNT(*), MAX(modify_date) FROM sys.objects "
+                "WHERE type IN ('U', 'V')"
+            )
+            return [str(value) for value in cursor.fetchone()]
 
-            tables_list = [item for t in tables for item in t]
-            deduplicate_tables = [*set(tables_list)]
+    def get_schema(self):
+        """Read the column catalog of the database in one ordered pass.
+
+        Rows of information_schema.columns are streamed in schema, table
+        and ordinal order and grouped on (schema, table), so tables that
+        share a name across schemas are kept apart.
+        """
+
+        params = []
+        sql = self.catalog_sql(params)
+        return self.read_tables(sql, tuple(params))
+
+    def get_schema_page(self, page_size, after=None):
+        """Read up to page_size tables that sort after the (schema, table) key.
+
+        Returns the tables and the key of the last one, or None as the key
+        when the catalog has been read to the end.
+        """
+
+        params = []
+        conditions = []
+        if after:
+            conditions.append(
+                ("(t.table_schema > {} OR (t.table_schema = {} AND t.table_name > {}))",
+                 [after[0], after[0], after[1]]))
+        sql = self.catalog_sql(params, conditions, limit=page_size)
+        table_list = self.read_tables(sql, tuple(params), by_name=True)
+
+        if len(table_list) < page_size:
+            return table_list, None
+        last = table_list[-1]
+        return table_list, [last["mssql_schema"], last["table"]]
+
+    def get_schema_changes(self, since, previous_tables):
+        """Return tables changed after since, and tables dropped from previous_tables.
+
+        A table counts as changed when its columns differ from the schema
+        its previous_tables entry holds, or when its sys.objects
+        modify_date is later than since, which any ALTER TABLE moves. The
+        returned snapshot_time is the server clock at the start of the scan
+        and is the since value to use on the next call.
+        """
 
-            for table in deduplicate_tables:
-                print(
-                    f"SELECT * FROM information_schema.columns WHERE table_name = '{table}'"
+        try:
+            with self.connect() as connection:
+                cursor = connection.cursor()
+
+                cursor.execute("SELECT GETDATE()")
+                snapshot_time = cursor.fetchone()[0]
+
+                params = [since]
+                cursor.execute(
+                    "SELECT s.name, o.name FROM sys.objects o "
+                    "JOIN sys.schemas s ON s.schema_id = o.schema_id "
+                    "WHERE o.type IN ('U', 'V') AND o.modify_date > %s"
+                    + self.table_filter.sql("o.name", "s.name", positional(params)),
+                    tuple(params)
                 )
-                try:
-                    table_cursor = connection.cursor()
-                    table_cursor.execute(
-                        f"SELECT * FROM information_schema.columns WHERE table_name = '{table}'"
-                    )
-                    row_list = []
-                    for row in list(table_cursor.fetchall()):
-                        row = list(row)
-                        print(row)
-                        row_type = convert_schema(row[7])
-                        row_list.append(
-                            {
-                                "key": row[3],
-                                "value": row_type,
-                                "origin_type": row[7],
-                                "existing": True,
-                                "schema": row[2],
-                            }
-                        )
-                    table_list.append(
-                        {"table": row[2], "schema": row_list,
-                            "mssql_schema": row[1]}
-                    )
-                except Exception as e:
-                    print(e)
-                    logger.error(traceback.format_exc())
-                    raise
-
-            return table_list
+                ddl_changed = {(row[0], row[1]) for row in cursor.fetchall()}
+
+                params = []
+                cursor.execute(self.catalog_sql(params), tuple(params))
+                current = group_tables(cursor)
+                table_list = changes.changed_tables(
+                    current, previous_tables, self.TABLE_KEY, ddl_changed,
+                    compare_columns=not self.table_filter.tables_only)
+                self.describe_tables(cursor, table_list, by_name=True)
+
+                return {"tables": table_list,
+                        "dropped": changes.dropped_tables(
+                            current, previous_tables, self.TABLE_KEY),
+                        "snapshot_time": snapshot_time.isoformat(sep=" ")}
 
         except Exception as e:
             logger.error(traceback.format_exc())
             raise
-
-        finally:
-            connection.close()
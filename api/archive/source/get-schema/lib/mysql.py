@@ -14,7 +14,13 @@ permissions and limitations under the License.
 """
 
 from contextlib import nullcontext
+from itertools import groupby
+from operator import itemgetter
 import pymysql
+import source_connector
+from lib import changes
+from lib import keys
+from lib.filters import NAME_BATCH_SIZE, TableFilter, positional
 import traceback
 import os
 import logging
@@ -44,64 +50,331 @@ def convert_schema(type):
         return "date"
     elif "enum" in type:
         return "string"
+    # Blobs take the large object path of the archive jobs; text columns
+    # are archived inline as strings.
+    elif "blob" in type or "binary" in type:
+        return "binary"
+    elif "text" in type:
+        return "string"
+
+
+# Key column types whose values can be split into ranges for parallel reads.
+NUMERIC_TYPES = ("tinyint", "smallint", "mediumint", "int", "bigint", "decimal")
+DATE_TYPES = ("date", "datetime", "timestamp")
+
+# Column types stored off-page that make rows expensive to extract.
+LOB_TYPES = ("tinyblob", "blob", "mediumblob", "longblob",
+             "tinytext", "text", "mediumtext", "longtext", "json")
+
+
+def group_tables(rows):
+    """Group catalog rows ordered by table into the table records the UI expects.
+
+    Rows without a COLUMN_NAME only name their table, which is how tables
+    are listed without their columns.
+    """
+
+    table_list = []
+    for table_name, columns in groupby(rows, key=itemgetter("TABLE_NAME")):
+        row_list = []
+        for row in columns:
+            if row["COLUMN_NAME"] is None:
+                continue
+            row_type = convert_schema(row["COLUMN_TYPE"])
+            row_list.append(
+                {"key": row["COLUMN_NAME"], "value": row_type,
+                 "origin_type": row["COLUMN_TYPE"], "existing": True})
+        table_list.append(
+            {"table": table_name, "schema": row_list})
+    return table_list
 
 
 class Connection:
 
-    def __init__(self, hostname, port, username, password, database):
+    # Fields that identify a table in previous_tables and dropped.
+    TABLE_KEY = ("table",)
+
+    def __init__(self, hostname, port, username, password, database, table_filter=None):
         self.hostname = hostname
         self.port = port
         self.username = username
         self.password = password
         self.database = database
+        self.table_filter = table_filter or TableFilter()
+
+    def connect(self):
+        return source_connector.connect("mysql", self.hostname, self.port,
+                                        self.username, self.password, self.database)
+
+    def catalog_sql(self, params, conditions=(), limit=None):
+        """Build the catalog query for the tables matching conditions and the table filter.
+
+        conditions are (sql, values) pairs on information_schema.TABLES
+        with {} where each value goes. Tables are optionally limited to the
+        first limit tables in name order, and joined to their columns
+        unless the filter asks for tables only.
+        """
+
+        bind = positional(params)
+        tables = ("SELECT TABLE_SCHEMA, TABLE_NAME FROM information_schema.TABLES "
+                  f"WHERE TABLE_SCHEMA = {bind(self.database)}")
+        for condition, values in conditions:
+            tables += " AND " + condition.format(*[bind(value) for value in values])
+        tables += self.table_filter.sql("TABLE_NAME", None, bind)
+        if limit is not None:
+            tables += f" ORDER BY TABLE_NAME LIMIT {bind(limit)}"
+
+        if self.table_filter.tables_only:
+            return ("SELECT p.TABLE_NAME, NULL AS COLUMN_NAME, NULL AS COLUMN_TYPE "
+                    f"FROM ({tables}) p ORDER BY p.TABLE_NAME")
+
+        return ("SELECT c.TABLE_NAME, c.COLUMN_NAME, c.COLUMN_TYPE "
+                f"FROM ({tables}) p "
+                "JOIN information_schema.COLUMNS c "
+                "ON c.TABLE_SCHEMA = p.TABLE_SCHEMA AND c.TABLE_NAME = p.TABLE_NAME "
+                "ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION")
+
+    def read_tables(self, sql, params, by_name=False):
+        """Run a catalog query over one connection and group the streamed rows."""
+
+        try:
+            with self.connect() as connection:
+                with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+                    cursor.execute(sql, params)
+                    table_list = group_tables(cursor)
+                    self.describe_tables(cursor, table_list, by_name)
+                    return table_list
+
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            raise
+
+    def describe_tables(self, cursor, table_list, by_name=False):
+        """Attach statistics, split keys and partitioning to the table records.
+
+        by_name limits the catalog queries to the tables in table_list, in
+        batches of NAME_BATCH_SIZE names, for pages and changes that hold
+        a few tables of a large catalog; otherwise each query reads every
+        table the filter matches once. Tables-only requests skip them all.
+        """
+
+        if self.table_filter.tables_only:
+            return
+
+        batches = ([table_list[start:start + NAME_BATCH_SIZE]
+                    for start in range(0, len(table_list), NAME_BATCH_SIZE)]
+                   if by_name else [table_list])
+        for batch in batches:
+            names = sorted({table["table"] for table in batch}) if by_name else None
+            self.add_statistics(cursor, batch, names)
+            self.add_split_keys(cursor, batch, names)
+            self.add_partitioning(cursor, batch, names)
+
+    def add_statistics(self, cursor, table_list, names=None):
+        """Attach size estimates and primary key columns to each table record.
+
+        Figures come from information_schema without scanning any table:
+        TABLE_ROWS is the storage engine's row estimate and DATA_LENGTH the
+        size of the data. Statistics are best effort and are left empty
+        when the catalog cannot be read.
+        """
+
+        try:
+            params = [LOB_TYPES, self.database]
+            cursor.execute(
+                "SELECT t.TABLE_NAME, t.TABLE_ROWS, t.DATA_LENGTH, "
+                "MAX(c.DATA_TYPE IN %s) AS HAS_LOB "
+                "FROM information_schema.TABLES t "
+                "JOIN information_schema.COLUMNS c "
+                "ON c.TABLE_SCHEMA = t.TABLE_SCHEMA AND c.TABLE_NAME = t.TABLE_NAME "
+                "WHERE t.TABLE_SCHEMA = %s"
+                + self.table_filter.sql("t.TABLE_NAME", None, positional(params), names)
+                + " GROUP BY t.TABLE_NAME, t.TABLE_ROWS, t.DATA_LENGTH",
+                params)
+            statistics = {row["TABLE_NAME"]: row for row in cursor.fetchall()}
+
+            params = [self.database]
+            cursor.execute(
+                "SELECT TABLE_NAME, COLUMN_NAME "
+                "FROM information_schema.KEY_COLUMN_USAGE "
+                "WHERE TABLE_SCHEMA = %s AND CONSTRAINT_NAME = 'PRIMARY'"
+                + self.table_filter.sql("TABLE_NAME", None, positional(params), names)
+                + " ORDER BY TABLE_NAME, ORDINAL_POSITION",
+                params)
+            primary_keys = {}
+            for row in cursor.fetchall():
+                primary_keys.setdefault(row["TABLE_NAME"], []).append(row["COLUMN_NAME"])
+
+        except Exception:
+            logger.warning(traceback.format_exc())
+            statistics, primary_keys = {}, {}
+
+        for table in table_list:
+            row = statistics.get(table["table"], {})
+            table["statistics"] = {
+                "estimated_rows": int(row["TABLE_ROWS"]) if row.get("TABLE_ROWS") is not None else None,
+                "data_bytes": int(row["DATA_LENGTH"]) if row.get("DATA_LENGTH") is not None else None,
+                "has_lob": bool(row.get("HAS_LOB")),
+                "primary_key": primary_keys.get(table["table"], []),
+            }
+
+    def add_split_keys(self, cursor, table_list, names=None):
+        """Attach the key each table's reads can be split on.
+
+        The key is the leading column of the primary key or of a unique
+        index, when it is numeric or a date. Its bounds are left to the
+        Glue job, which reads them at the source when it reads the table in
+        parallel, so discovery takes no per-table queries.
+        """
+
+        candidates = {}
+        try:
+            params = [self.database]
+            cursor.execute(
+                "SELECT s.TABLE_NAME, s.INDEX_NAME, MAX(s.SEQ_IN_INDEX) AS COLUMN_COUNT, "
+                "MAX(CASE WHEN s.SEQ_IN_INDEX = 1 THEN s.COLUMN_NAME END) AS COLUMN_NAME, "
+                "MAX(CASE WHEN s.SEQ_IN_INDEX = 1 THEN c.DATA_TYPE END) AS DATA_TYPE "
+                "FROM information_schema.STATISTICS s "
+                "JOIN information_schema.COLUMNS c "
+                "ON c.TABLE_SCHEMA = s.TABLE_SCHEMA AND c.TABLE_NAME = s.TABLE_NAME "
+                "AND c.COLUMN_NAME = s.COLUMN_NAME "
+                "WHERE s.TABLE_SCHEMA = %s AND s.NON_UNIQUE = 0"
+                + self.table_filter.sql("s.TABLE_NAME", None, positional(params), names)
+                + " GROUP BY s.TABLE_NAME, s.INDEX_NAME",
+                params)
+            for row in cursor.fetchall():
+                data_type = row["DATA_TYPE"]
+                kind = ("numeric" if data_type in NUMERIC_TYPES
+                        else "date" if data_type in DATE_TYPES else None)
+                candidates.setdefault(row["TABLE_NAME"], []).append(
+                    (row["INDEX_NAME"], row["INDEX_NAME"] == "PRIMARY",
+                     int(row["COLUMN_COUNT"]), row["COLUMN_NAME"], kind))
+
+        except Exception:
+            logger.warning(traceback.format_exc())
+
+        for table in table_list:
+            table["split_key"] = keys.choose_split_key(candidates.get(table["table"], []))
+
+    def add_partitioning(self, cursor, table_list, names=None):
+        """Attach the native partitioning of each partitioned table."""
+
+        partitioning = {}
+        try:
+            params = [self.database]
+            cursor.execute(
+                "SELECT TABLE_NAME, PARTITION_METHOD, PARTITION_EXPRESSION, "
+                "COUNT(*) AS PARTITION_COUNT "
+                "FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = %s AND PARTITION_NAME IS NOT NULL"
+                + self.table_filter.sql("TABLE_NAME", None, positional(params), names)
+                + " GROUP BY TABLE_NAME, PARTITION_METHOD, PARTITION_EXPRESSION",
+                params)
+            for row in cursor.fetchall():
+                partitioning[row["TABLE_NAME"]] = {
+                    "type": row["PARTITION_METHOD"],
+                    "key": (row["PARTITION_EXPRESSION"] or "").replace("`", ""),
+                    "count": int(row["PARTITION_COUNT"]),
+                }
+
+        except Exception:
+            logger.warning(traceback.format_exc())
+
+        for table in table_list:
+            table["partitioning"] = partitioning.get(table["table"])
+
+    def get_catalog_fingerprint(self):
+        """Return a cheap summary of the catalog that changes when its DDL does.
+
+        Every column's name, position, type and nullability and every
+        unique index column are hashed with CRC32 and summed, so adding,
+        dropping, renaming or retyping a column or key changes the sum,
+        while inserts and updates, which move UPDATE_TIME, do not.
+        Statistics of a cached schema can so be as old as the cache TTL.
+        """
+
+        with self.connect() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*), SUM(CRC32(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME, "
+                    "ORDINAL_POSITION, COLUMN_TYPE, IS_NULLABLE))), "
+                    "(SELECT SUM(CRC32(CONCAT_WS('|', TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX, "
+                    "COLUMN_NAME))) FROM information_schema.STATISTICS "
+                    "WHERE TABLE_SCHEMA = %s AND NON_UNIQUE = 0) "
+                    "FROM information_schema.COLUMNS "
+                    "WHERE TABLE_SCHEMA = %s",
+                    (self.database, self.database))
+                return [str(value) for value in cursor.fetchone()]
 
     def get_schema(self):
+        """Read the column catalog of the database in one streamed query.
+
+        Columns are read from information_schema.COLUMNS over a single
+        connection with an unbuffered cursor and grouped by table, so the
+        cost no longer grows with one round trip per table.
+        """
+
+        params = []
+        sql = self.catalog_sql(params)
+        return self.read_tables(sql, params)
+
+    def get_schema_page(self, page_size, after=None):
+        """Read up to page_size tables that sort after the (schema, table) key.
+
+        Returns the tables and the key of the last one, or None as the key
+        when the catalog has been read to the end.
+        """
 
-        table_list = []
+        params = []
+        conditions = [("TABLE_NAME > {}", [after[1]])] if after else []
+        sql = self.catalog_sql(params, conditions, limit=page_size)
+
+        table_list = self.read_tables(sql, params, by_name=True)
+
+        if len(table_list) < page_size:
+            return table_list, None
+        return table_list, [self.database, table_list[-1]["table"]]
+
+    def get_schema_changes(self, since, previous_tables):
+        """Return tables changed after since, and tables dropped from previous_tables.
+
+        A table counts as changed when its columns differ from the schema
+        its previous_tables entry holds, or when its CREATE_TIME or
+        UPDATE_TIME is later than since. The timestamps alone miss INSTANT
+        ALTERs and can lag by information_schema_stats_expiry, so entries
+        sent without their schema may miss column changes; UPDATE_TIME
+        also reports tables that only received writes. The returned
+        snapshot_time is the server clock at the start of the scan and is
+        the since value to use on the next call.
+        """
 
         try:
-            connection = pymysql.connect(
-                host=self.hostname,
-                user=self.username,
-                password=self.password,
-                database=self.database,
-                charset="utf8mb4",
-                cursorclass=pymysql.cursors.DictCursor)
-
-            cursor = connection.cursor()
-            cursor.execute("SHOW TABLES")
-            tables = cursor.fetchall()
-
-            for table in tables:
-                table_connection = pymysql.connect(
-                    host=self.hostname,
-                    user=self.username,
-                    password=self.password,
-                    database=self.database,
-                    charset="utf8mb4",
-                    cursorclass=pymysql.cursors.DictCursor)
-                try:
-                    table_cursor = table_connection.cursor()
-                    table_cursor.execute(
-                        f"DESCRIBE {self.database}.{list(table.values())[0]}")
-                    row_list = []
-                    for row in table_cursor.fetchall():
-                        row_type = convert_schema(row["Type"])
-                        row_list.append(
-                            {"key": row["Field"], "value": row_type, "existing": True})
-                    table_list.append(
-                        {"table": list(table.values())[0], "schema": row_list})
-                except Exception as e:
-                    logger.error(traceback.format_exc())
-                    raise
-                finally:
-                    table_connection.close()
-
-            return table_list
+            with self.connect() as connection:
+                with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+                    cursor.execute("SELECT NOW() AS SNAPSHOT_TIME")
+                    snapshot_time = cursor.fetchall()[0]["SNAPSHOT_TIME"]
+
+                    params = [self.database, since, since]
+                    cursor.execute(
+                        "SELECT TABLE_NAME FROM information_schema.TABLES "
+                        "WHERE TABLE_SCHEMA = %s AND (CREATE_TIME > %s OR UPDATE_TIME > %s)"
+                        + self.table_filter.sql("TABLE_NAME", None, positional(params)),
+                        params)
+                    ddl_changed = {(row["TABLE_NAME"],) for row in cursor.fetchall()}
+
+                    params = []
+                    cursor.execute(self.catalog_sql(params), params)
+                    current = group_tables(cursor)
+                    table_list = changes.changed_tables(
+                        current, previous_tables, self.TABLE_KEY, ddl_changed,
+                        compare_columns=not self.table_filter.tables_only)
+                    self.describe_tables(cursor, table_list, by_name=True)
+
+                    return {"tables": table_list,
+                            "dropped": changes.dropped_tables(
+                                current, previous_tables, self.TABLE_KEY),
+                            "snapshot_time": snapshot_time.isoformat(sep=" ")}
 
         except Exception as e:
             logger.error(traceback.format_exc())
             raise
-        finally:
-            cursor.close()
-            connection.close()
@@ -13,15 +13,33 @@ express or implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
+from itertools import groupby
+from operator import itemgetter
+import logging
+import os
+import traceback
 import oracledb
+import source_connector
+from lib import changes
+from lib import keys
+from lib.filters import NAME_BATCH_SIZE, TableFilter, named
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+logger = logging.getLogger()
 
-def create_dsn(hostname: str, port: str, service: str) -> str:
-    """Create an Oracle DSN that works across versions using service name."""
-    return oracledb.makedsn(hostname, port, service_name=service)
+if logger.hasHandlers():
+    logger.setLevel(LOG_LEVEL)
+else:
+    logging.basicConfig(level=LOG_LEVEL)
 
-def convert_schema(column_type: str) -> str:
-    """Map Oracle data types to Glue types."""
+
+def convert_schema(column_type: str, precision=None, scale=None) -> str:
+    """Map Oracle data types to Glue types.
+
+    NUMBER columns keep their precision and scale. NUMBER without a
+    precision can hold any value and is mapped to decimal(38,10), which is
+    how Spark reads it over JDBC.
+    """
 
     t = column_type.upper()
 
@@ -34,56 +52,361 @@ def convert_schema(column_type: str) -> str:
     elif "INT" in t or "INTEGER" in t:
         return "int"
     elif "NUMBER" in t or "DEC" in t:
-        return "decimal"
+        if precision is not None:
+            return f"decimal({int(precision)},{int(scale or 0)})"
+        return "decimal(38,0)" if scale == 0 else "decimal(38,10)"
     elif "TIMESTAMP" in t or "DATE" in t:
         return "timestamp"
     else:
         return "string"
 
 
+# Rows are pulled from the server in large batches so that a catalog with
+# tens of thousands of columns is read in a handful of round trips.
+CATALOG_ARRAYSIZE = 5000
+
+# Key column types whose values can be split into ranges for parallel reads.
+NUMERIC_TYPES = ("NUMBER", "FLOAT", "BINARY_FLOAT", "BINARY_DOUBLE")
+
+
+def group_tables(rows):
+    """Group catalog rows ordered by (owner, table) into table records.
+
+    Rows without a column name stand for a table read without its columns.
+    """
+
+    table_list = []
+    for (owner, table), columns in groupby(rows, key=itemgetter(0, 1)):
+        row_list = []
+        for row in columns:
+            if row[2] is None:
+                continue
+            row_type = convert_schema(row[3], row[4], row[5])
+            row_list.append(
+                {"key": row[2], "value": row_type, "origin_type": row[3], "existing": True})
+        table_list.append(
+            {"table": table, "schema": row_list, "oracle_owner": owner})
+    return table_list
+
+
 class Connection:
-    def __init__(self, hostname, port, username, password, database, oracle_owner):
+    # Fields that identify a table in previous_tables and dropped.
+    TABLE_KEY = ("oracle_owner", "table")
+
+    def __init__(self, hostname, port, username, password, database, oracle_owner,
+                 table_filter=None):
         self.hostname = hostname
         self.port = port
         self.username = username
         self.password = password
         self.database = database
         self.oracle_owner = oracle_owner
+        self.table_filter = table_filter or TableFilter()
 
-    def get_schema(self):
-        
-        table_list = []
-        
+    def owners(self):
+        """Return the requested owners from the comma-separated oracle_owner.
+
+        When the table filter lists schemas, only the owners among them are kept.
+        """
+        owners = [owner.strip() for owner in self.oracle_owner.split(",") if owner.strip()]
+        if self.table_filter.schemas:
+            owners = [owner for owner in owners if owner in self.table_filter.schemas]
+        return owners
+
+    def owner_binds(self):
+        """Return bind values and the matching IN (...) placeholder list for the owners."""
+        binds = {f"owner{i}": owner for i, owner in enumerate(self.owners())}
+        return binds, ", ".join(f":{name}" for name in binds)
+
+    def connect(self):
+        return source_connector.connect("oracle", self.hostname, self.port,
+                                        self.username, self.password, self.database)
+
+    def catalog_sql(self, binds, placeholders, conditions="", limit=None):
+        """Build the catalog query for the tables matching conditions and the table filter.
+
+        conditions are AND-prefixed SQL on ALL_TABLES t whose bind values
+        are already in binds. Tables are optionally limited to the first
+        limit tables in (owner, table) order, and joined to their columns
+        unless the filter asks for tables only.
+        """
+
+        tables = (f"SELECT t.OWNER, t.TABLE_NAME FROM ALL_TABLES t "
+                  f"WHERE t.OWNER IN ({placeholders}) {conditions}"
+                  + self.table_filter.sql("t.TABLE_NAME", None, named(binds)))
+        if limit is not None:
+            binds["page_size"] = limit
+            tables = (f"SELECT OWNER, TABLE_NAME FROM ({tables} ORDER BY t.OWNER, t.TABLE_NAME) "
+                      "WHERE ROWNUM <= :page_size")
+
+        if self.table_filter.tables_only:
+            return ("SELECT p.OWNER, p.TABLE_NAME, NULL, NULL, NULL, NULL "
+                    f"FROM ({tables}) p ORDER BY p.OWNER, p.TABLE_NAME")
+
+        return f"""SELECT c.OWNER, c.TABLE_NAME, c.COLUMN_NAME, c.DATA_TYPE,
+                          c.DATA_PRECISION, c.DATA_SCALE
+                   FROM ALL_TAB_COLUMNS c
+                   JOIN ({tables}) p ON p.OWNER = c.OWNER AND p.TABLE_NAME = c.TABLE_NAME
+                   ORDER BY c.OWNER, c.TABLE_NAME, c.COLUMN_ID"""
+
+    def read_tables(self, sql, binds, by_name=False):
+        """Run a catalog query over one connection and group the fetched rows."""
+
+        with self.connect() as connection:
+            with connection.cursor() as cursor:
+                cursor.arraysize = CATALOG_ARRAYSIZE
+                cursor.prefetchrows = CATALOG_ARRAYSIZE + 1
+                cursor.execute(sql, binds)
+                table_list = group_tables(cursor)
+                self.describe_tables(cursor, table_list, by_name)
+                return table_list
+
+    def describe_tables(self, cursor, table_list, by_name=False):
+        """Attach statistics, split keys and partitioning to the table records.
+
+        by_name limits the catalog queries to the tables in table_list, in
+        batches of NAME_BATCH_SIZE names, for pages and changes that hold
+        a few tables of a large catalog; otherwise each query reads every
+        table the filter matches once. Tables-only requests skip them all.
+        """
+
+        if self.table_filter.tables_only:
+            return
+
+        batches = ([table_list[start:start + NAME_BATCH_SIZE]
+                    for start in range(0, len(table_list), NAME_BATCH_SIZE)]
+                   if by_name else [table_list])
+        for batch in batches:
+            names = sorted({table["table"] for table in batch}) if by_name else None
+            self.add_statistics(cursor, batch, names)
+            self.add_split_keys(cursor, batch, names)
+            self.add_partitioning(cursor, batch, names)
+
+    def add_statistics(self, cursor, table_list, names=None):
+        """Attach size estimates and primary key columns to each table record.
+
+        NUM_ROWS, AVG_ROW_LEN and BLOCKS in ALL_TABLES are the optimizer
+        statistics from the last DBMS_STATS run, so no table is scanned.
+        Data bytes fall back to BLOCKS at an 8 KB block size when the
+        average row length has not been gathered. Statistics are best
+        effort and are left empty when the catalog cannot be read.
+        """
+
+        binds, placeholders = self.owner_binds()
+        # oracledb rejects bind values without a placeholder, so each query
+        # gets its own copy for the filter values.
+        statistics_binds, key_binds = dict(binds), dict(binds)
+        try:
+            cursor.execute(
+                f"""SELECT t.OWNER, t.TABLE_NAME, t.NUM_ROWS,
+                           NVL(t.NUM_ROWS * t.AVG_ROW_LEN, t.BLOCKS * 8192),
+                           (SELECT COUNT(*) FROM ALL_TAB_COLUMNS c
+                             WHERE c.OWNER = t.OWNER AND c.TABLE_NAME = t.TABLE_NAME
+                               AND c.DATA_TYPE IN ('BLOB', 'CLOB', 'NCLOB', 'BFILE',
+                                                   'LONG', 'LONG RAW', 'XMLTYPE'))
+                    FROM ALL_TABLES t
+                    WHERE t.OWNER IN ({placeholders})"""
+                + self.table_filter.sql("t.TABLE_NAME", None, named(statistics_binds), names),
+                statistics_binds)
+            statistics = {(row[0], row[1]): row for row in cursor}
+
+            cursor.execute(
+                f"""SELECT cc.OWNER, cc.TABLE_NAME, cc.COLUMN_NAME
+                    FROM ALL_CONSTRAINTS k
+                    JOIN ALL_CONS_COLUMNS cc
+                      ON cc.OWNER = k.OWNER AND cc.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+                    WHERE k.OWNER IN ({placeholders}) AND k.CONSTRAINT_TYPE = 'P'"""
+                + self.table_filter.sql("cc.TABLE_NAME", None, named(key_binds), names)
+                + " ORDER BY cc.OWNER, cc.TABLE_NAME, cc.POSITION",
+                key_binds)
+            primary_keys = {}
+            for row in cursor:
+                primary_keys.setdefault((row[0], row[1]), []).append(row[2])
+
+        except oracledb.DatabaseError:
+            logger.warning(traceback.format_exc())
+            statistics, primary_keys = {}, {}
+
+        for table in table_list:
+            key = (table["oracle_owner"], table["table"])
+            row = statistics.get(key)
+            table["statistics"] = {
+                "estimated_rows": int(row[2]) if row and row[2] is not None else None,
+                "data_bytes": int(row[3]) if row and row[3] is not None else None,
+                "has_lob": bool(row[4]) if row else False,
+                "primary_key": primary_keys.get(key, []),
+            }
+
+    def add_split_keys(self, cursor, table_list, names=None):
+        """Attach the key each table's reads can be split on.
+
+        The key is the leading column of the primary key or of a unique
+        index, when it is numeric or a date. Its bounds are left to the
+        Glue job, which reads them at the source when it reads the table in
+        parallel, so discovery takes no per-table queries.
+        """
+
+        binds, placeholders = self.owner_binds()
+        candidates = {}
+        try:
+            cursor.execute(
+                f"""SELECT i.TABLE_OWNER, i.TABLE_NAME, i.INDEX_NAME,
+                           CASE WHEN k.CONSTRAINT_NAME IS NULL THEN 0 ELSE 1 END,
+                           (SELECT COUNT(*) FROM ALL_IND_COLUMNS x
+                             WHERE x.INDEX_OWNER = i.OWNER AND x.INDEX_NAME = i.INDEX_NAME),
+                           ic.COLUMN_NAME, c.DATA_TYPE
+                    FROM ALL_INDEXES i
+                    JOIN ALL_IND_COLUMNS ic
+                      ON ic.INDEX_OWNER = i.OWNER AND ic.INDEX_NAME = i.INDEX_NAME
+                     AND ic.COLUMN_POSITION = 1
+                    JOIN ALL_TAB_COLUMNS c
+                      ON c.OWNER = i.TABLE_OWNER AND c.TABLE_NAME = i.TABLE_NAME
+                     AND c.COLUMN_NAME = ic.COLUMN_NAME
+                    LEFT JOIN ALL_CONSTRAINTS k
+                      ON k.INDEX_OWNER = i.OWNER AND k.INDEX_NAME = i.INDEX_NAME
+                     AND k.CONSTRAINT_TYPE = 'P'
+                    WHERE i.TABLE_OWNER IN ({placeholders}) AND i.UNIQUENESS = 'UNIQUE'"""
+                + self.table_filter.sql("i.TABLE_NAME", None, named(binds), names),
+                binds)
+            for row in cursor:
+                data_type = row[6] or ""
+                kind = ("numeric" if data_type in NUMERIC_TYPES
+                        else "date" if data_type == "DATE" or data_type.startswith("TIMESTAMP")
+                        else None)
+                candidates.setdefault((row[0], row[1]), []).append(
+                    (row[2], bool(row[3]), int(row[4]), row[5], kind))
+
+        except oracledb.DatabaseError:
+            logger.warning(traceback.format_exc())
+
+        for table in table_list:
+            key = (table["oracle_owner"], table["table"])
+            table["split_key"] = keys.choose_split_key(candidates.get(key, []))
+
+    def add_partitioning(self, cursor, table_list, names=None):
+        """Attach the partitioning type, leading key column and partition count."""
+
+        binds, placeholders = self.owner_binds()
+        partitioning = {}
         try:
+            cursor.execute(
+                f"""SELECT p.OWNER, p.TABLE_NAME, p.PARTITIONING_TYPE, k.COLUMN_NAME,
+                           (SELECT COUNT(*) FROM ALL_TAB_PARTITIONS tp
+                             WHERE tp.TABLE_OWNER = p.OWNER AND tp.TABLE_NAME = p.TABLE_NAME)
+                    FROM ALL_PART_TABLES p
+                    LEFT JOIN ALL_PART_KEY_COLUMNS k
+                      ON k.OWNER = p.OWNER AND k.NAME = p.TABLE_NAME
+                     AND k.OBJECT_TYPE = 'TABLE' AND k.COLUMN_POSITION = 1
+                    WHERE p.OWNER IN ({placeholders})"""
+                + self.table_filter.sql("p.TABLE_NAME", None, named(binds), names),
+                binds)
+            for row in cursor:
+                partitioning[(row[0], row[1])] = {
+                    "type": row[2], "key": row[3], "count": int(row[4])}
+
+        except oracledb.DatabaseError:
+            logger.warning(traceback.format_exc())
+
+        for table in table_list:
+            table["partitioning"] = partitioning.get((table["oracle_owner"], table["table"]))
+
+    def get_catalog_fingerprint(self):
+        """Return a cheap summary of the catalog that changes when its tables do.
+
+        Any DDL moves LAST_DDL_TIME in ALL_OBJECTS, and drops or creates
+        move the table count.
+        """
+
+        binds, placeholders = self.owner_binds()
+        if not binds:
+            return []
+
+        with self.connect() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""SELECT COUNT(*), MAX(LAST_DDL_TIME) FROM ALL_OBJECTS
+                        WHERE OWNER IN ({placeholders}) AND OBJECT_TYPE = 'TABLE'""",
+                    binds)
+                return [str(value) for value in cursor.fetchone()]
+
+    def get_schema(self):
+        """Read the column catalog of every requested owner in one query.
+
+        ALL_TAB_COLUMNS is queried once with OWNER IN (...) over a single
+        connection and grouped by (owner, table). Each table is tagged with
+        its oracle_owner.
+        """
+
+        binds, placeholders = self.owner_binds()
+        if not binds:
+            return []
+
+        return self.read_tables(self.catalog_sql(binds, placeholders), binds)
+
+    def get_schema_page(self, page_size, after=None):
+        """Read up to page_size tables that sort after the (owner, table) key.
+
+        Returns the tables and the key of the last one, or None as the key
+        when the catalog has been read to the end.
+        """
+
+        binds, placeholders = self.owner_binds()
+        if not binds:
+            return [], None
+
+        keyset = ""
+        if after:
+            keyset = """AND (t.OWNER > :after_owner
+                             OR (t.OWNER = :after_owner AND t.TABLE_NAME > :after_table))"""
+            binds["after_owner"] = after[0]
+            binds["after_table"] = after[1]
+
+        table_list = self.read_tables(
+            self.catalog_sql(binds, placeholders, keyset, limit=page_size), binds, by_name=True)
+
+        if len(table_list) < page_size:
+            return table_list, None
+        last = table_list[-1]
+        return table_list, [last["oracle_owner"], last["table"]]
+
+    def get_schema_changes(self, since, previous_tables):
+        """Return tables changed after since, and tables dropped from previous_tables.
+
+        A table counts as changed when its columns differ from the schema
+        its previous_tables entry holds, or when its LAST_DDL_TIME in
+        ALL_OBJECTS is later than since. The returned snapshot_time is the
+        server clock at the start of the scan and is the since value to use
+        on the next call.
+        """
+
+        binds, placeholders = self.owner_binds()
+        if not binds:
+            return {"tables": [], "dropped": [], "snapshot_time": None}
+
+        with self.connect() as connection:
+            with connection.cursor() as cursor:
+                cursor.arraysize = CATALOG_ARRAYSIZE
+                cursor.prefetchrows = CATALOG_ARRAYSIZE + 1
+
+                cursor.execute("SELECT SYSDATE FROM dual")
+                snapshot_time = cursor.fetchone()[0]
+
+                changed_binds = dict(binds, since=since)
+                cursor.execute(
+                    f"""SELECT OWNER, OBJECT_NAME FROM ALL_OBJECTS
+                        WHERE OWNER IN ({placeholders}) AND OBJECT_TYPE = 'TABLE'
+                          AND LAST_DDL_TIME > :since"""
+                    + self.table_filter.sql("OBJECT_NAME", None, named(changed_binds)),
+                    changed_binds)
+                ddl_changed = {(row[0], row[1]) for row in cursor}
+
+                cursor.execute(self.catalog_sql(binds, placeholders), binds)
+                current = group_tables(cursor)
+                table_list = changes.changed_tables(
+                    current, previous_tables, self.TABLE_KEY, ddl_changed,
+                    compare_columns=not self.table_filter.tables_only)
+                self.describe_tables(cursor, table_list, by_name=True)
 
-            oracle_tables = []
-            dsn = create_dsn(self.hostname, self.port, self.database)
-            with oracledb.connect(user=self.username, password=self.password, dsn=dsn) as connection:
-                with connection.cursor() as cursor:
-                    sql = f"""SELECT owner, table_name  FROM all_tables WHERE OWNER = '{self.oracle_owner}'"""
-                    for r in cursor.execute(sql):
-                        oracle_tables.append(r[1])
-            
-            for table in oracle_tables:
-                row_list = []
-                cnn = oracledb.connect(user=self.username, password=self.password,
-                                    dsn=dsn)
-                cursor = cnn.cursor()
-                
-                cursor.execute("SELECT COLUMN_NAME, DATA_TYPE FROM ALL_TAB_COLUMNS WHERE TABLE_NAME=\'" + table + "\'and OWNER=\'" + self.oracle_owner + "\'")
-                schema_list = cursor.fetchall()
-                print(table)
-                for schema in schema_list:
-                    row_type = convert_schema(schema[1])
-                    print(schema[1])
-                    row_list.append(
-                        {"key": schema[0], "value": row_type, "existing": True})
-
-                cursor.close()
-                table_list.append(
-                    {"table": table, "schema": row_list})
-                print(table_list)
-            return table_list
-
-        except Exception:
-            return False
+        return {"tables": table_list,
+                "dropped": changes.dropped_tables(current, previous_tables, self.TABLE_KEY),
+                "snapshot_time": snapshot_time.isoformat(sep=" ")}
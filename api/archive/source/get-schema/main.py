@@ -13,10 +13,14 @@ express or implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
+import base64
+import datetime
 import json
 import logging
 import os
 import traceback
+from lib import cache
+from lib import filters
 from lib import mysql
 from lib import mssql
 from lib import oracle
@@ -34,6 +38,17 @@ else:
 
 # endregion
 
+# Upper bound on the number of tables returned by one paginated request, which
+# keeps a page well below the Lambda response size limit.
+MAX_PAGE_SIZE = 500
+
+# Discovered schemas are kept for the life of the warm container and reused
+# while the source catalog fingerprint is unchanged.
+schema_cache = cache.SchemaCache(
+    ttl_seconds=int(os.getenv("SCHEMA_CACHE_TTL_SECONDS", "900")),
+    max_entries=int(os.getenv("SCHEMA_CACHE_MAX_ENTRIES", "32")),
+)
+
 def mask_sensitive_data(event):
     # remove sensitive data from request object before logging
     keys_to_redact = ["authorization"]
@@ -58,6 +73,91 @@ def build_response(http_code, body):
     }
 
 
+class BadRequest(Exception):
+    """A request parameter is invalid; the message is returned with a 400."""
+
+
+def encode_token(key):
+    """Encode the last (schema, table) of a page as an opaque continuation token."""
+    if key is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_token(token):
+    """Decode a continuation token back into the (schema, table) it encodes."""
+    if not token:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (AttributeError, UnicodeError, ValueError):
+        raise BadRequest("Invalid continuation_token")
+    if not isinstance(key, list) or len(key) != 2 or not all(
+            isinstance(part, str) for part in key):
+        raise BadRequest("Invalid continuation_token")
+    return key
+
+
+def page_size(body):
+    """Return the requested page size, capped at MAX_PAGE_SIZE."""
+    value = body["page_size"]
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise BadRequest(f"Invalid page_size: {value}")
+    return min(value, MAX_PAGE_SIZE)
+
+
+def previous_tables(connection, body):
+    """Return the previous_tables of a changes request, each with the fields that name its table."""
+    tables = body.get("previous_tables", [])
+    if not isinstance(tables, list) or not all(
+            isinstance(table, dict) and all(field in table for field in connection.TABLE_KEY)
+            for table in tables):
+        raise BadRequest("Invalid previous_tables: every entry needs "
+                         + ", ".join(connection.TABLE_KEY))
+    return tables
+
+
+def get_cached_schema(connection, cache_key):
+    """Return the full schema, reusing the cached copy while the catalog is unchanged."""
+    fingerprint = connection.get_catalog_fingerprint()
+    tables = schema_cache.get(cache_key, fingerprint)
+    if tables is None:
+        tables = connection.get_schema()
+        schema_cache.put(cache_key, fingerprint, tables)
+    else:
+        logger.info("Schema cache hit")
+    return tables
+
+
+def discover(connection, body, cache_key):
+    """Discover the whole catalog, one page of it, or only what changed.
+
+    Paginated requests return tables in catalog order together with a
+    continuation_token to pass back for the next page; the token is null
+    once the last page has been returned.
+
+    Requests with changed_since return only the tables whose columns
+    differ from their previous_tables entry or whose DDL changed after
+    that timestamp, the entries of previous_tables that no longer exist,
+    and the snapshot_time to send as changed_since next time.
+
+    Invalid parameters raise BadRequest.
+    """
+    if "changed_since" in body:
+        try:
+            since = datetime.datetime.fromisoformat(body["changed_since"])
+        except (TypeError, ValueError):
+            raise BadRequest(f'Invalid changed_since: {body["changed_since"]}')
+        return connection.get_schema_changes(since, previous_tables(connection, body))
+
+    if "page_size" not in body:
+        return {"tables": get_cached_schema(connection, cache_key)}
+
+    after = decode_token(body.get("continuation_token"))
+    tables, last_key = connection.get_schema_page(page_size(body), after)
+    return {"tables": tables, "continuation_token": encode_token(last_key)}
+
+
 def lambda_handler(event, context):
     logger.info(mask_sensitive_data(event))
     body = json.loads(event["body"]) if "body" in event else json.loads(event)
@@ -68,27 +168,26 @@ def lambda_handler(event, context):
     password = body["password"]
     database = body["database"]
     database_engine = body["database_engine"]
+    table_filter = filters.TableFilter.from_body(body)
+    cache_key = (database_engine, hostname, str(port), database,
+                 username, body.get("oracle_owner", ""), table_filter.key())
     
     if database_engine == "oracle":
         oracle_owner = body["oracle_owner"]
-        oracle_owner_list = oracle_owner.split(",")
-        
+
         try:
-            tables = []
-            for owner in oracle_owner_list:
-                oracle_connection = oracle.Connection(hostname,
-                                                    port,
-                                                    username,
-                                                    password,
-                                                    database,
-                                                    owner)
-                tables_connection = oracle_connection.get_schema()
-                for table in tables_connection:
-                    table["oracle_owner"] = owner
-                    tables.append(table) 
-            response = {"tables": tables}
+            oracle_connection = oracle.Connection(hostname,
+                                                port,
+                                                username,
+                                                password,
+                                                database,
+                                                oracle_owner,
+                                                table_filter)
+            response = discover(oracle_connection, body, cache_key)
             return build_response(200, json.dumps(response))
-        
+
+        except BadRequest as ex:
+            return build_response(400, json.dumps({"error": str(ex)}))
         except Exception as ex:
             logger.error(traceback.format_exc())
             return build_response(500, "Server Error")
@@ -98,12 +197,14 @@ def lambda_handler(event, context):
                                     port,
                                     username,
                                     password,
-                                    database,)
+                                    database,
+                                    table_filter)
         
         try:
-            tables = connection.get_schema()
-            response = {"tables": tables}
+            response = discover(connection, body, cache_key)
             return build_response(200, json.dumps(response))
+        except BadRequest as ex:
+            return build_response(400, json.dumps({"error": str(ex)}))
         except Exception as ex:
             logger.error(traceback.format_exc())
             return build_response(500, "Server Error")
@@ -113,12 +214,14 @@ def lambda_handler(event, context):
                                     port,
                                     username,
                                     password,
-                                    database,)
+                                    database,
+                                    table_filter)
         
         try:
-            tables = connection.get_schema()
-            response = {"tables": tables}
+            response = discover(connection, body, cache_key)
             return build_response(200, json.dumps(response))
+        except BadRequest as ex:
+            return build_response(400, json.dumps({"error": str(ex)}))
         except Exception as ex:
             logger.error(traceback.format_exc())
             return build_response(500, "Server Error")
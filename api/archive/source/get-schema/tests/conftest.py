@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The function's modules import each other as its deployment package lays
+# them out, with the function directory on the path.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,59 @@
+from lib import cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(monkeypatch, ttl_seconds=60, max_entries=2):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return cache.SchemaCache(ttl_seconds=ttl_seconds, max_entries=max_entries), clock
+
+
+def test_hit_with_same_fingerprint(monkeypatch):
+    schema_cache, _ = make_cache(monkeypatch)
+    schema_cache.put("source", ["1"], [{"table": "orders"}])
+    assert schema_cache.get("source", ["1"]) == [{"table": "orders"}]
+
+
+def test_miss_on_unknown_key(monkeypatch):
+    schema_cache, _ = make_cache(monkeypatch)
+    assert schema_cache.get("source", ["1"]) is None
+
+
+def test_changed_fingerprint_evicts_entry(monkeypatch):
+    schema_cache, _ = make_cache(monkeypatch)
+    schema_cache.put("source", ["1"], [])
+    assert schema_cache.get("source", ["2"]) is None
+    assert "source" not in schema_cache.entries
+
+
+def test_entry_expires_after_ttl(monkeypatch):
+    schema_cache, clock = make_cache(monkeypatch, ttl_seconds=60)
+    schema_cache.put("source", ["1"], [])
+    clock.now = 60
+    assert schema_cache.get("source", ["1"]) == []
+    clock.now = 61
+    assert schema_cache.get("source", ["1"]) is None
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    schema_cache, _ = make_cache(monkeypatch, max_entries=2)
+    schema_cache.put("a", ["1"], "a")
+    schema_cache.put("b", ["1"], "b")
+    assert schema_cache.get("a", ["1"]) == "a"
+    schema_cache.put("c", ["1"], "c")
+    assert schema_cache.get("b", ["1"]) is None
+    assert schema_cache.get("a", ["1"]) == "a"
+    assert schema_cache.get("c", ["1"]) == "c"
+
+
+def test_zero_entries_disables_cache(monkeypatch):
+    schema_cache, _ = make_cache(monkeypatch, max_entries=0)
+    schema_cache.put("source", ["1"], [])
+    assert schema_cache.get("source", ["1"]) is None
@@ -0,0 +1,51 @@
+from lib import changes
+
+FIELDS = ("mssql_schema", "table")
+
+
+def table(name, columns, schema="dbo"):
+    return {"table": name, "mssql_schema": schema,
+            "schema": [{"key": key, "value": value} for key, value in columns]}
+
+
+def test_unchanged_table_is_left_out():
+    current = [table("orders", [("id", "int")])]
+    previous = [table("orders", [("id", "int")])]
+    assert changes.changed_tables(current, previous, FIELDS, set()) == []
+
+
+def test_new_table_is_changed():
+    current = [table("orders", [("id", "int")])]
+    assert changes.changed_tables(current, [], FIELDS, set()) == current
+
+
+def test_column_change_without_ddl_timestamp_is_changed():
+    current = [table("orders", [("id", "int"), ("note", "string")])]
+    previous = [table("orders", [("id", "int")])]
+    assert changes.changed_tables(current, previous, FIELDS, set()) == current
+
+
+def test_retyped_column_is_changed():
+    current = [table("orders", [("id", "long")])]
+    previous = [table("orders", [("id", "int")])]
+    assert changes.changed_tables(current, previous, FIELDS, set()) == current
+
+
+def test_entry_without_schema_falls_back_to_timestamps():
+    current = [table("orders", [("id", "int")]), table("lines", [("id", "int")])]
+    previous = [{"table": "orders", "mssql_schema": "dbo"},
+                {"table": "lines", "mssql_schema": "dbo"}]
+    assert changes.changed_tables(current, previous, FIELDS, {("dbo", "lines")}) == [current[1]]
+
+
+def test_tables_only_ignores_columns():
+    current = [table("orders", [])]
+    previous = [table("orders", [("id", "int")])]
+    assert changes.changed_tables(current, previous, FIELDS, set(), compare_columns=False) == []
+
+
+def test_dropped_tables_keep_their_key_fields():
+    current = [table("orders", [])]
+    previous = [table("orders", []), table("orders", [], schema="old")]
+    assert changes.dropped_tables(current, previous, FIELDS) == [
+        {"mssql_schema": "old", "table": "orders"}]
@@ -0,0 +1,37 @@
+from lib import keys
+
+
+def test_no_candidates():
+    assert keys.choose_split_key([]) is None
+
+
+def test_candidates_without_splittable_column():
+    assert keys.choose_split_key([("PRIMARY", True, 1, "code", None)]) is None
+
+
+def test_primary_key_wins_over_narrower_unique_index():
+    split_key = keys.choose_split_key([
+        ("uq_number", False, 1, "number", "numeric"),
+        ("PRIMARY", True, 2, "id", "numeric"),
+    ])
+    assert split_key == {"column": "id", "type": "numeric", "index": "PRIMARY",
+                         "lower": None, "upper": None}
+
+
+def test_fewest_columns_then_name_among_unique_indexes():
+    split_key = keys.choose_split_key([
+        ("uq_b", False, 1, "b", "date"),
+        ("uq_wide", False, 3, "w", "numeric"),
+        ("uq_a", False, 1, "a", "numeric"),
+    ])
+    assert split_key["index"] == "uq_a"
+    assert split_key["column"] == "a"
+
+
+def test_unsplittable_primary_key_falls_back_to_unique_index():
+    split_key = keys.choose_split_key([
+        ("PRIMARY", True, 1, "code", None),
+        ("uq_created", False, 1, "created", "date"),
+    ])
+    assert split_key["column"] == "created"
+    assert split_key["type"] == "date"
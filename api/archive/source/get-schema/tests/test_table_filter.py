@@ -0,0 +1,46 @@
+from lib.filters import TableFilter, named, positional
+
+
+def test_empty_filter_adds_nothing():
+    params = []
+    assert TableFilter().sql("TABLE_NAME", "TABLE_SCHEMA", positional(params)) == ""
+    assert params == []
+
+
+def test_include_exclude_and_schemas_with_positional_binds():
+    params = []
+    table_filter = TableFilter(include=["ord%", "cust%"], exclude=["%_tmp"], schemas=["sales"])
+    sql = table_filter.sql("t.name", "s.name", positional(params))
+    assert sql == (" AND (t.name LIKE %s OR t.name LIKE %s)"
+                   " AND t.name NOT LIKE %s"
+                   " AND s.name IN (%s)")
+    assert params == ["ord%", "cust%", "%_tmp", "sales"]
+
+
+def test_schemas_ignored_without_schema_column():
+    params = []
+    sql = TableFilter(schemas=["sales"]).sql("TABLE_NAME", None, positional(params))
+    assert sql == ""
+    assert params == []
+
+
+def test_named_binds_follow_placeholder_order():
+    binds = {"owner0": "HR"}
+    sql = TableFilter(include=["EMP%"], exclude=["EMP_OLD"]).sql(
+        "t.TABLE_NAME", None, named(binds))
+    assert sql == " AND (t.TABLE_NAME LIKE :f1) AND t.TABLE_NAME NOT LIKE :f2"
+    assert binds == {"owner0": "HR", "f1": "EMP%", "f2": "EMP_OLD"}
+
+
+def test_names_limit_tables():
+    params = []
+    sql = TableFilter(exclude=["%_tmp"]).sql(
+        "TABLE_NAME", None, positional(params), ["a", "b"])
+    assert sql == " AND TABLE_NAME NOT LIKE %s AND TABLE_NAME IN (%s, %s)"
+    assert params == ["%_tmp", "a", "b"]
+
+
+def test_from_body_and_key():
+    table_filter = TableFilter.from_body(
+        {"include_tables": ["a%"], "schemas": ["dbo"], "tables_only": True})
+    assert table_filter.key() == (("a%",), (), ("dbo",), True)
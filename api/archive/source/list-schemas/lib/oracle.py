@@ -1,8 +1,4 @@
-import oracledb
-
-
-def create_dsn(hostname: str, port: str, service: str) -> str:
-    return oracledb.makedsn(hostname, port, service_name=service)
+import source_connector
 
 
 class Connection:
@@ -14,8 +10,8 @@ class Connection:
         self.database = database
 
     def list_schemas(self):
-        dsn = create_dsn(self.hostname, self.port, self.database)
-        with oracledb.connect(user=self.username, password=self.password, dsn=dsn) as conn:
+        with source_connector.connect("oracle", self.hostname, self.port,
+                                      self.username, self.password, self.database) as conn:
             with conn.cursor() as cursor:
                 cursor.execute("SELECT USERNAME FROM ALL_USERS")
                 return [row[0] for row in cursor.fetchall()]
@@ -13,7 +13,7 @@ express or implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
-import pymssql
+import source_connector
 
 
 class Connection:
@@ -25,19 +25,14 @@ class Connection:
         self.database = database
 
     def testConnection(self):
-        print("testConnection")
         try:
-
-            connection = pymssql.connect(
-                host=self.hostname,
-                user=self.username,
-                password=self.password,
-                database=self.database)
-            print(connection)
-            cursor = connection.cursor()
-            cursor.execute("select * from sys.databases")
-            cursor.fetchall()
-            cursor.close()
+            with source_connector.connect("mssql", self.hostname, self.port,
+                                          self.username, self.password,
+                                          self.database) as connection:
+                cursor = connection.cursor()
+                cursor.execute("select * from sys.databases")
+                cursor.fetchall()
+                cursor.close()
 
             return True
 
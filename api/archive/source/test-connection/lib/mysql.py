@@ -13,7 +13,7 @@ express or implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
-import pymysql
+import source_connector
 
 
 class Connection:
@@ -25,21 +25,14 @@ class Connection:
         self.database = database
 
     def testConnection(self):
-
         try:
-
-            connection = pymysql.connect(
-                host=self.hostname,
-                user=self.username,
-                password=self.password,
-                database=self.database,
-                charset="utf8mb4",
-                cursorclass=pymysql.cursors.DictCursor)
-
-            cursor = connection.cursor()
-            cursor.execute("SHOW TABLES")
-            cursor.fetchall()
-            cursor.close()
+            with source_connector.connect("mysql", self.hostname, self.port,
+                                          self.username, self.password,
+                                          self.database) as connection:
+                cursor = connection.cursor()
+                cursor.execute("SHOW TABLES")
+                cursor.fetchall()
+                cursor.close()
 
             return True
 
@@ -13,12 +13,7 @@ express or implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
-import oracledb
-
-
-def create_dsn(hostname: str, port: str, service: str) -> str:
-    """Create an Oracle DSN that works across versions using service name."""
-    return oracledb.makedsn(hostname, port, service_name=service)
+import source_connector
 
 
 class Connection:
@@ -31,13 +26,15 @@ class Connection:
 
     def testConnection(self):
         try:
-            dsn = create_dsn(self.hostname, self.port, self.database)
-            with oracledb.connect(user=self.username, password=self.password, dsn=dsn) as connection:
-                with connection.cursor() as cursor:
-                    cursor.execute("SELECT 1 FROM dual")
-                    cursor.fetchall()
+            with source_connector.connect("oracle", self.hostname, self.port,
+                                          self.username, self.password,
+                                          self.database) as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT 1 FROM dual")
+                cursor.fetchall()
+                cursor.close()
 
             return True
 
-        except Exception:
+        except Exception as e:
             return False
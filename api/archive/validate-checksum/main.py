@@ -1,12 +1,15 @@
 """
-Lambda to validate table checksums by comparing row counts
-from the source database and the archived table stored in S3.
+Lambda to validate table checksums by comparing row counts and content
+hashes from the source database and the archived table stored in S3.
 """
 
 import boto3
+import content_hash
 import json
 import logging
+import manifests
 import os
+import source_connector
 import time
 import traceback
 
@@ -48,38 +51,50 @@ def build_response(http_code, body):
     }
 
 
-def get_source_count(engine, host, port, user, password, database, table, owner=""):
+def archived_rows_filter(tbl):
+    """Return the condition matching the source rows the archive holds."""
+    conditions = [tbl.get("row_filter"), tbl.get("watermark", {}).get("condition")]
+    return " AND ".join(f"({condition})" for condition in conditions if condition)
+
+
+def get_source_count(engine, host, port, user, password, database, table, owner="", row_filter=""):
+    relation = f"{owner}.{table}" if engine == "oracle" else table
+    # Filtered and incremental archives only hold the rows row_filter matches.
+    where = f" WHERE {row_filter}" if row_filter else ""
     try:
-        if engine == "mysql":
-            import pymysql
-            conn = pymysql.connect(host=host, user=user, password=password, database=database)
-            with conn.cursor() as cur:
-                cur.execute(f"SELECT COUNT(*) FROM {table}")
-                result = cur.fetchone()[0]
-            conn.close()
-            return int(result)
-        if engine == "mssql":
-            import pymssql
-            conn = pymssql.connect(host=host, user=user, password=password, database=database)
-            with conn.cursor() as cur:
-                cur.execute(f"SELECT COUNT(*) FROM {table}")
-                result = cur.fetchone()[0]
-            conn.close()
-            return int(result)
-        if engine == "oracle":
-            import oracledb
-            dsn = oracledb.makedsn(host, port, service_name=database)
-            with oracledb.connect(user=user, password=password, dsn=dsn) as conn:
-                with conn.cursor() as cur:
-                    cur.execute(f"SELECT COUNT(*) FROM {owner}.{table}")
-                    result = cur.fetchone()[0]
-            return int(result)
+        with source_connector.connect(engine, host, port, user, password, database) as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM {relation}{where}")
+            result = cur.fetchone()[0]
+            cur.close()
+        return int(result)
     except Exception:  # pragma: no cover - best effort connection
         logger.error(traceback.format_exc())
         return None
 
 
-def get_s3_count(archive_id, database, table, bucket):
+def get_source_hash(engine, host, port, user, password, database, table, owner, row_filter, spec):
+    relation = f"{owner}.{table}" if engine == "oracle" else table
+    try:
+        with source_connector.connect(engine, host, port, user, password, database) as conn:
+            return content_hash.source_hash(conn, engine, relation, row_filter, spec)
+    except Exception:  # pragma: no cover - best effort connection
+        logger.error(traceback.format_exc())
+        return None
+
+
+def mismatched_buckets(archived, source):
+    labels = set(archived["buckets"]) | set(source)
+    return sorted(label for label in labels
+                  if archived["buckets"].get(label) != source.get(label))
+
+
+def get_s3_count(archive_id, database, table, bucket, table_manifests):
+    # The extraction runs record the rows they write; Athena only has to
+    # count archives with runs that did not.
+    if table_manifests is not None:
+        return sum(int(manifest["rows"]) for manifest in table_manifests)
+
     query = (
         f'SELECT COUNT(*) FROM "{archive_id}-{database}-database".'
         f'"{archive_id}-{database}-{table}-table"'
@@ -117,6 +132,8 @@ def lambda_handler(event, context):
         queue_url = queue_param["Parameter"]["Value"]
         bucket_param = ssm.get_parameter(Name="/athena/s3-athena-temp-bucket", WithDecryption=True)
         bucket = bucket_param["Parameter"]["Value"]
+        data_bucket_param = ssm.get_parameter(Name="/job/s3-bucket-table-data", WithDecryption=True)
+        data_bucket = data_bucket_param["Parameter"]["Value"]
 
         for idx, tbl in enumerate(archive["table_details"]):
             source = get_source_count(
@@ -128,9 +145,34 @@ def lambda_handler(event, context):
                 archive["database"],
                 tbl["table"],
                 archive.get("oracle_owner", ""),
+                archived_rows_filter(tbl),
             )
-            s3_count = get_s3_count(archive_id, archive["database"], tbl["table"], bucket)
-            match = source == s3_count
+            table_manifests = manifests.read_manifests(
+                data_bucket, archive_id, archive["database"], tbl["table"])
+            s3_count = get_s3_count(archive_id, archive["database"], tbl["table"], bucket,
+                                    table_manifests)
+
+            # Archives whose runs all hashed their rows the same way are
+            # compared by content as well, bucket by bucket.
+            archived_hash = content_hash.archive_hash(table_manifests or [])
+            source_hash = None
+            if archived_hash and archived_hash["columns"]:
+                source_hash = get_source_hash(
+                    archive["database_engine"],
+                    archive["hostname"],
+                    archive["port"],
+                    archive["username"],
+                    password,
+                    archive["database"],
+                    tbl["table"],
+                    archive.get("oracle_owner", ""),
+                    archived_rows_filter(tbl),
+                    archived_hash,
+                )
+            mismatched = (mismatched_buckets(archived_hash, source_hash)
+                          if source_hash is not None else None)
+
+            match = source == s3_count and not mismatched
             table.update_item(
                 Key={"id": archive_id},
                 UpdateExpression=f'set table_details[{idx}].checksum_validation = :v',
@@ -139,6 +181,9 @@ def lambda_handler(event, context):
                         "state": "COMPLETED",
                         "source_count": source,
                         "s3_count": s3_count,
+                        "content_hash": archived_hash,
+                        "content_match": None if mismatched is None else not mismatched,
+                        "mismatched_buckets": mismatched,
                         "match": match,
                     }
                 },
@@ -0,0 +1,1333 @@
+""" 
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+import math
+import re
+import tempfile
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, reduce
+from urllib.parse import unquote
+
+import boto3
+from botocore.exceptions import ClientError
+from awsglue.dynamicframe import DynamicFrame
+from awsglue.transforms import ApplyMapping
+from pyspark.sql import Observation, functions
+from pyspark.sql.functions import col, date_format
+from pyspark.sql.types import (BinaryType, DecimalType, IntegralType, NumericType, StringType,
+                               StructField, StructType)
+
+
+JDBC_DRIVERS = {
+    "mysql": "com.mysql.cj.jdbc.Driver",
+    "sqlserver": "com.microsoft.sqlserver.jdbc.SQLServerDriver",
+    "oracle": "oracle.jdbc.OracleDriver",
+}
+
+# Identifier quotes of each source, used in the generated source query.
+IDENTIFIER_QUOTES = {"mysql": ("`", "`"), "sqlserver": ("[", "]"), "oracle": ('"', '"')}
+
+# Rows fetched per round trip by each parallel reader.
+JDBC_FETCH_SIZE = 10000
+
+# Parquet codecs an archive can be written with by the Spark Parquet
+# writer; zstd needs Glue 4.0.
+COMPRESSION_CODECS = ("snappy", "zstd", "gzip", "uncompressed")
+
+# Spark date formats of the partition values derived from a date column.
+PARTITION_FORMATS = {"year": "yyyy", "month": "yyyy-MM", "day": "yyyy-MM-dd"}
+
+# Upper bound on partitions per BatchCreatePartition call.
+PARTITION_BATCH_SIZE = 100
+
+# Upper bound on keys per DeleteObjects call.
+DELETE_BATCH_SIZE = 1000
+
+# Concurrent S3 calls made per object, such as legal hold checks and copies.
+S3_CALL_CONCURRENCY = 16
+
+# SQL of the byte length of a large object column, and of the column with
+# only the values up to a threshold, per source.
+LOB_LENGTH = {
+    "mysql": "LENGTH({column})",
+    "sqlserver": "DATALENGTH({column})",
+    "oracle": "DBMS_LOB.GETLENGTH({column})",
+}
+LOB_INLINE = {
+    "mysql": "CASE WHEN LENGTH({column}) <= {threshold} THEN {column} END",
+    "sqlserver": "CASE WHEN DATALENGTH({column}) <= {threshold} "
+                 "THEN CONVERT(VARBINARY(MAX), {column}) END",
+    "oracle": "CASE WHEN DBMS_LOB.GETLENGTH({column}) <= {threshold} THEN {column} END",
+}
+
+# SQL of a slice of a large object column.
+LOB_SLICE = {
+    "mysql": "SUBSTRING({column}, {offset}, {length})",
+    "sqlserver": "SUBSTRING(CONVERT(VARBINARY(MAX), {column}), {offset}, {length})",
+    "oracle": "DBMS_LOB.SUBSTR({column}, {length}, {offset})",
+}
+
+# Oracle SQL returns BLOB slices as RAW, of at most 2000 bytes unless the
+# database sets MAX_STRING_SIZE to EXTENDED, so Oracle chunks are read in
+# pieces of this size, one row per piece.
+ORACLE_LOB_PIECE_BYTES = 2000
+
+# Bytes of binary values a reader holds per fetch in LOB mode.
+LOB_FETCH_BYTES = 64 * 1024 ** 2
+
+# Upper bound on the chunk reads of a column; longer values get larger chunks.
+MAX_LOB_CHUNKS = 64
+
+# Part size of large value uploads; S3 takes parts of 5 MiB and up.
+LOB_PART_BYTES = 16 * 1024 ** 2
+
+# Suffix of the column that holds the S3 URI of a binary column's large
+# values; step four adds these columns to the catalog table.
+LOB_REF_SUFFIX = "_lob_ref"
+
+# Column the bucket of each row is computed into; see write_buckets.
+BUCKET_COLUMN = "__archive_bucket"
+
+# Prefix under a table's path that files are written to before they are
+# moved into the table; readers skip it as its name starts with _.
+STAGING_PREFIX = "_staging/"
+
+# Rows are content hashed in this many ranges of the table's split key, so a
+# mismatch with the source can be narrowed down to the keys it is in.
+HASH_BUCKETS = 16
+
+INTEGER_TYPES = ("tinyint", "smallint", "int", "integer", "bigint", "long")
+
+# Glue types canonical_column renders, besides decimals. Step nine picks
+# the columns to hash from these by their source type as well; see
+# hash_columns in job_plan.py.
+HASH_TYPES = INTEGER_TYPES + ("string", "varchar", "boolean", "date", "timestamp")
+
+DECIMAL_TYPE = re.compile(r"decimal(?:\((\d+),\s*(\d+)\))?$")
+
+
+def parse_split(value):
+    """Parse the --SPLIT job argument set by step nine.
+
+    It holds the split column, its type and lower/upper bounds from
+    discovery, and the number of partitions to read with. Any of them may
+    be missing.
+    """
+    return json.loads(value) if value else {}
+
+
+def parse_partition(value):
+    """Parse the --PARTITION job argument set by step nine.
+
+    It holds the column to partition the output by and, for date and
+    timestamp columns, the year, month or day granularity to derive the
+    partition value at. An empty object leaves the output unpartitioned.
+    """
+    return json.loads(value) if value else {}
+
+
+def parse_layout(value):
+    """Parse the --LAYOUT job argument set by step nine.
+
+    It holds the number of files to write, estimated from the source size
+    and the archive's target file size, and the most records a single file
+    may hold. Either may be missing, in which case the file count follows
+    the read partitions and files are not split by record count. The
+    table's Parquet tuning comes with it: row_group_bytes, page_bytes,
+    dictionary and the sort_by columns, each left to the writer's default
+    when missing. A bucket object, with the column and the number of
+    buckets, hash partitions the files as step four registers them.
+    """
+    return json.loads(value) if value else {}
+
+
+def parse_row_filter(value):
+    """Parse the --ROW_FILTER job argument set by step nine.
+
+    It holds the condition, in the source's SQL dialect, that rows must
+    match to be archived, or an empty string to archive every row.
+    """
+    return json.loads(value) if value else ""
+
+
+def parse_incremental(value):
+    """Parse the --INCREMENTAL job argument set by step nine.
+
+    It holds the monotonically increasing column the table is archived
+    incrementally by and the watermark the last successful run reached,
+    if any. An empty object archives the whole table.
+    """
+    return json.loads(value) if value else {}
+
+
+def parse_hash_columns(value):
+    """Parse the --HASH_COLUMNS job argument set by step nine.
+
+    It holds the [column, Glue type] pairs the content hash covers, which
+    step nine picks by the columns' source types.
+    """
+    return json.loads(value) if value else []
+
+
+def parse_lobs(value):
+    """Parse the --LOBS job argument set by step nine.
+
+    It holds the binary columns read in LOB mode, the primary key their
+    large values are read back by, the size threshold above which values
+    go to S3 objects of their own and the chunk size they are read in. An
+    empty object reads binary columns like any other.
+    """
+    return json.loads(value) if value else {}
+
+
+def quote_identifier(connection_type, name):
+    open_quote, close_quote = IDENTIFIER_QUOTES[connection_type]
+    return open_quote + name.replace(close_quote, close_quote * 2) + close_quote
+
+
+def source_query(connection_type, dbtable, columns, row_filter, expressions=None):
+    """Return a subquery over dbtable that selects only columns, filtered by row_filter.
+
+    It is used as the dbtable of the read, so the source drops unarchived
+    columns and rows before they cross the network. Columns in expressions
+    are selected as that SQL instead of as they are.
+    """
+
+    expressions = expressions or {}
+    select = ", ".join(
+        f"{expressions[column]} AS {quote_identifier(connection_type, column)}"
+        if column in expressions else quote_identifier(connection_type, column)
+        for column in columns) or "*"
+    query = f"SELECT {select} FROM {dbtable}"
+    if row_filter:
+        query += f" WHERE {row_filter}"
+    return f"({query}) archive_source"
+
+
+def partition_keys(partition):
+    """Return the partition key columns of the output, which step four registers."""
+    if not partition.get("column"):
+        return []
+    if partition.get("granularity"):
+        return [f'{partition["column"]}_{partition["granularity"]}'.lower()]
+    return [partition["column"]]
+
+
+def add_partition_column(glue_context, frame, partition, transformation_ctx) -> DynamicFrame:
+    """Add the derived partition column, formatted as a date string, to the frame."""
+
+    granularity = partition.get("granularity")
+    if not partition.get("column") or not granularity:
+        return frame
+
+    data_frame = frame.toDF().withColumn(
+        partition_keys(partition)[0],
+        date_format(col(partition["column"]), PARTITION_FORMATS[granularity]))
+    return DynamicFrame.fromDF(data_frame, glue_context, transformation_ctx)
+
+
+def jdbc_reader(glue_context, connection_name, connection_type):
+    """Return a Spark JDBC reader connected with the credentials of the Glue connection."""
+
+    conf = glue_context.extract_jdbc_conf(connection_name)
+    return (
+        glue_context.spark_session.read.format("jdbc")
+        .option("url", conf.get("fullUrl") or conf["url"])
+        .option("user", conf["user"])
+        .option("password", conf["password"])
+        .option("driver", JDBC_DRIVERS[connection_type])
+    )
+
+
+def watermark_literal(connection_type, watermark):
+    """Return the watermark's value as a SQL literal of the source's dialect."""
+
+    value, kind = watermark["value"], watermark["kind"]
+    if kind == "number":
+        return value
+
+    quoted = "'" + value.replace("'", "''") + "'"
+    if kind == "timestamp" and connection_type == "oracle":
+        return f"TIMESTAMP {quoted}"
+    if kind == "timestamp" and connection_type == "sqlserver":
+        # datetime2 keeps the microseconds a datetime literal would reject.
+        return f"CAST({quoted} AS datetime2)"
+    if kind == "date" and connection_type == "oracle":
+        return f"DATE {quoted}"
+    return quoted
+
+
+def high_watermark(glue_context, connection_name, connection_type, dbtable, column, row_filter):
+    """Read the current maximum of column at the source, or None when no row matches.
+
+    Values are kept as strings, with a kind that says how to compare them,
+    so they can be stored on the archive record and passed back to the
+    next run.
+    """
+
+    query = f"SELECT MAX({quote_identifier(connection_type, column)}) AS high FROM {dbtable}"
+    if row_filter:
+        query += f" WHERE {row_filter}"
+    high = (jdbc_reader(glue_context, connection_name, connection_type)
+            .option("dbtable", f"({query}) archive_watermark")
+            .load().first()[0])
+
+    if high is None:
+        return None
+    if isinstance(high, datetime.datetime):
+        return {"column": column, "value": high.isoformat(sep=" "), "kind": "timestamp"}
+    if isinstance(high, datetime.date):
+        return {"column": column, "value": high.isoformat(), "kind": "date"}
+    if isinstance(high, (int, float, decimal.Decimal)):
+        return {"column": column, "value": str(high), "kind": "number"}
+    return {"column": column, "value": str(high), "kind": "string"}
+
+
+def bound_value(value, kind, upper):
+    """Return a split bound as the string the Spark JDBC reader and the archive record take.
+
+    Numeric bounds are rounded outwards to whole numbers, which is what
+    the reader parses them as.
+    """
+
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if kind == "numeric":
+        value = decimal.Decimal(str(value))
+        return str(math.ceil(value) if upper else math.floor(value))
+    return str(value)
+
+
+def split_bounds(glue_context, connection_name, connection_type, dbtable, split):
+    """Read the bounds of the split column at the source when the split has none.
+
+    Schema discovery leaves them out, so the first run that reads a table
+    in parallel reads MIN and MAX of its split column, from the column's
+    index. The run's manifest records them and the glue job status
+    function stores them on the table, so later runs read and content hash
+    the same ranges. Returns the split, with the bounds that were read
+    under bounds_read.
+    """
+
+    if (int(split.get("partitions") or 1) <= 1 or split.get("type") not in ("numeric", "date")
+            or (split.get("lower") is not None and split.get("upper") is not None)):
+        return split
+
+    quoted = quote_identifier(connection_type, split["column"])
+    query = f"SELECT MIN({quoted}) AS lower_bound, MAX({quoted}) AS upper_bound FROM {dbtable}"
+    row = (jdbc_reader(glue_context, connection_name, connection_type)
+           .option("dbtable", f"({query}) archive_bounds")
+           .load().first())
+    if row is None or row[0] is None:
+        return split
+
+    bounds = {"column": split["column"],
+              "lower": bound_value(row[0], split["type"], upper=False),
+              "upper": bound_value(row[1], split["type"], upper=True)}
+    return dict(split, lower=bounds["lower"], upper=bounds["upper"], bounds_read=bounds)
+
+
+def apply_incremental(glue_context, connection_name, connection_type, dbtable, split,
+                      row_filter, incremental):
+    """Limit the read to the rows added since the last run's watermark.
+
+    The source's current maximum of the column becomes the new watermark,
+    and rows above the last watermark up to the new one are read, so rows
+    inserted while the job runs are left for the next run. When the split
+    column is the incremental column, its bounds are narrowed to the same
+    range. Returns the split and row filter to read with and the watermark
+    the run reaches.
+    """
+
+    column = incremental.get("column")
+    if not column:
+        return split, row_filter, None
+
+    low = incremental.get("watermark")
+    high = high_watermark(glue_context, connection_name, connection_type, dbtable, column, row_filter)
+    if high is None:
+        high = low
+
+    quoted = quote_identifier(connection_type, column)
+    conditions = [f"({row_filter})"] if row_filter else []
+    if low:
+        conditions.append(f"{quoted} > {watermark_literal(connection_type, low)}")
+    if high:
+        high = dict(high, condition=f"{quoted} <= {watermark_literal(connection_type, high)}")
+        conditions.append(high["condition"])
+
+    if split.get("column") == column and high and high["kind"] != "string":
+        split = dict(split, upper=high["value"])
+        if low:
+            split["lower"] = low["value"]
+
+    return split, " AND ".join(conditions), high
+
+
+def read_source(glue_context, connection_name, connection_type, dbtable, split,
+                transformation_ctx, columns=None, row_filter="", expressions=None,
+                fetch_size=None) -> DynamicFrame:
+    """Read a source table, in parallel when the split allows it.
+
+    With a split column and both bounds, the table is read as partitions
+    ranges of the column, so each reader does an index range scan. With a
+    split column but no bounds, Glue hashes the column into partitions.
+    Otherwise the table is read through a single connection.
+
+    Given columns, only those columns, and the split column, are selected
+    from the source, and given row_filter only the rows matching it.
+    expressions replace columns as in source_query. Given fetch_size, the
+    table is always read by the Spark JDBC reader, which fetches that many
+    rows per round trip.
+    """
+
+    partitions = int(split.get("partitions") or 1)
+    column = split.get("column")
+
+    if columns or row_filter:
+        if columns and column and column not in columns:
+            columns = list(columns) + [column]
+        dbtable = source_query(connection_type, dbtable, columns or [], row_filter, expressions)
+
+    bounded = (partitions > 1 and column and split.get("lower") is not None
+               and split.get("upper") is not None and split["lower"] != split["upper"])
+    if bounded or fetch_size:
+        reader = (
+            jdbc_reader(glue_context, connection_name, connection_type)
+            .option("dbtable", dbtable)
+            .option("fetchsize", fetch_size or JDBC_FETCH_SIZE)
+        )
+        if bounded:
+            reader = (
+                reader.option("partitionColumn", column)
+                .option("lowerBound", split["lower"])
+                .option("upperBound", split["upper"])
+                .option("numPartitions", partitions)
+            )
+        return DynamicFrame.fromDF(reader.load(), glue_context, transformation_ctx)
+
+    connection_options = {
+        "useConnectionProperties": "true",
+        "dbtable": dbtable,
+        "connectionName": connection_name,
+    }
+    if partitions > 1 and column:
+        connection_options["hashfield"] = column
+        connection_options["hashpartitions"] = str(partitions)
+
+    return glue_context.create_dynamic_frame.from_options(
+        connection_type=connection_type,
+        connection_options=connection_options,
+        transformation_ctx=transformation_ctx,
+    )
+
+
+def lob_expressions(connection_type, lobs):
+    """Return the source_query expressions that keep only the small values of LOB columns."""
+
+    return {column: LOB_INLINE[connection_type].format(
+                column=quote_identifier(connection_type, column),
+                threshold=int(lobs["threshold_bytes"]))
+            for column in lobs.get("columns", [])}
+
+
+def lob_fetch_size(lobs):
+    """Return the rows per fetch that keep a reader's inline binary values bounded."""
+    return max(1, min(JDBC_FETCH_SIZE, LOB_FETCH_BYTES // int(lobs["threshold_bytes"])))
+
+
+def large_values(glue_context, connection_name, connection_type, dbtable, column, lobs,
+                 row_filter):
+    """Return how many values of column are over the threshold, and the longest's bytes."""
+
+    length = LOB_LENGTH[connection_type].format(column=quote_identifier(connection_type, column))
+    query = (f"SELECT COUNT(*) AS lobs, MAX({length}) AS longest FROM {dbtable} "
+             f"WHERE {length} > {int(lobs['threshold_bytes'])}")
+    if row_filter:
+        query += f" AND ({row_filter})"
+    row = (jdbc_reader(glue_context, connection_name, connection_type)
+           .option("dbtable", f"({query}) archive_lob_stats")
+           .load().first())
+    return int(row[0] or 0), int(row[1] or 0)
+
+
+def read_lob_chunks(glue_context, connection_name, connection_type, dbtable, column, lobs,
+                    row_filter, longest):
+    """Read the large values of column as (key..., lob_chunk, lob_data) rows.
+
+    Chunk k of every value holds bytes k * chunk + 1 onwards, and is read
+    by a query of its own, so no fetch holds more than a few chunks. On
+    Oracle the query returns the chunk as ORACLE_LOB_PIECE_BYTES pieces,
+    numbered on from the pieces of the chunks before it, so lob_chunk
+    orders the pieces of a value too.
+    """
+
+    quoted = quote_identifier(connection_type, column)
+    length = LOB_LENGTH[connection_type].format(column=quoted)
+    keys = ", ".join(quote_identifier(connection_type, key) for key in lobs["keys"])
+    lob_chunk = quote_identifier(connection_type, "lob_chunk")
+    lob_data = quote_identifier(connection_type, "lob_data")
+
+    piece = ORACLE_LOB_PIECE_BYTES if connection_type == "oracle" else 0
+    chunk = max(int(lobs["chunk_bytes"]), math.ceil(longest / MAX_LOB_CHUNKS))
+    if piece:
+        chunk = math.ceil(chunk / piece) * piece
+    chunks = math.ceil(longest / chunk)
+
+    frames = []
+    for index in range(chunks):
+        start = index * chunk
+        if piece:
+            # A row per piece of the chunk, from a row generator joined in.
+            pieces = chunk // piece
+            offset = f"{start} + archive_piece.piece_index * {piece}"
+            data = LOB_SLICE[connection_type].format(column=quoted, offset=f"{offset} + 1",
+                                                     length=piece)
+            query = (f"SELECT {keys}, {index * pieces} + archive_piece.piece_index AS {lob_chunk}, "
+                     f"{data} AS {lob_data} FROM {dbtable}, "
+                     f"(SELECT LEVEL - 1 AS piece_index FROM DUAL CONNECT BY LEVEL <= {pieces}) "
+                     f"archive_piece WHERE {length} > {int(lobs['threshold_bytes'])} "
+                     f"AND {length} > {offset}")
+        else:
+            data = LOB_SLICE[connection_type].format(column=quoted, offset=start + 1, length=chunk)
+            query = (f"SELECT {keys}, {index} AS {lob_chunk}, {data} AS {lob_data} FROM {dbtable} "
+                     f"WHERE {length} > {int(lobs['threshold_bytes'])} AND {length} > {start}")
+        if row_filter:
+            query += f" AND ({row_filter})"
+        frames.append(
+            jdbc_reader(glue_context, connection_name, connection_type)
+            .option("dbtable", f"({query}) archive_lob_chunks")
+            .option("fetchsize", max(1, min(JDBC_FETCH_SIZE, LOB_FETCH_BYTES // (piece or chunk))))
+            .load()
+        )
+    return reduce(lambda left, right: left.unionByName(right), frames)
+
+
+def store_lob(s3, bucket, prefix, spool, digest):
+    """Upload a spooled value to its content address under prefix, once.
+
+    Returns the s3:// URI of the object. Parts are read back from the
+    spool one at a time, so only one part is held in memory.
+    """
+
+    key = f"{prefix}_lobs/sha256/{digest.hexdigest()}"
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return f"s3://{bucket}/{key}"
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+            raise
+
+    def content_md5(body):
+        # Puts to a bucket with Object Lock need a Content-MD5.
+        return base64.b64encode(hashlib.md5(body).digest()).decode("ascii")
+
+    size = spool.tell()
+    spool.seek(0)
+    if size <= LOB_PART_BYTES:
+        body = spool.read()
+        s3.put_object(Bucket=bucket, Key=key, Body=body, ContentMD5=content_md5(body))
+        return f"s3://{bucket}/{key}"
+
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+    try:
+        parts = []
+        for number in range(1, math.ceil(size / LOB_PART_BYTES) + 1):
+            body = spool.read(LOB_PART_BYTES)
+            response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id,
+                                      PartNumber=number, Body=body, ContentMD5=content_md5(body))
+            parts.append({"PartNumber": number, "ETag": response["ETag"]})
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                     MultipartUpload={"Parts": parts})
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return f"s3://{bucket}/{key}"
+
+
+def lob_objects(rows, bucket, prefix, keys):
+    """Write the values chunked in rows to S3 and yield (key..., uri) per value.
+
+    rows come sorted by key and chunk, so each value's chunks are spooled
+    to local disk in order, while its SHA-256 is computed, and uploaded
+    before the next value starts.
+    """
+
+    s3 = boto3.client("s3")
+    current, spool, digest = None, None, None
+    for row in rows:
+        key = tuple(row[name] for name in keys)
+        if key != current:
+            if current is not None:
+                yield current + (store_lob(s3, bucket, prefix, spool, digest),)
+                spool.close()
+            current, spool, digest = key, tempfile.TemporaryFile(), hashlib.sha256()
+        data = bytes(row["lob_data"] or b"")
+        spool.write(data)
+        digest.update(data)
+    if current is not None:
+        yield current + (store_lob(s3, bucket, prefix, spool, digest),)
+        spool.close()
+
+
+def add_lob_refs(glue_context, connection_name, connection_type, dbtable, frame, lobs,
+                 row_filter, path, transformation_ctx) -> DynamicFrame:
+    """Archive the large values of the LOB columns and reference them from frame.
+
+    frame was read with lob_expressions, so it holds only the values up to
+    the threshold. Each larger value is read back in chunks, written to a
+    content addressed object under the table's _lobs/ prefix, which Spark
+    and Athena skip, and its URI set in the <column>_lob_ref column.
+    """
+
+    bucket, _, prefix = path[len("s3://"):].partition("/")
+    data_frame = frame.toDF()
+
+    for column in lobs.get("columns", []):
+        ref = f"{column}{LOB_REF_SUFFIX}"
+        count, longest = large_values(glue_context, connection_name, connection_type, dbtable,
+                                      column, lobs, row_filter)
+        if not count:
+            data_frame = data_frame.withColumn(ref, functions.lit(None).cast(StringType()))
+            continue
+
+        chunks = read_lob_chunks(glue_context, connection_name, connection_type, dbtable,
+                                 column, lobs, row_filter, longest)
+        schema = StructType([chunks.schema[key] for key in lobs["keys"]]
+                            + [StructField(ref, StringType())])
+        refs = glue_context.spark_session.createDataFrame(
+            chunks.repartition(*lobs["keys"])
+            .sortWithinPartitions(*lobs["keys"], "lob_chunk")
+            .rdd.mapPartitions(partial(lob_objects, bucket=bucket, prefix=prefix,
+                                       keys=lobs["keys"])),
+            schema)
+        data_frame = data_frame.join(refs, on=lobs["keys"], how="left")
+
+    return DynamicFrame.fromDF(data_frame, glue_context, transformation_ctx)
+
+
+def parquet_options(layout):
+    """Return the Parquet writer options of the layout's row group, page and dictionary settings."""
+
+    options = {}
+    if layout.get("row_group_bytes"):
+        options["parquet.block.size"] = str(int(layout["row_group_bytes"]))
+    if layout.get("page_bytes"):
+        options["parquet.page.size"] = str(int(layout["page_bytes"]))
+    if "dictionary" in layout:
+        options["parquet.enable.dictionary"] = "true" if layout["dictionary"] else "false"
+    return options
+
+
+def bucket_id(bucket):
+    """Return the bucket of each row, computed like Spark's bucketBy does.
+
+    That is the Murmur3 hash of the column modulo the bucket count, which
+    Athena computes for the value of a query's equality predicate when the
+    table's bucketing_format is spark.
+    """
+    return functions.expr(f"pmod(hash(`{bucket['column']}`), {int(bucket['buckets'])})")
+
+
+def bucket_files(data_frame, keys, layout, files):
+    """Repartition the frame into files tasks and order the rows each one writes.
+
+    Bucketed frames get the bucket column, which is written like a
+    partition key after keys, and are sorted by the bucket column's values
+    within each bucket. The sort_by columns come after that.
+    """
+
+    bucket = layout.get("bucket") or {}
+    partitions = list(keys)
+    order = list(layout.get("sort_by") or [])
+    if bucket:
+        data_frame = data_frame.withColumn(BUCKET_COLUMN, bucket_id(bucket))
+        partitions.append(BUCKET_COLUMN)
+        order = [bucket["column"]] + [column for column in order if column != bucket["column"]]
+
+    if files:
+        data_frame = data_frame.repartition(files, *partitions)
+    if order:
+        # Sorting by the partition keys first lets the writer skip its own sort.
+        data_frame = data_frame.sortWithinPartitions(*partitions, *order)
+    return data_frame
+
+
+def parquet_writer(data_frame, compression, max_records_per_file, layout):
+    """Return a Spark Parquet writer appending the frame with the layout's tuning."""
+
+    writer = data_frame.write.mode("append").option("compression", compression)
+    if max_records_per_file:
+        writer = writer.option("maxRecordsPerFile", max_records_per_file)
+    for name, value in parquet_options(layout).items():
+        writer = writer.option(name, value)
+    return writer
+
+
+def delete_keys(s3, bucket, keys):
+    """Delete keys from bucket, DELETE_BATCH_SIZE at a time."""
+
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        response = s3.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": key} for key in keys[start:start + DELETE_BATCH_SIZE]],
+                    "Quiet": True},
+        )
+        for error in response.get("Errors", []):
+            raise RuntimeError(f"Could not delete {error['Key']}: {error['Message']}")
+
+
+def stage_files(writer, path, keys, bucketed):
+    """Write under a new staging prefix of path and plan moving the files into it.
+
+    When bucketed, the rows are partitioned by their bucket as well, and each
+    file is named with the _<bucket> suffix Athena reads the bucket of a file
+    from. Returns every key written to the staging prefix, and the (staged
+    key, target key) of each data file.
+    """
+
+    staging = f"{path}{STAGING_PREFIX}{uuid.uuid4()}/"
+    writer.partitionBy(*keys, *([BUCKET_COLUMN] if bucketed else [])).parquet(staging)
+
+    bucket, _, prefix = path[len("s3://"):].partition("/")
+    staging_prefix = staging[len("s3://"):].partition("/")[2]
+    paginator = boto3.client("s3").get_paginator("list_objects_v2")
+
+    staged = [entry["Key"] for page in paginator.paginate(Bucket=bucket, Prefix=staging_prefix)
+              for entry in page.get("Contents", [])]
+    moves = []
+    for key in staged:
+        parts = key[len(staging_prefix):].split("/")
+        if not parts[-1].endswith(".parquet"):
+            continue
+        if bucketed:
+            bucket_value = int(parts[-2].split("=", 1)[1])
+            stem, _, extension = parts[-1].partition(".")
+            parts = parts[:-2] + [f"{stem}_{bucket_value:05d}.{extension}"]
+        moves.append((key, prefix + "/".join(parts)))
+    return staged, moves
+
+
+def write_buckets(writer, path, keys):
+    """Write bucketed files under path, named the way Spark names bucket files.
+
+    Spark only writes bucketed tables it registers in its own catalog, so
+    the rows are staged by stage_files and each file is copied to its
+    partition under its bucket file name. The staging prefix is deleted
+    afterwards.
+    """
+
+    bucket = path[len("s3://"):].partition("/")[0]
+    s3 = boto3.client("s3")
+    staged, moves = stage_files(writer, path, keys, bucketed=True)
+    with ThreadPoolExecutor(max_workers=S3_CALL_CONCURRENCY) as executor:
+        list(executor.map(lambda move: s3.copy({"Bucket": bucket, "Key": move[0]}, bucket, move[1]),
+                          moves))
+    delete_keys(s3, bucket, staged)
+
+
+def write_parquet(data_frame, path, compression, keys, layout):
+    """Write the frame as Parquet files under path with the given codec.
+
+    With partition keys the files are laid out Hive style, one
+    key=value/ prefix per partition. The frame is repartitioned to the
+    layout's file count first, by the partition keys when there are any so
+    each partition value is written by a single task. With sort_by, each
+    file is sorted by those columns, which keeps the min/max statistics of
+    its row groups narrow for Athena to skip on. With a bucket, each
+    partition's rows are split into bucket files by write_buckets, so
+    Athena reads only one bucket for a lookup of a single value.
+
+    The frame is written by the Spark writer, whose write reports the
+    metrics observed on the frame; see archive_table.
+    """
+
+    if compression not in COMPRESSION_CODECS:
+        raise ValueError(f"Unsupported compression codec: {compression}")
+
+    files = int(layout.get("files") or 0)
+    max_records_per_file = int(layout.get("max_records_per_file") or 0)
+    data_frame = bucket_files(data_frame, keys, layout, files)
+
+    writer = parquet_writer(data_frame, compression, max_records_per_file, layout)
+    if layout.get("bucket"):
+        write_buckets(writer, path, keys)
+    else:
+        writer.partitionBy(*keys).parquet(path)
+
+
+def metric_value(value):
+    """Return an aggregate as a JSON value, exact numbers and times as strings."""
+
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    if isinstance(value, decimal.Decimal) or (isinstance(value, float) and not math.isfinite(value)):
+        return str(value)
+    return value
+
+
+def metric_aggregates(data_frame):
+    """Return the named aggregates of the row count and each column's nulls, sum, min and max.
+
+    Integer sums are taken as decimal(38,0) so they cannot overflow, and
+    binary columns only get a null count.
+    """
+
+    aggregates = [functions.count(functions.lit(1)).alias("rows")]
+    for index, field in enumerate(data_frame.schema.fields):
+        column = data_frame[field.name]
+        aggregates.append(functions.sum(functions.when(column.isNull(), 1).otherwise(0))
+                          .alias(f"nulls_{index}"))
+        if isinstance(field.dataType, IntegralType):
+            aggregates.append(functions.sum(column.cast(DecimalType(38, 0))).alias(f"sum_{index}"))
+        elif isinstance(field.dataType, NumericType):
+            aggregates.append(functions.sum(column).alias(f"sum_{index}"))
+        if not isinstance(field.dataType, BinaryType):
+            aggregates.extend([functions.min(column).alias(f"min_{index}"),
+                               functions.max(column).alias(f"max_{index}")])
+    return aggregates
+
+
+def frame_metrics(fields, values):
+    """Return the row count and each column's metrics from the values of metric_aggregates."""
+
+    columns = {}
+    for index, field in enumerate(fields):
+        columns[field.name] = {
+            "nulls": int(values.get(f"nulls_{index}") or 0),
+            "sum": metric_value(values.get(f"sum_{index}")),
+            "min": metric_value(values.get(f"min_{index}")),
+            "max": metric_value(values.get(f"max_{index}")),
+        }
+    return {"rows": int(values["rows"]), "columns": columns}
+
+
+def hash_spec(mappings, split, hash_columns):
+    """Describe how the rows of a table are content hashed.
+
+    Rows are canonicalized over hash_columns, the [column, Glue type] pairs
+    step nine picked, of the mapped columns of HASH_TYPES and decimal
+    types. With an integer split key and both its bounds, they are
+    bucketed by (key - lower) DIV width, HASH_BUCKETS ranges over the
+    bounds from discovery; incremental runs do not narrow these, so the
+    buckets of every run of a table line up.
+    """
+
+    mapped = {mapping[2]: mapping[3] for mapping in mappings}
+    columns = [[name, glue_type] for name, glue_type in hash_columns
+               if mapped.get(name) == glue_type
+               and (glue_type in HASH_TYPES or DECIMAL_TYPE.match(glue_type))]
+
+    key_type = mapped.get(split.get("column"), "")
+    match = DECIMAL_TYPE.match(key_type)
+    integral = key_type in INTEGER_TYPES or (match and not int(match.group(2) or 0))
+
+    bucket = None
+    if integral and split.get("lower") is not None and split.get("upper") is not None:
+        lower = int(decimal.Decimal(split["lower"]))
+        width = max(1, -(-(int(decimal.Decimal(split["upper"])) - lower + 1) // HASH_BUCKETS))
+        bucket = {"column": split["column"], "lower": lower, "width": width}
+    return {"columns": columns, "bucket": bucket}
+
+
+def canonical_column(name, glue_type):
+    """Return the canonical text of a column, as the source side renders it too.
+
+    Decimals are rendered as their unscaled integer and timestamps to the
+    second, which every source can reproduce exactly.
+    """
+
+    column = col(f"`{name}`")
+    match = DECIMAL_TYPE.match(glue_type)
+    if match:
+        scale = int(match.group(2) or 0)
+        return (column * functions.lit(decimal.Decimal(10) ** scale)).cast(
+            DecimalType(38, 0)).cast("string")
+    if glue_type == "boolean":
+        return column.cast("int").cast("string")
+    if glue_type == "date":
+        return date_format(column, "yyyy-MM-dd")
+    if glue_type == "timestamp":
+        return date_format(column, "yyyy-MM-dd HH:mm:ss")
+    return column.cast("string")
+
+
+def hash_columns(spec):
+    """Return the bucket label and the hash of each row, as content_hash sums them.
+
+    Each row's canonical columns are joined by the unit separator, with
+    the record separator for nulls, and hashed to the first 56 bits of the
+    MD5 of that text.
+    """
+
+    row = functions.concat_ws("\x1f", *[
+        functions.coalesce(canonical_column(name, glue_type), functions.lit("\x1e"))
+        for name, glue_type in spec["columns"]])
+    row_hash = functions.conv(functions.substring(functions.md5(row), 1, 14), 16, 10).cast(
+        DecimalType(38, 0))
+
+    bucket = spec["bucket"]
+    if bucket:
+        # div truncates like the integer division of every source.
+        label = functions.expr(
+            f"(CAST(`{bucket['column']}` AS BIGINT) - {bucket['lower']}) div {bucket['width']}")
+    else:
+        label = functions.lit(0)
+    return label, row_hash
+
+
+def outside_buckets(spec):
+    """Return whether a row's bucket label is past the HASH_BUCKETS ranges of its bounds.
+
+    Incremental runs read keys above the bounds from discovery, which land
+    there.
+    """
+
+    label, _ = hash_columns(spec)
+    return label.isNotNull() & ~label.between(0, HASH_BUCKETS - 1)
+
+
+def hash_aggregates(spec):
+    """Return the named aggregates of the rows and hash sum of each bucket.
+
+    Those are the labels 0 to HASH_BUCKETS - 1 and null. Rows outside
+    those buckets are only counted; see outside_buckets.
+    """
+
+    label, row_hash = hash_columns(spec)
+    if not spec["bucket"]:
+        return [functions.count(functions.lit(1)).alias("hash_rows_0"),
+                functions.sum(row_hash).alias("hash_sum_0")]
+
+    aggregates = []
+    for value, matches in [(value, label == value) for value in range(HASH_BUCKETS)] + [
+            ("null", label.isNull())]:
+        aggregates.extend([
+            functions.count(functions.when(matches, 1)).alias(f"hash_rows_{value}"),
+            functions.sum(functions.when(matches, row_hash)).alias(f"hash_sum_{value}"),
+        ])
+    aggregates.append(
+        functions.count(functions.when(outside_buckets(spec), 1)).alias("hash_rows_outside"))
+    return aggregates
+
+
+def hash_buckets(spec, values):
+    """Return the rows and hash sum of each bucket with rows, from the values of hash_aggregates."""
+
+    buckets = {}
+    for value in (list(range(HASH_BUCKETS)) + ["null"]) if spec["bucket"] else [0]:
+        rows = int(values.get(f"hash_rows_{value}") or 0)
+        if rows:
+            buckets[str(value)] = {"rows": rows,
+                                   "hash": str(int(values.get(f"hash_sum_{value}") or 0))}
+    return buckets
+
+
+def content_hash(data_frame, spec):
+    """Aggregate an order independent hash of the frame's rows.
+
+    The hashes of hash_columns are summed per bucket. Sums add up across
+    runs and can be computed the same way in SQL on every source; see
+    content_hash.py of the archive validation layer. Returns the spec with
+    the rows and hash sum of each bucket.
+    """
+
+    label, row_hash = hash_columns(spec)
+    buckets = {}
+    for result in (data_frame.select(label.alias("bucket"), row_hash.alias("hash"))
+                   .groupBy("bucket").agg(functions.count(functions.lit(1)), functions.sum("hash"))
+                   .collect()):
+        label_value = "null" if result[0] is None else str(int(result[0]))
+        buckets[label_value] = {"rows": int(result[1]), "hash": str(int(result[2] or 0))}
+    return dict(spec, buckets=buckets)
+
+
+def parquet_footer(glue_context, path):
+    """Return the row count and row group count of the Parquet file at path.
+
+    Only the footer is read, through the Parquet reader Spark ships with.
+    """
+
+    jvm = glue_context.spark_session._jvm
+    input_file = jvm.org.apache.parquet.hadoop.util.HadoopInputFile.fromPath(
+        jvm.org.apache.hadoop.fs.Path(path),
+        glue_context.spark_session._jsc.hadoopConfiguration())
+    reader = jvm.org.apache.parquet.hadoop.ParquetFileReader.open(input_file)
+    try:
+        blocks = reader.getFooter().getBlocks()
+        return (sum(blocks.get(index).getRowCount() for index in range(blocks.size())),
+                blocks.size())
+    finally:
+        reader.close()
+
+
+def written_files(glue_context, path, before):
+    """Describe the data files under path that are not in before.
+
+    before holds the data object keys listed ahead of the write, so what
+    is left are the files the write added. Their sizes come from the
+    listing and their footers are read S3_CALL_CONCURRENCY at a time.
+    """
+
+    bucket = path[len("s3://"):].partition("/")[0]
+    added = sorted((key, size) for key, size in data_objects(path)
+                   if key not in before and key.endswith(".parquet"))
+    with ThreadPoolExecutor(max_workers=S3_CALL_CONCURRENCY) as executor:
+        footers = list(executor.map(
+            lambda key: parquet_footer(glue_context, f"s3://{bucket}/{key}"),
+            [key for key, _ in added]))
+    return [{"key": key, "bytes": size, "rows": rows, "row_groups": row_groups}
+            for (key, size), (rows, row_groups) in zip(added, footers)]
+
+
+def table_path(bucket, archive_id, database, table):
+    return f"s3://{bucket}/{archive_id}/{database}/{table}/"
+
+
+def archive_table(glue_context, connection_name, connection_type, bucket, archive_id,
+                  database, compression, spec):
+    """Archive one source table and return its manifest.
+
+    The manifest holds the watermark the run reached, the rows it wrote
+    with each column's metrics from frame_metrics and their content_hash,
+    the Parquet files it added with their bytes, rows and row groups, and
+    the split bounds it read, if any. The metrics and content hash are
+    observed on the frame while it is written, so the source is read once
+    and nothing is cached.
+
+    spec describes the table the way step nine passes it: the table name,
+    the dbtable to read, the column mappings, the split, partition,
+    layout, row filter, incremental and LOB settings of the table and the
+    columns its content hash covers.
+    """
+
+    table = spec["table"]
+    mappings = [tuple(mapping) for mapping in spec["mappings"]]
+
+    full_split = split_bounds(glue_context, connection_name, connection_type, spec["dbtable"],
+                              spec.get("split") or {})
+    split, row_filter, watermark = apply_incremental(
+        glue_context,
+        connection_name=connection_name,
+        connection_type=connection_type,
+        dbtable=spec["dbtable"],
+        split=full_split,
+        row_filter=spec.get("row_filter") or "",
+        incremental=spec.get("incremental") or {},
+    )
+
+    # In LOB mode binary columns are read with their small values only, and
+    # the primary key is read to match the large ones back to their rows.
+    lobs = spec.get("lobs") or {}
+    columns = [mapping[0] for mapping in mappings]
+    if lobs:
+        columns += [key for key in lobs["keys"] if key not in columns]
+
+    source = read_source(
+        glue_context,
+        connection_name=connection_name,
+        connection_type=connection_type,
+        dbtable=spec["dbtable"],
+        split=split,
+        transformation_ctx=f"{table}_source",
+        columns=columns,
+        row_filter=row_filter,
+        expressions=lob_expressions(connection_type, lobs) if lobs else None,
+        fetch_size=lob_fetch_size(lobs) if lobs else None,
+    )
+
+    source_mappings = mappings
+    if lobs:
+        source = add_lob_refs(
+            glue_context,
+            connection_name=connection_name,
+            connection_type=connection_type,
+            dbtable=spec["dbtable"],
+            frame=source,
+            lobs=lobs,
+            row_filter=row_filter,
+            path=table_path(bucket, archive_id, database, table),
+            transformation_ctx=f"{table}_lobs",
+        )
+        source_mappings = mappings + [
+            (f"{column}{LOB_REF_SUFFIX}", "string", f"{column}{LOB_REF_SUFFIX}", "string")
+            for column in lobs["columns"]]
+
+    mapped = ApplyMapping.apply(
+        frame=source,
+        mappings=source_mappings,
+        transformation_ctx=f"{table}_mapping",
+    )
+
+    partition = spec.get("partition") or {}
+    keys = partition_keys(partition)
+    path = table_path(bucket, archive_id, database, table)
+
+    partitioned = add_partition_column(
+        glue_context,
+        frame=mapped,
+        partition=partition,
+        transformation_ctx=f"{table}_partition",
+    )
+
+    data_frame = partitioned.toDF()
+    spec_hash = hash_spec(mappings, full_split, spec.get("hash_columns") or [])
+    # Tables of different schemas can share a name within a run.
+    observation = Observation(f"{table}_metrics_{uuid.uuid4().hex}")
+    before = {key for key, _ in data_objects(path)}
+
+    observed = data_frame.observe(
+        observation, *metric_aggregates(data_frame), *hash_aggregates(spec_hash))
+    write_parquet(
+        observed,
+        path=path,
+        compression=compression,
+        keys=keys,
+        layout=spec.get("layout") or {},
+    )
+    values = observation.get
+    metrics = frame_metrics(data_frame.schema.fields, values)
+    metrics["content_hash"] = dict(spec_hash, buckets=hash_buckets(spec_hash, values))
+
+    register_partitions(
+        catalog_database=f"{archive_id}-{database}-database",
+        catalog_table=f"{archive_id}-{database}-{table}-table",
+        path=path,
+        keys=keys,
+    )
+
+    files = written_files(glue_context, path, before)
+    if values.get("hash_rows_outside") and files:
+        # Buckets past the bounds are not known up front, so their rows are
+        # hashed from the files just written.
+        written = glue_context.spark_session.read.option("basePath", path).parquet(
+            *[f"s3://{bucket}/{file['key']}" for file in files])
+        metrics["content_hash"]["buckets"].update(
+            content_hash(written.where(outside_buckets(spec_hash)), spec_hash)["buckets"])
+    return dict(
+        metrics,
+        watermark=watermark,
+        split_bounds=full_split.get("bounds_read"),
+        output_bytes=sum(file["bytes"] for file in files),
+        files=files,
+    )
+
+
+def archive_tables(glue_context, connection_name, connection_type, bucket, archive_id,
+                   database, compression, specs, concurrency, job_run_id):
+    """Archive several tables in one Spark session, concurrency of them at a time.
+
+    Each table writes its own manifest as if it had its own job run, and a
+    failed table does not stop the others. Returns the status of every
+    table, in the order of specs. Tables are written under a prefix named
+    after the table alone, so specs naming a table twice are rejected.
+    """
+
+    names = [spec["table"] for spec in specs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Tables named more than once in one run: {', '.join(duplicates)}")
+
+    def run(spec):
+        try:
+            manifest = archive_table(glue_context, connection_name, connection_type, bucket,
+                                     archive_id, database, compression, spec)
+            write_manifest(table_path(bucket, archive_id, database, spec["table"]),
+                           job_run_id, manifest)
+            # The run's status keeps the table's manifest out of the archive record.
+            return {"table": spec["table"], "state": "SUCCEEDED", "message": "",
+                    "watermark": manifest["watermark"], "rows": manifest["rows"],
+                    "split_bounds": manifest["split_bounds"]}
+        except Exception as ex:
+            traceback.print_exc()
+            return {"table": spec["table"], "state": "FAILED", "message": str(ex)[:1000]}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(run, specs))
+
+
+def read_json(path):
+    """Read a JSON document from an s3:// path."""
+
+    bucket, _, key = path[len("s3://"):].partition("/")
+    return json.loads(boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def write_manifest(path, job_run_id, manifest):
+    """Write the run's manifest to _manifests/<job run id>.json under path.
+
+    The glue job status function reads it when the run succeeds. Spark and
+    Athena skip the _manifests prefix when reading the table.
+    """
+
+    bucket, _, prefix = path[len("s3://"):].partition("/")
+    body = json.dumps(manifest).encode("utf-8")
+    # Puts to a bucket with Object Lock need a Content-MD5.
+    boto3.client("s3").put_object(
+        Bucket=bucket,
+        Key=f"{prefix}_manifests/{job_run_id}.json",
+        Body=body,
+        ContentMD5=base64.b64encode(hashlib.md5(body).digest()).decode("ascii"),
+        ContentType="application/json",
+    )
+
+
+def written_partitions(path, keys):
+    """List the (values, location) of each partition under path from its key=value/ prefixes."""
+
+    bucket, _, prefix = path[len("s3://"):].partition("/")
+    s3 = boto3.client("s3")
+    paginator = s3.get_paginator("list_objects_v2")
+
+    prefixes = [prefix]
+    for key in keys:
+        found = []
+        for parent in prefixes:
+            for page in paginator.paginate(Bucket=bucket, Prefix=parent + key + "=", Delimiter="/"):
+                found.extend(entry["Prefix"] for entry in page.get("CommonPrefixes", []))
+        prefixes = found
+
+    return [([unquote(part.split("=", 1)[1]) for part in entry[len(prefix):].strip("/").split("/")],
+             f"s3://{bucket}/{entry}")
+            for entry in prefixes]
+
+
+def register_partitions(catalog_database, catalog_table, path, keys):
+    """Add the partitions written under path to the Glue table.
+
+    Partitions registered by an earlier run are left as they are. Rows
+    with a null partition value land in Spark's __HIVE_DEFAULT_PARTITION__,
+    which is registered like any other value so those rows stay queryable.
+    """
+
+    if not keys:
+        return
+
+    glue = boto3.client("glue")
+    storage = glue.get_table(DatabaseName=catalog_database, Name=catalog_table)["Table"]["StorageDescriptor"]
+
+    partitions = [{"Values": values, "StorageDescriptor": dict(storage, Location=location)}
+                  for values, location in written_partitions(path, keys)]
+
+    for start in range(0, len(partitions), PARTITION_BATCH_SIZE):
+        response = glue.batch_create_partition(
+            DatabaseName=catalog_database,
+            TableName=catalog_table,
+            PartitionInputList=partitions[start:start + PARTITION_BATCH_SIZE],
+        )
+        for error in response.get("Errors", []):
+            if error["ErrorDetail"]["ErrorCode"] != "AlreadyExistsException":
+                raise RuntimeError(f"Could not register partition {error['PartitionValues']}: "
+                                   f"{error['ErrorDetail']['ErrorMessage']}")
+
+
+def data_objects(path):
+    """List the (key, size) of the data files under path.
+
+    Files and prefixes whose name starts with _ or . are skipped, as Spark
+    does when reading the table.
+    """
+
+    bucket, _, prefix = path[len("s3://"):].partition("/")
+    paginator = boto3.client("s3").get_paginator("list_objects_v2")
+
+    objects = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for entry in page.get("Contents", []):
+            parts = entry["Key"][len(prefix):].split("/")
+            if entry["Key"].endswith("/") or any(part.startswith(("_", ".")) for part in parts):
+                continue
+            objects.append((entry["Key"], entry["Size"]))
+    return objects
+
+
+def legal_holds(s3, bucket, keys):
+    """Return the keys of bucket that are under legal hold."""
+
+    def held(key):
+        try:
+            return s3.get_object_legal_hold(Bucket=bucket, Key=key)["LegalHold"]["Status"] == "ON"
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] != "NoSuchObjectLockConfiguration":
+                raise
+            return False
+
+    with ThreadPoolExecutor(max_workers=S3_CALL_CONCURRENCY) as executor:
+        return [key for key, on in zip(keys, executor.map(held, keys)) if on]
+
+
+def compact(glue_context, path, keys, compression, target_file_mb, layout=None):
+    """Rewrite the Parquet files under path into files of about target_file_mb.
+
+    The new files keep the bucketing, sort order and Parquet tuning of
+    layout, as the table's catalog entry records them. They are written to
+    a staging prefix first and swapped in one partition at a time: the
+    partition's new files are copied in and its old files deleted right
+    after, so a query sees a partition's rows twice only while its swap
+    runs, not for the whole rewrite. On a versioned bucket the old files
+    remain as noncurrent versions. Nothing is rewritten if any of the old
+    files is under legal hold.
+    """
+
+    bucket = path[len("s3://"):].partition("/")[0]
+    s3 = boto3.client("s3")
+
+    objects = data_objects(path)
+    if not objects:
+        return
+
+    held = legal_holds(s3, bucket, [key for key, _ in objects])
+    if held:
+        raise RuntimeError(f"{path} has {len(held)} files under legal hold, such as {held[0]}, "
+                           "and cannot be compacted")
+
+    total_bytes = sum(size for _, size in objects)
+    files = max(1, math.ceil(total_bytes / (target_file_mb * 1024 * 1024)))
+
+    spark = glue_context.spark_session
+    # Keep partition values as the strings they were written as.
+    spark.conf.set("spark.sql.sources.partitionColumnTypeInference.enabled", "false")
+    data_frame = (spark.read.option("basePath", path)
+                  .parquet(*[f"s3://{bucket}/{key}" for key, _ in objects]))
+
+    layout = layout or {}
+    records_per_file = max(1, math.ceil(data_frame.count() / files))
+    data_frame = bucket_files(data_frame, keys, layout, files)
+    writer = parquet_writer(data_frame, compression, records_per_file, layout)
+    staged, moves = stage_files(writer, path, keys, bucketed=bool(layout.get("bucket")))
+
+    old_files, new_files = {}, {}
+    for key, _ in objects:
+        old_files.setdefault(key.rpartition("/")[0], []).append(key)
+    for move in moves:
+        new_files.setdefault(move[1].rpartition("/")[0], []).append(move)
+
+    def swap(partition):
+        for staged_key, target in new_files.get(partition, []):
+            s3.copy({"Bucket": bucket, "Key": staged_key}, bucket, target)
+        delete_keys(s3, bucket, old_files.get(partition, []))
+
+    with ThreadPoolExecutor(max_workers=S3_CALL_CONCURRENCY) as executor:
+        list(executor.map(swap, sorted(set(old_files) | set(new_files))))
+    delete_keys(s3, bucket, staged)
\ No newline at end of file
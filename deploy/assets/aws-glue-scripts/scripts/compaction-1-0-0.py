@@ -0,0 +1,58 @@
+""" 
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+import sys
+import json
+import boto3
+from awsglue.utils import getResolvedOptions
+from pyspark.context import SparkContext
+from awsglue.context import GlueContext
+from awsglue.job import Job
+import archive_glue
+
+
+args = getResolvedOptions(
+    sys.argv, ["JOB_NAME", "TABLE", "BUCKET", "DATABASE", "ARCHIVE_ID", "TARGET_FILE_MB"])
+sc = SparkContext()
+glueContext = GlueContext(sc)
+spark = glueContext.spark_session
+job = Job(glueContext)
+job.init(args["JOB_NAME"], args)
+
+path = "s3://" + args["BUCKET"] + "/" + args["ARCHIVE_ID"] + "/" + args["DATABASE"] + "/" + args["TABLE"] + "/"
+
+# The partition keys, codec, buckets and Parquet layout the table was
+# archived with are on its Glue table. Tables registered before the codec was recorded
+# were written with glueparquet's default, snappy.
+catalog_table = boto3.client("glue").get_table(
+    DatabaseName=args["ARCHIVE_ID"] + "-" + args["DATABASE"] + "-database",
+    Name=args["ARCHIVE_ID"] + "-" + args["DATABASE"] + "-" + args["TABLE"] + "-table",
+)["Table"]
+
+layout = json.loads(catalog_table.get("Parameters", {}).get("archive.parquet_layout", "{}"))
+storage = catalog_table["StorageDescriptor"]
+if storage.get("BucketColumns"):
+    layout["bucket"] = {"column": storage["BucketColumns"][0], "buckets": storage["NumberOfBuckets"]}
+
+archive_glue.compact(
+    glueContext,
+    path=path,
+    keys=[key["Name"] for key in catalog_table.get("PartitionKeys", [])],
+    compression=catalog_table.get("Parameters", {}).get("parquet.compression", "snappy").lower(),
+    target_file_mb=int(args["TARGET_FILE_MB"]),
+    layout=layout,
+)
+
+job.commit()
@@ -15,78 +15,49 @@ permissions and limitations under the License.
 
 import sys
 import json
-from awsglue.transforms import *
 from awsglue.utils import getResolvedOptions
 from pyspark.context import SparkContext
 from awsglue.context import GlueContext
 from awsglue.job import Job
-from awsglue.dynamicframe import DynamicFrame
+import archive_glue
 
 
-def directJDBCSource(
-    glueContext,
-    connectionName,
-    connectionType,
-    database,
-    table,
-    redshiftTmpDir,
-    transformation_ctx,
-) -> DynamicFrame:
-
-    connection_options = {
-        "useConnectionProperties": "true",
-        "dbtable": table,
-        "connectionName": connectionName,
-    }
-
-    if redshiftTmpDir:
-        connection_options["redshiftTmpDir"] = redshiftTmpDir
-
-    return glueContext.create_dynamic_frame.from_options(
-        connection_type=connectionType,
-        connection_options=connection_options,
-        transformation_ctx=transformation_ctx,
-    )
-
-
-args = getResolvedOptions(sys.argv, ["JOB_NAME", "TABLE", "BUCKET", "DATABASE", "ARCHIVE_ID", "MAPPINGS", "CONNECTION", "MSSQL_SCHEMA"])
+args = getResolvedOptions(
+    sys.argv, ["JOB_NAME", "JOB_RUN_ID", "TABLE", "BUCKET", "DATABASE", "ARCHIVE_ID", "MAPPINGS", "CONNECTION", "MSSQL_SCHEMA",
+               "SPLIT", "COMPRESSION", "PARTITION", "LAYOUT", "ROW_FILTER", "INCREMENTAL",
+               "LOBS", "HASH_COLUMNS"])
 sc = SparkContext()
 glueContext = GlueContext(sc)
 spark = glueContext.spark_session
 job = Job(glueContext)
 job.init(args["JOB_NAME"], args)
 
-# Script generated for node SQL Server table
-SQLServertable_node1 = directJDBCSource(
+manifest = archive_glue.archive_table(
     glueContext,
-    connectionName=args["CONNECTION"],
-    connectionType="sqlserver",
+    connection_name=args["CONNECTION"],
+    connection_type="sqlserver",
+    bucket=args["BUCKET"],
+    archive_id=args["ARCHIVE_ID"],
     database=args["DATABASE"],
-    table=str(args["MSSQL_SCHEMA"]) + "." + str(args["TABLE"]),
-    redshiftTmpDir="",
-    transformation_ctx="SQLServertable_node1",
-)
-
-# Script generated for node ApplyMapping
-tuples = list(map(tuple, json.loads(args["MAPPINGS"])))
-
-ApplyMapping_node2 = ApplyMapping.apply(
-    frame=SQLServertable_node1,
-    mappings=tuples,
-    transformation_ctx="ApplyMapping_node2",
+    compression=args["COMPRESSION"],
+    spec={
+        "table": args["TABLE"],
+        "dbtable": str(args["MSSQL_SCHEMA"]) + "." + str(args["TABLE"]),
+        "mappings": json.loads(args["MAPPINGS"]),
+        "split": archive_glue.parse_split(args["SPLIT"]),
+        "partition": archive_glue.parse_partition(args["PARTITION"]),
+        "layout": archive_glue.parse_layout(args["LAYOUT"]),
+        "row_filter": archive_glue.parse_row_filter(args["ROW_FILTER"]),
+        "incremental": archive_glue.parse_incremental(args["INCREMENTAL"]),
+        "lobs": archive_glue.parse_lobs(args["LOBS"]),
+        "hash_columns": archive_glue.parse_hash_columns(args["HASH_COLUMNS"]),
+    },
 )
 
-# Script generated for node S3 bucket
-S3bucket_node3 = glueContext.write_dynamic_frame.from_options(
-    frame=ApplyMapping_node2,
-    connection_type="s3",
-    format="glueparquet",
-    connection_options={
-        "path": "s3://" + args["BUCKET"] + "/" + args["ARCHIVE_ID"] + "/" + args["DATABASE"] + "/" + args["TABLE"] + "/",
-        "partitionKeys": [],
-    },
-    format_options={"compression": "uncompressed"},
-    transformation_ctx="S3bucket_node3",
+archive_glue.write_manifest(
+    archive_glue.table_path(args["BUCKET"], args["ARCHIVE_ID"], args["DATABASE"], args["TABLE"]),
+    args["JOB_RUN_ID"],
+    manifest,
 )
 
 job.commit()
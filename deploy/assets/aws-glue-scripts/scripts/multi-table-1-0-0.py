@@ -0,0 +1,62 @@
+""" 
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+import sys
+from awsglue.utils import getResolvedOptions
+from pyspark import SparkConf
+from pyspark.context import SparkContext
+from awsglue.context import GlueContext
+from awsglue.job import Job
+import archive_glue
+
+
+args = getResolvedOptions(
+    sys.argv, ["JOB_NAME", "JOB_RUN_ID", "ENGINE", "BUCKET", "DATABASE", "ARCHIVE_ID", "CONNECTION",
+               "COMPRESSION", "TABLES_PATH", "CONCURRENCY"])
+# Tables read concurrently share the executors instead of queueing behind
+# each other.
+sc = SparkContext(conf=SparkConf().set("spark.scheduler.mode", "FAIR"))
+glueContext = GlueContext(sc)
+spark = glueContext.spark_session
+job = Job(glueContext)
+job.init(args["JOB_NAME"], args)
+
+# The tables and their job arguments, one object per table, written by
+# step nine.
+statuses = archive_glue.archive_tables(
+    glueContext,
+    connection_name=args["CONNECTION"],
+    connection_type=args["ENGINE"],
+    bucket=args["BUCKET"],
+    archive_id=args["ARCHIVE_ID"],
+    database=args["DATABASE"],
+    compression=args["COMPRESSION"],
+    specs=archive_glue.read_json(args["TABLES_PATH"]),
+    concurrency=int(args["CONCURRENCY"]),
+    job_run_id=args["JOB_RUN_ID"],
+)
+
+# The glue job status function reports each table's status from this manifest.
+archive_glue.write_manifest(
+    "s3://" + args["BUCKET"] + "/" + args["ARCHIVE_ID"] + "/" + args["DATABASE"] + "/",
+    args["JOB_RUN_ID"],
+    {"tables": statuses},
+)
+
+failed = [status["table"] for status in statuses if status["state"] == "FAILED"]
+if failed:
+    raise RuntimeError(f"Could not archive tables: {', '.join(failed)}")
+
+job.commit()
@@ -503,6 +503,19 @@ export class AppStack extends cdk.Stack {
             resources: [`${s3ArchiveDataGlueBucket.bucket.bucketArn}/*`],
         });
 
+        // Reading the manifests the archive jobs write next to the data.
+        const s3ManifestReadPolicy = new iam.PolicyStatement({
+            actions: ["s3:GetObject"],
+            resources: [
+                `${s3ArchiveDataGlueBucket.bucket.bucketArn}/*/_manifests/*`,
+            ],
+        });
+
+        const s3ManifestListPolicy = new iam.PolicyStatement({
+            actions: ["s3:ListBucket"],
+            resources: [s3ArchiveDataGlueBucket.bucket.bucketArn],
+        });
+
         const glueCatalogPolicy = new iam.PolicyStatement({
             actions: ["glue:GetTable"],
             resources: [`arn:aws:glue:us-east-1:${awsAccountId}:catalog`],
@@ -542,12 +555,15 @@ export class AppStack extends cdk.Stack {
                 "glue:GetConnection",
                 "glue:CreateConnection",
                 "glue:CreateJob",
+                "glue:GetJob",
+                "glue:UpdateJob",
                 "iam:PassRole",
                 "glue:StartJobRun",
                 "glue:BatchStopJobRun",
                 "glue:DeleteJob",
                 "glue:CreateDatabase",
                 "glue:CreateTable",
+                "glue:UpdateTable",
                 "glue:GetDatabase",
                 "glue:GetTable",
                 "glue:GetJobRun",
@@ -584,6 +600,44 @@ export class AppStack extends cdk.Stack {
          * AWS IAM Policy Statements
          */
 
+        /*
+         * Shared source database connector, with the drivers, used by
+         * every Lambda function that connects to a source database.
+         */
+
+        const sourceConnectorLayer = new lambdaPython.PythonLayerVersion(
+            this,
+            "SourceConnectorLayer",
+            {
+                entry: "../layers/source-connector",
+                compatibleRuntimes: [cdk.aws_lambda.Runtime.PYTHON_3_9],
+                description: "Source database connector with connection pooling",
+            }
+        );
+
+        /*
+         * Manifest reading and the source side of the content hash, shared
+         * by the validation functions and the small table extractor so
+         * their checks cannot drift apart.
+         */
+
+        const archiveValidationLayer = new lambdaPython.PythonLayerVersion(
+            this,
+            "ArchiveValidationLayer",
+            {
+                entry: "../layers/archive-validation",
+                compatibleRuntimes: [cdk.aws_lambda.Runtime.PYTHON_3_9],
+                description: "Archive manifests and content hashing for validation",
+            }
+        );
+
+        // Connect and read timeouts for the API functions, which have 30
+        // seconds to answer.
+        const sourceConnectorEnvironment = {
+            SOURCE_CONNECT_TIMEOUT_SECONDS: "5",
+            SOURCE_READ_TIMEOUT_SECONDS: "25",
+        };
+
         /*
          * START
          * Test Connection & Get Database Schema.
@@ -634,7 +688,8 @@ export class AppStack extends cdk.Stack {
                 index: "main.py",
                 entry: "../api/archive/source/test-connection",
                 timeout: cdk.Duration.seconds(30),
-                environment: {},
+                layers: [sourceConnectorLayer],
+                environment: sourceConnectorEnvironment,
             }
         );
 
@@ -679,7 +734,8 @@ export class AppStack extends cdk.Stack {
                 index: "main.py",
                 entry: "../api/archive/source/get-schema",
                 timeout: cdk.Duration.seconds(30),
-                environment: {},
+                layers: [sourceConnectorLayer],
+                environment: sourceConnectorEnvironment,
             }
         );
 
@@ -699,7 +755,8 @@ export class AppStack extends cdk.Stack {
                 index: "main.py",
                 entry: "../api/archive/source/list-schemas",
                 timeout: cdk.Duration.seconds(30),
-                environment: {},
+                layers: [sourceConnectorLayer],
+                environment: sourceConnectorEnvironment,
             }
         );
 
@@ -1077,6 +1134,51 @@ export class AppStack extends cdk.Stack {
             }
         );
 
+        // Archives small tables without Spark; step nine routes them here.
+        const smallTableExtractFn = new lambdaPython.PythonFunction(
+            this,
+            "SmallTableExtractFn",
+            {
+                vpc: vpc,
+                securityGroups: [rdsSecurityGroup],
+                vpcSubnets: {
+                    subnetType: ec2.SubnetType.PRIVATE_WITH_EGRESS,
+                },
+                allowPublicSubnet: true,
+                runtime: cdk.aws_lambda.Runtime.PYTHON_3_9,
+                handler: "lambda_handler",
+                index: "small-table-extract.py",
+                entry: "../step-functions/small-table-extract",
+                timeout: cdk.Duration.minutes(15),
+                memorySize: 2048,
+                ephemeralStorageSize: cdk.Size.gibibytes(2),
+                layers: [sourceConnectorLayer, archiveValidationLayer],
+                environment: {
+                    SOURCE_READ_TIMEOUT_SECONDS: "600",
+                },
+            }
+        );
+
+        smallTableExtractFn.role?.attachInlinePolicy(
+            new iam.Policy(this, "SmallTableExtractFnPolicy", {
+                statements: [
+                    dynamoDbReadOnlyPolicy,
+                    ssmGetParameterPolicy,
+                    secretsmanagerGetSecretValue,
+                    new iam.PolicyStatement({
+                        actions: ["s3:PutObject"],
+                        resources: [`${s3ArchiveDataGlueBucket.bucket.bucketArn}/*`],
+                    }),
+                    new iam.PolicyStatement({
+                        actions: ["events:PutEvents"],
+                        resources: [
+                            `arn:aws:events:${this.region}:${awsAccountId}:event-bus/default`,
+                        ],
+                    }),
+                ],
+            })
+        );
+
         const stepFunctionGlueStepNine = new lambdaPython.PythonFunction(
             this,
             "StepFunctionGlueStepNine",
@@ -1088,10 +1190,13 @@ export class AppStack extends cdk.Stack {
                 timeout: cdk.Duration.minutes(5),
                 environment: {
                     REGION: awsRegion,
+                    SMALL_TABLE_EXTRACT_FUNCTION: smallTableExtractFn.functionName,
                 },
             }
         );
 
+        smallTableExtractFn.grantInvoke(stepFunctionGlueStepNine);
+
         stepFunctionGlueStepOne.role?.attachInlinePolicy(
             new iam.Policy(this, "StepFunctionGlueStepOnePolicy", {
                 statements: [
@@ -1168,6 +1273,10 @@ export class AppStack extends cdk.Stack {
                     ssmGetParameterPolicy,
                     awsGluePolicy,
                     awsGluePolicyTest,
+                    new iam.PolicyStatement({
+                        actions: ["s3:PutObject"],
+                        resources: [`${s3AwsGlueTempBucket.bucket.bucketArn}/archives/*`],
+                    }),
                 ],
             })
         );
@@ -1292,6 +1401,29 @@ export class AppStack extends cdk.Stack {
             destinationBucket: s3GlueAssetBucket.bucket,
         });
 
+        // Rewrites an archived table's files into right-sized ones in place.
+        // Run it with --ARCHIVE_ID, --DATABASE and --TABLE of the table.
+        new cdk.aws_glue.CfnJob(this, "ArchiveCompactionJob", {
+            name: "archive-compaction",
+            role: awsGlueRole.roleArn,
+            command: {
+                name: "glueetl",
+                scriptLocation: `s3://${s3GlueAssetBucket.bucketName}/scripts/compaction-1-0-0.py`,
+                pythonVersion: "3",
+            },
+            defaultArguments: {
+                "--TempDir": `s3://${s3AwsGlueTempBucket.bucketName}/temp/`,
+                "--job-bookmark-option": "job-bookmark-disable",
+                "--extra-py-files": `s3://${s3GlueAssetBucket.bucketName}/lib/archive_glue.py`,
+                "--BUCKET": s3ArchiveDataGlueBucket.bucketName,
+                "--TARGET_FILE_MB": "128",
+            },
+            maxRetries: 0,
+            glueVersion: "4.0",
+            workerType: "G.1X",
+            numberOfWorkers: 2,
+        });
+
         /*
          * END
          * AWS Glue Step Functions
@@ -1351,6 +1483,7 @@ export class AppStack extends cdk.Stack {
                 index: "count-validation.py",
                 entry: "../step-functions/validation",
                 timeout: cdk.Duration.minutes(5),
+                layers: [archiveValidationLayer],
                 environment: {},
             }
         );
@@ -1363,6 +1496,7 @@ export class AppStack extends cdk.Stack {
                     awsGluePolicy,
                     dynamoDbWritePolicy,
                     dynamoDbReadOnlyPolicy,
+                    sqsPolicy,
                 ],
             })
         );
@@ -1489,7 +1623,10 @@ export class AppStack extends cdk.Stack {
                 index: "checksum-validation.py",
                 entry: "../step-functions/validation",
                 timeout: cdk.Duration.minutes(5),
-                environment: {},
+                layers: [sourceConnectorLayer, archiveValidationLayer],
+                environment: {
+                    SOURCE_READ_TIMEOUT_SECONDS: "270",
+                },
             }
         );
 
@@ -1501,6 +1638,8 @@ export class AppStack extends cdk.Stack {
                     dynamoDbReadOnlyPolicy,
                     athenaPolicy,
                     secretsmanagerGetSecretValue,
+                    s3ManifestReadPolicy,
+                    s3ManifestListPolicy,
                 ],
             })
         );
@@ -1632,6 +1771,7 @@ export class AppStack extends cdk.Stack {
                 timeout: cdk.Duration.seconds(30),
                 environment: {
                     ARCHIVE_TABLE: archiveTable.tableName,
+                    ARCHIVE_BUCKET: s3ArchiveDataGlueBucket.bucketName,
                     VALIDATION_STATE_MACHINE: validationStateMachine.stateMachineArn,
                 },
             }
@@ -1659,6 +1799,8 @@ export class AppStack extends cdk.Stack {
                     awsGluePolicy,
                     awsGluePolicyTest,
                     stateMachinePolicy,
+                    s3ManifestReadPolicy,
+                    s3ManifestListPolicy,
                 ],
             })
         );
@@ -1701,7 +1843,9 @@ export class AppStack extends cdk.Stack {
 
         new cdk.aws_events.Rule(this, `GlueJobStatusRule`, {
             eventPattern: {
-                source: [`aws.glue`],
+                // The small table extract function reports its runs as
+                // Glue job state changes too.
+                source: [`aws.glue`, `simple-database-archival.extractor`],
                 detailType: ["Glue Job State Change"],
             },
             targets: [new cdk.aws_events_targets.LambdaFunction(glueJobStatusFn)],
@@ -1863,7 +2007,10 @@ export class AppStack extends cdk.Stack {
                 index: "main.py",
                 entry: "../api/archive/validate-checksum",
                 timeout: cdk.Duration.minutes(15),
-                environment: {},
+                layers: [sourceConnectorLayer, archiveValidationLayer],
+                environment: {
+                    SOURCE_READ_TIMEOUT_SECONDS: "600",
+                },
             }
         );
 
@@ -1882,6 +2029,8 @@ export class AppStack extends cdk.Stack {
                     dynamoDbReadOnlyPolicy,
                     athenaPolicy,
                     secretsmanagerGetSecretValue,
+                    s3ManifestReadPolicy,
+                    s3ManifestListPolicy,
                 ],
             })
         );
@@ -21,12 +21,68 @@ import json
 
 dynamodb_client = boto3.resource('dynamodb', region_name='us-east-1')
 glue_client = boto3.client('glue', region_name='us-east-1')
+s3_client = boto3.client('s3')
 step_functions_client = boto3.client('stepfunctions')
 
 ARCHIVE_TABLE = os.environ["ARCHIVE_TABLE"]
+ARCHIVE_BUCKET = os.environ["ARCHIVE_BUCKET"]
 VALIDATION_STATE_MACHINE = os.environ["VALIDATION_STATE_MACHINE"]
 
 
+def read_manifest(prefix, job_run_id):
+    """
+    Reads the manifest a Glue job run wrote under prefix, the prefix of its
+    table or, for runs that archive every table, of its database.
+
+    Returns an empty manifest for runs of scripts that do not write one.
+    """
+
+    try:
+        response = s3_client.get_object(
+            Bucket=ARCHIVE_BUCKET,
+            Key=f"{prefix}_manifests/{job_run_id}.json",
+        )
+    except s3_client.exceptions.NoSuchKey:
+        return {}
+    return json.loads(response["Body"].read())
+
+
+def store_watermark(table, item, archive_id, table_name, watermark):
+    """
+    Stores the watermark an incremental run reached on its table, so the
+    next run starts from it.
+    """
+
+    if not watermark:
+        return
+    for index, table_details in enumerate(item["table_details"]):
+        if table_details["table"] == table_name:
+            table.update_item(
+                Key={'id': archive_id},
+                UpdateExpression=f'SET table_details[{index}].watermark = :w',
+                ExpressionAttributeValues={':w': watermark},
+            )
+
+
+def store_split_bounds(table, item, archive_id, table_name, bounds):
+    """
+    Stores the split key bounds a run read at the source on its table, so
+    later runs read and content hash the same ranges.
+    """
+
+    if not bounds:
+        return
+    for index, table_details in enumerate(item["table_details"]):
+        split_key = table_details.get("split_key") or {}
+        if table_details["table"] == table_name and split_key.get("column") == bounds["column"]:
+            table.update_item(
+                Key={'id': archive_id},
+                UpdateExpression=(f'SET table_details[{index}].split_key.lower = :l, '
+                                  f'table_details[{index}].split_key.upper = :u'),
+                ExpressionAttributeValues={':l': bounds["lower"], ':u': bounds["upper"]},
+            )
+
+
 def update_job_state(
     archive_id,
     job_run_id,
@@ -96,6 +152,40 @@ def update_job_state(
     return result
 
 
+def start_validation(table, archive_id, table_name):
+    """
+    Starts the validation state machine for an archived table.
+    """
+
+    return_table = {
+        "table": {
+            "schema": []
+        }
+    }
+
+    dynamodb_updated_response = table.get_item(Key={"id": archive_id})
+    for table_details in dynamodb_updated_response["Item"]["table_details"]:
+        if (table_details["table"] == table_name):
+            return_table["table"]["archive_id"] = archive_id
+            return_table["table"]["schema"] = table_details["schema"]
+            return_table["table"]["table"] = table_details["table"]
+            return_table["table"]["database"] = (
+                dynamodb_updated_response["Item"]["database"]
+            )
+            return_table["table"]["database_engine"] = (
+                dynamodb_updated_response["Item"]["database_engine"]
+            )
+            return_table["table"]["oracle_owner"] = (
+                dynamodb_updated_response["Item"]["oracle_owner"]
+            )
+
+    step_functions_client.start_execution(
+        stateMachineArn=VALIDATION_STATE_MACHINE,
+        name=str(uuid.uuid4()),
+        input=json.dumps(return_table),
+    )
+
+
 def lambda_handler(event, context):
     """
     Lambda function that handles AWS Glue job state changes and triggers a
@@ -120,16 +210,33 @@ def lambda_handler(event, context):
 
     if ("jobName" in event["detail"]):
         x = event["detail"]["jobName"].split("-")
+        # Jobs not named after an archive, such as archive-compaction,
+        # have no archive record to update.
+        if len(x) < 6:
+            return event
         archive_id = x[0] + "-" + x[1] + "-" + x[2] + "-" + x[3] + "-" + x[4]
 
         table = dynamodb_client.Table(ARCHIVE_TABLE)
         dynamodb_response = table.get_item(Key={"id": archive_id})
 
-        response = glue_client.get_job_run(
-            JobName=event["detail"]["jobName"],
-            RunId=event["detail"]["jobRunId"],
-            PredecessorsIncluded=False
-        )
+        if event["source"] == "aws.glue":
+            response = glue_client.get_job_run(
+                JobName=event["detail"]["jobName"],
+                RunId=event["detail"]["jobRunId"],
+                PredecessorsIncluded=False
+            )
+            started_on = response["JobRun"]["StartedOn"]
+            completed_on = response["JobRun"]["CompletedOn"]
+        else:
+            # Runs of the small table extract function report their own times.
+            started_on = event["detail"]["startedOn"]
+            completed_on = event["detail"]["completedOn"]
+
+        # Runs that archive every table of the archive were recorded with
+        # the list of their tables by step nine.
+        job_run = dynamodb_response["Item"].get("jobs", {}).get(
+            event["detail"]["jobRunId"], {})
+        archive_run = "tables" in job_run
 
         # Set Job State
         update_job_state(
@@ -140,10 +247,28 @@ def lambda_handler(event, context):
             event["detail"]["state"],
             event["time"],
             ARCHIVE_TABLE,
-            response["JobRun"]["StartedOn"],
-            response["JobRun"]["CompletedOn"]
+            started_on,
+            completed_on
         )
 
+        if archive_run:
+            manifest = read_manifest(
+                f'{archive_id}/{dynamodb_response["Item"]["database"]}/',
+                event["detail"]["jobRunId"])
+            # A run that failed before writing its manifest failed every table.
+            statuses = manifest.get("tables") or [
+                {"table": status["table"], "state": event["detail"]["state"],
+                 "message": event["detail"]["message"]}
+                for status in job_run["tables"]]
+            table.update_item(
+                Key={'id': archive_id},
+                UpdateExpression="SET jobs.#job_run_id.tables = :tables",
+                ExpressionAttributeNames={
+                    "#job_run_id": event["detail"]["jobRunId"]
+                },
+                ExpressionAttributeValues={':tables': statuses},
+            )
+
         if (event["detail"]["state"] == 'FAILED'):
             table.update_item(
                 Key={'id': archive_id},
@@ -175,32 +300,27 @@ def lambda_handler(event, context):
                     ReturnValues="UPDATED_NEW"
                 )
 
-            return_table = {
-                "table": {
-                    "schema": []
-                }
-            }
+        if archive_run:
+            # Tables that were archived are validated even when others failed.
+            for status in statuses:
+                if status["state"] == 'SUCCEEDED':
+                    store_watermark(
+                        table, dynamodb_response["Item"], archive_id,
+                        status["table"], status.get("watermark"))
+                    store_split_bounds(
+                        table, dynamodb_response["Item"], archive_id,
+                        status["table"], status.get("split_bounds"))
+                    start_validation(table, archive_id, status["table"])
 
-            dynamodb_updated_response = table.get_item(Key={"id": archive_id})
-            for table in dynamodb_updated_response["Item"]["table_details"]:
-                if (table["table"] == x[6]):
-                    return_table["table"]["archive_id"] = archive_id
-                    return_table["table"]["schema"] = table["schema"]
-                    return_table["table"]["table"] = table["table"]
-                    return_table["table"]["database"] = (
-                        dynamodb_updated_response["Item"]["database"]
-                    )
-                    return_table["table"]["database_engine"] = (
-                        dynamodb_updated_response["Item"]["database_engine"]
-                    )
-                    return_table["table"]["oracle_owner"] = (
-                        dynamodb_updated_response["Item"]["oracle_owner"]
-                    )
-
-            step_functions_client.start_execution(
-                stateMachineArn=VALIDATION_STATE_MACHINE,
-                name=str(uuid.uuid4()),
-                input=json.dumps(return_table),
-            )
+        elif (event["detail"]["state"] == 'SUCCEEDED'):
+            manifest = read_manifest(
+                f'{archive_id}/{x[5]}/{x[6]}/', event["detail"]["jobRunId"])
+            store_watermark(
+                table, dynamodb_response["Item"], archive_id, x[6],
+                manifest.get("watermark"))
+            store_split_bounds(
+                table, dynamodb_response["Item"], archive_id, x[6],
+                manifest.get("split_bounds"))
+            start_validation(table, archive_id, x[6])
 
     return event
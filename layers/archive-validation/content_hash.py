@@ -0,0 +1,163 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+
+Source side of the content hash the archive jobs compute; see content_hash
+in archive_glue.py. Each row's canonical columns are joined by CHAR(31),
+with CHAR(30) for nulls, and the first 56 bits of the MD5 of that UTF-8
+text are summed per bucket of the split key. SQL Server needs 2019 or later
+for the UTF-8 collation, and Oracle rows of more than 4000 bytes of
+canonical text cannot be hashed. hash_columns in job_plan.py picks the
+columns, by source type, that both sides render alike. The small table
+extractor has the source sum its content hash this way too.
+"""
+
+import re
+
+DECIMAL_TYPE = re.compile(r"decimal(?:\((\d+),\s*(\d+)\))?$")
+
+IDENTIFIER_QUOTES = {"mysql": ("`", "`"), "mssql": ("[", "]"), "oracle": ('"', '"')}
+
+
+def quote_identifier(engine, name):
+    open_quote, close_quote = IDENTIFIER_QUOTES[engine]
+    return open_quote + name.replace(close_quote, close_quote * 2) + close_quote
+
+
+def canonical_sql(engine, column, glue_type):
+    """Return the SQL rendering a column the way the archive jobs canonicalize it."""
+
+    match = DECIMAL_TYPE.match(glue_type)
+    scale = int(match.group(2) or 0) if match else 0
+    factor = "1" + "0" * scale
+
+    if engine == "mysql":
+        if match:
+            return f"CAST(CAST(ROUND({column}, {scale}) * {factor} AS DECIMAL(38,0)) AS CHAR)"
+        if glue_type == "boolean":
+            return f"CAST(({column} <> 0) AS CHAR)"
+        if glue_type == "date":
+            return f"DATE_FORMAT({column}, '%Y-%m-%d')"
+        if glue_type == "timestamp":
+            return f"DATE_FORMAT({column}, '%Y-%m-%d %H:%i:%s')"
+        if glue_type in ("string", "varchar"):
+            return column
+        return f"CAST({column} AS CHAR)"
+
+    if engine == "mssql":
+        if match:
+            return f"CONVERT(VARCHAR(40), CONVERT(DECIMAL(38,0), ROUND({column}, {scale}) * {factor}))"
+        if glue_type == "boolean":
+            return f"CONVERT(VARCHAR(1), CONVERT(BIT, {column}))"
+        if glue_type == "date":
+            return f"CONVERT(VARCHAR(10), {column}, 23)"
+        if glue_type == "timestamp":
+            return f"CONVERT(VARCHAR(19), {column}, 120)"
+        if glue_type in ("string", "varchar"):
+            return column
+        return f"CONVERT(VARCHAR(40), {column})"
+
+    if match:
+        return f"TO_CHAR(ROUND({column}, {scale}) * {factor})"
+    if glue_type == "date":
+        return f"TO_CHAR({column}, 'YYYY-MM-DD')"
+    if glue_type == "timestamp":
+        return f"TO_CHAR({column}, 'YYYY-MM-DD HH24:MI:SS')"
+    return f"TO_CHAR({column})"
+
+
+def row_hash_sql(engine, columns):
+    """Return the SQL of a row's 56 bit hash as an exact number."""
+
+    canonical = [canonical_sql(engine, quote_identifier(engine, name), glue_type)
+                 for name, glue_type in columns]
+
+    if engine == "mysql":
+        row = "CONCAT_WS(CHAR(31 USING utf8mb4), {})".format(", ".join(
+            f"COALESCE(CONVERT({expression} USING utf8mb4), CHAR(30 USING utf8mb4))"
+            for expression in canonical))
+        return f"CAST(CONV(SUBSTRING(MD5({row}), 1, 14), 16, 10) AS UNSIGNED)"
+
+    if engine == "mssql":
+        row = " + NCHAR(31) + ".join(
+            f"COALESCE(CONVERT(NVARCHAR(MAX), {expression}), NCHAR(30))" for expression in canonical)
+        utf8 = f"CONVERT(VARCHAR(MAX), ({row} COLLATE Latin1_General_100_BIN2_UTF8))"
+        return f"CONVERT(DECIMAL(38,0), CONVERT(BIGINT, SUBSTRING(HASHBYTES('MD5', {utf8}), 1, 7)))"
+
+    row = " || CHR(31) || ".join(f"NVL({expression}, CHR(30))" for expression in canonical)
+    return (f"TO_NUMBER(SUBSTR(RAWTOHEX(STANDARD_HASH({row}, 'MD5')), 1, 14), "
+            f"'XXXXXXXXXXXXXX')")
+
+
+def bucket_sql(engine, bucket):
+    """Return the SQL of a row's bucket, the truncated quotient of its key offset."""
+
+    column = quote_identifier(engine, bucket["column"])
+    lower, width = int(bucket["lower"]), int(bucket["width"])
+    if engine == "mysql":
+        return f"(CAST({column} AS SIGNED) - {lower}) DIV {width}"
+    if engine == "mssql":
+        return f"(CONVERT(BIGINT, {column}) - {lower}) / {width}"
+    return f"TRUNC(({column} - {lower}) / {width})"
+
+
+def source_hash(connection, engine, relation, row_filter, spec):
+    """Compute the content hash of the source rows the archive holds.
+
+    spec is the content hash of the archive without its buckets. Returns
+    the rows and hash sum of each bucket, labelled like the archive's.
+    """
+
+    # Without a bucket every row is in bucket 0, and GROUP BY a constant
+    # is not valid everywhere.
+    bucket = bucket_sql(engine, spec["bucket"]) if spec.get("bucket") else "0"
+    query = (f"SELECT {bucket}, COUNT(*), SUM({row_hash_sql(engine, spec['columns'])}) "
+             f"FROM {relation}")
+    if row_filter:
+        query += f" WHERE {row_filter}"
+    if spec.get("bucket"):
+        query += f" GROUP BY {bucket}"
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return {"null" if label is None else str(int(label)): {"rows": int(count), "hash": str(int(total))}
+            for label, count, total in rows if count}
+
+
+def archive_hash(manifests):
+    """Add up the content hashes of a table's extraction runs.
+
+    Returns None when a run has none, or when runs hashed different
+    columns or buckets, as after a schema change.
+    """
+
+    specs = [manifest.get("content_hash") for manifest in manifests]
+    if not specs or any(spec is None for spec in specs):
+        return None
+    if any((spec["columns"], spec["bucket"]) != (specs[0]["columns"], specs[0]["bucket"])
+           for spec in specs):
+        return None
+
+    buckets = {}
+    for spec in specs:
+        for label, totals in spec["buckets"].items():
+            total = buckets.setdefault(label, {"rows": 0, "hash": 0})
+            total["rows"] += int(totals["rows"])
+            total["hash"] += int(totals["hash"])
+    return {"columns": specs[0]["columns"], "bucket": specs[0]["bucket"],
+            "buckets": {label: {"rows": total["rows"], "hash": str(total["hash"])}
+                        for label, total in buckets.items()}}
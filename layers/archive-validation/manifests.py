@@ -0,0 +1,54 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+import json
+
+import boto3
+
+s3 = boto3.client('s3')
+
+
+def read_manifests(bucket, archive_id, database, table):
+    """
+    Reads the manifests the extraction runs of a table wrote.
+
+    Every Glue job run and small table extract writes one under the
+    table's _manifests/ prefix, with the rows it wrote, each column's
+    metrics and the Parquet files it added.
+
+    Returns the manifests, or None when the table has none or one of them
+    predates the row counts, in which case only a scan of the archive can
+    tell what it holds.
+    """
+
+    prefix = f"{archive_id}/{database}/{table}/_manifests/"
+    manifests = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for entry in page.get("Contents", []):
+            manifest = json.loads(
+                s3.get_object(Bucket=bucket, Key=entry["Key"])["Body"].read())
+            if "rows" not in manifest:
+                return None
+            manifests.append(manifest)
+    return manifests or None
+
+
+def archived_rows(bucket, archive_id, database, table):
+    """Returns the rows the table's extraction runs wrote, or None when unknown."""
+
+    manifests = read_manifests(bucket, archive_id, database, table)
+    if manifests is None:
+        return None
+    return sum(int(manifest["rows"]) for manifest in manifests)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The layer's modules are imported from its root, as Lambda lays them out,
+# next to job_plan, which picks the columns they hash, and the Glue jobs'
+# archive_glue, which hashes the archived side.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPOSITORY = os.path.dirname(os.path.dirname(ROOT))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(REPOSITORY, "step-functions", "aws-glue-job"))
+sys.path.insert(2, os.path.join(REPOSITORY, "deploy", "assets", "aws-glue-scripts", "lib"))
@@ -0,0 +1,104 @@
+import datetime
+import decimal
+
+import pytest
+
+import content_hash
+import job_plan
+
+MOMENT = datetime.datetime(2024, 1, 2, 3, 4, 5, 123456)
+
+# Columns of each engine, with a value and the canonical text both sides
+# must render it as, or None for columns left out of the hash.
+CASES = [
+    ("mssql", "float", "string", 1.5e10, None),
+    ("mssql", "real", "string", 1.5, None),
+    ("mssql", "datetime2", "string", MOMENT, None),
+    ("mssql", "datetimeoffset", "string", MOMENT, None),
+    ("mssql", "smalldatetime", "string", MOMENT, None),
+    ("mssql", "time", "timestamp", MOMENT.time(), None),
+    ("mssql", "datetime", "timestamp", MOMENT, "2024-01-02 03:04:05"),
+    ("mssql", "date", "date", MOMENT.date(), "2024-01-02"),
+    ("mssql", "money", "decimal(19,4)", decimal.Decimal("-12.3400"), "-123400"),
+    ("mssql", "bit", "boolean", True, "1"),
+    ("mssql", "int", "int", -42, "-42"),
+    ("mssql", "nvarchar", "string", "é", "é"),
+    ("oracle", "BINARY_DOUBLE", "string", 1.5, None),
+    ("oracle", "BINARY_FLOAT", "float", 1.5, None),
+    ("oracle", "CLOB", "string", "text", None),
+    ("oracle", "NCLOB", "string", "text", None),
+    ("oracle", "LONG", "string", "text", None),
+    ("oracle", "TIMESTAMP(6) WITH TIME ZONE", "timestamp", MOMENT, None),
+    ("oracle", "INTERVAL DAY(2) TO SECOND(6)", "string", "+01 00:00:00", None),
+    ("oracle", "DATE", "timestamp", MOMENT.replace(microsecond=0), "2024-01-02 03:04:05"),
+    ("oracle", "TIMESTAMP(6)", "timestamp", MOMENT, "2024-01-02 03:04:05"),
+    ("oracle", "NUMBER", "decimal(10,2)", decimal.Decimal("0.05"), "5"),
+    ("oracle", "VARCHAR2", "string", "text", "text"),
+    ("mysql", "double", None, 1.5, None),
+    ("mysql", "time", None, MOMENT.time(), None),
+    ("mysql", "longtext", "string", "text", "text"),
+    ("mysql", "datetime", "date", MOMENT, "2024-01-02"),
+    ("mysql", "int(11) unsigned", "int", 42, "42"),
+    ("mysql", "decimal(10,2)", "decimal(10,2)", decimal.Decimal("1.50"), "150"),
+]
+
+# The SQL date formats canonical_sql uses, as strftime formats.
+SQL_FORMATS = {
+    "CONVERT(VARCHAR(19), c, 120)": "%Y-%m-%d %H:%M:%S",
+    "CONVERT(VARCHAR(10), c, 23)": "%Y-%m-%d",
+    "TO_CHAR(c, 'YYYY-MM-DD HH24:MI:SS')": "%Y-%m-%d %H:%M:%S",
+    "TO_CHAR(c, 'YYYY-MM-DD')": "%Y-%m-%d",
+    "DATE_FORMAT(c, '%Y-%m-%d %H:%i:%s')": "%Y-%m-%d %H:%M:%S",
+    "DATE_FORMAT(c, '%Y-%m-%d')": "%Y-%m-%d",
+}
+
+
+def hashed(engine, origin_type, glue_type):
+    column = {"key": "c", "value": glue_type, "origin_type": origin_type}
+    return job_plan.hash_columns({"database_engine": engine}, {"schema": [column]})
+
+
+@pytest.mark.parametrize("engine, origin_type, glue_type, value, text", CASES)
+def test_only_columns_rendered_alike_are_hashed(engine, origin_type, glue_type, value, text):
+    assert hashed(engine, origin_type, glue_type) == ([["c", glue_type]] if text else [])
+
+
+def test_string_columns_without_source_type_left_out():
+    column = {"key": "c", "value": "string"}
+    assert job_plan.hash_columns({"database_engine": "oracle"}, {"schema": [column]}) == []
+    assert job_plan.hash_columns({"database_engine": "mysql"}, {"schema": [column]}) == [
+        ["c", "string"]]
+
+
+@pytest.mark.parametrize("engine, origin_type, glue_type, value, text",
+                         [case for case in CASES if case[4] and case[2] in ("date", "timestamp")])
+def test_canonical_sql_dates(engine, origin_type, glue_type, value, text):
+    assert value.strftime(SQL_FORMATS[content_hash.canonical_sql(engine, "c", glue_type)]) == text
+
+
+@pytest.mark.parametrize("engine, origin_type, glue_type, value, text",
+                         [case for case in CASES if case[4] and case[2].startswith("decimal")])
+def test_canonical_sql_decimals(engine, origin_type, glue_type, value, text):
+    scale = glue_type.rstrip(")").split(",")[1]
+    sql = content_hash.canonical_sql(engine, "c", glue_type)
+    assert f"ROUND(c, {scale}) * 1{'0' * int(scale)}" in sql
+    assert str(int(value.scaleb(int(scale)))) == text
+
+
+@pytest.mark.parametrize("engine, origin_type, glue_type, value, text",
+                         [case for case in CASES if case[4]])
+def test_canonical_column_matches_canonical_sql(engine, origin_type, glue_type, value, text):
+    pytest.importorskip("pyspark")
+    pytest.importorskip("awsglue")
+    import archive_glue
+    from pyspark.sql import SparkSession
+    from pyspark.sql.types import (BooleanType, DateType, DecimalType, IntegerType, StringType,
+                                   StructField, StructType, TimestampType)
+
+    match = archive_glue.DECIMAL_TYPE.match(glue_type)
+    spark_type = (DecimalType(int(match.group(1)), int(match.group(2))) if match else {
+        "timestamp": TimestampType(), "date": DateType(), "boolean": BooleanType(),
+        "int": IntegerType(), "string": StringType()}[glue_type])
+    spark = SparkSession.builder.master("local[1]").getOrCreate()
+    frame = spark.createDataFrame([(value,)], StructType([StructField("c", spark_type)]))
+    assert frame.select(archive_glue.canonical_column("c", glue_type)).first()[0] == text
@@ -0,0 +1,48 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+# Shared source database connector.
+#
+# Lambda functions that reach the source databases import this package from
+# the source connector layer instead of opening driver connections themselves:
+#
+#     with source_connector.connect(engine, hostname, port, username,
+#                                   password, database) as connection:
+#         ...
+#
+# Drivers are imported on first use, so a function only needs the drivers of
+# the engines it connects to. Timeouts and pool sizes are read from the
+# environment once per container.
+
+import os
+
+from source_connector.pool import ConnectionPool, Source
+
+
+pool = ConnectionPool(
+    max_idle=int(os.getenv("SOURCE_POOL_MAX_IDLE", "2")),
+    max_sources=int(os.getenv("SOURCE_POOL_MAX_SOURCES", "8")),
+    # Below the 350 second idle timeout of NAT gateways, which drop idle
+    # connections without notifying either end.
+    idle_seconds=int(os.getenv("SOURCE_POOL_IDLE_SECONDS", "300")),
+    connect_timeout=int(os.getenv("SOURCE_CONNECT_TIMEOUT_SECONDS", "10")),
+    read_timeout=int(os.getenv("SOURCE_READ_TIMEOUT_SECONDS", "60")),
+)
+
+
+def connect(engine, hostname, port, username, password, database):
+    """Borrow a pooled connection to the source for a with block."""
+    source = Source(engine, hostname, port, username, password, database)
+    return pool.connection(source)
@@ -0,0 +1,104 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+
+def create_dsn(hostname, port, service):
+    """Create an Oracle DSN that works across versions using service name."""
+    import oracledb
+    return oracledb.makedsn(hostname, port, service_name=service)
+
+
+class MySQLAdapter:
+    """pymysql driver adapter."""
+
+    def connect(self, source, connect_timeout, read_timeout):
+        import pymysql
+        return pymysql.connect(
+            host=source.hostname,
+            port=int(source.port),
+            user=source.username,
+            password=source.password,
+            database=source.database,
+            charset="utf8mb4",
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            write_timeout=read_timeout)
+
+    def ping(self, connection):
+        connection.ping(reconnect=False)
+
+    def reset(self, connection):
+        # Ends the read transaction so the next borrower gets a fresh snapshot.
+        connection.rollback()
+
+
+class MSSQLAdapter:
+    """pymssql driver adapter."""
+
+    def connect(self, source, connect_timeout, read_timeout):
+        import pymssql
+        return pymssql.connect(
+            server=source.hostname,
+            port=str(source.port),
+            user=source.username,
+            password=source.password,
+            database=source.database,
+            login_timeout=connect_timeout,
+            timeout=read_timeout or 0)
+
+    def ping(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def reset(self, connection):
+        connection.rollback()
+
+
+class OracleAdapter:
+    """python-oracledb (thin mode) driver adapter."""
+
+    def connect(self, source, connect_timeout, read_timeout):
+        import oracledb
+        connection = oracledb.connect(
+            user=source.username,
+            password=source.password,
+            dsn=create_dsn(source.hostname, source.port, source.database),
+            tcp_connect_timeout=connect_timeout)
+        connection.call_timeout = int((read_timeout or 0) * 1000)
+        return connection
+
+    def ping(self, connection):
+        connection.ping()
+
+    def reset(self, connection):
+        connection.rollback()
+
+
+ADAPTERS = {
+    "mysql": MySQLAdapter(),
+    "mssql": MSSQLAdapter(),
+    "oracle": OracleAdapter(),
+}
+
+
+def get_adapter(engine):
+    try:
+        return ADAPTERS[engine]
+    except KeyError:
+        raise ValueError(f"Unsupported database engine: {engine}")
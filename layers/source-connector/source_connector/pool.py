@@ -0,0 +1,139 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import logging
+import threading
+import time
+import traceback
+
+from source_connector.adapters import get_adapter
+
+logger = logging.getLogger()
+
+
+class Source:
+    """Connection details of a source database."""
+
+    def __init__(self, engine, hostname, port, username, password, database):
+        self.engine = engine
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.database = database
+
+    def key(self):
+        # The password is hashed so that it is never kept as a dictionary key,
+        # but a rotated password still gets its own connections.
+        digest = hashlib.sha256(self.password.encode("utf-8")).hexdigest()
+        return (self.engine, self.hostname, str(self.port), self.database,
+                self.username, digest)
+
+
+class ConnectionPool:
+    """Idle connections kept for the life of the warm container.
+
+    Connections are pooled per source, keyed by engine, endpoint, database
+    and credentials, so a warm invocation skips the TCP, TLS and login
+    handshakes. At most max_idle connections are kept per source and at
+    most max_sources sources are tracked; the least recently used source
+    is closed beyond that. An idle connection older than idle_seconds is
+    closed instead of reused, and any other is pinged before it is handed
+    out. A connection whose block raised is closed, never returned.
+    """
+
+    def __init__(self, max_idle, max_sources, idle_seconds, connect_timeout, read_timeout):
+        self.max_idle = max_idle
+        self.max_sources = max_sources
+        self.idle_seconds = idle_seconds
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle = OrderedDict()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, source):
+        """Borrow a connection to source for the duration of the with block."""
+
+        adapter = get_adapter(source.engine)
+        key = source.key()
+        connection = self.acquire(adapter, key)
+        if connection is None:
+            connection = adapter.connect(source, self.connect_timeout, self.read_timeout)
+
+        try:
+            yield connection
+        except BaseException:
+            self.discard(connection)
+            raise
+
+        try:
+            adapter.reset(connection)
+        except Exception:
+            logger.warning(traceback.format_exc())
+            self.discard(connection)
+            return
+        self.release(key, connection)
+
+    def acquire(self, adapter, key):
+        while True:
+            with self.lock:
+                entries = self.idle.get(key)
+                if not entries:
+                    return None
+                released_at, connection = entries.pop()
+                self.idle.move_to_end(key)
+
+            if time.monotonic() - released_at > self.idle_seconds:
+                self.discard(connection)
+                continue
+            try:
+                adapter.ping(connection)
+                return connection
+            except Exception:
+                logger.info("Discarding stale pooled connection")
+                self.discard(connection)
+
+    def release(self, key, connection):
+        evicted = []
+        with self.lock:
+            entries = self.idle.setdefault(key, [])
+            self.idle.move_to_end(key)
+            if len(entries) < self.max_idle:
+                entries.append((time.monotonic(), connection))
+            else:
+                evicted.append(connection)
+            while len(self.idle) > self.max_sources:
+                _, entries = self.idle.popitem(last=False)
+                evicted.extend(connection for _, connection in entries)
+
+        for connection in evicted:
+            self.discard(connection)
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            entries = [entry for entries in self.idle.values() for entry in entries]
+            self.idle.clear()
+        for _, connection in entries:
+            self.discard(connection)
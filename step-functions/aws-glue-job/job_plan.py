@@ -0,0 +1,235 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+import math
+import re
+
+# Tables up to this many MB of source data are archived by the small table
+# extract function instead of a Glue job, unless the archive sets
+# small_table_mb.
+DEFAULT_SMALL_TABLE_MB = 64
+
+# Tables larger than this get a job run of their own.
+LARGE_TABLE_BYTES = 10 * 1024 ** 3
+
+# Source bytes a run of the smaller tables is packed up to, and a worker
+# of a dedicated run is given.
+RUN_BYTES = 10 * 1024 ** 3
+
+# Upper bound on the workers of a dedicated run.
+MAX_WORKERS = 20
+
+# Upper bound on concurrent runs of an archive's job; step six creates the
+# job with it.
+MAX_RUNS = 10
+
+# Binary values larger than this many KB are written to S3 objects of their
+# own, unless the archive sets lob_threshold_kb.
+DEFAULT_LOB_THRESHOLD_KB = 1024
+
+# Large binary values are read from the source in chunks of this size.
+LOB_CHUNK_BYTES = 8 * 1024 ** 2
+
+# Suffix of the column that holds the S3 URI of a binary column's large values.
+LOB_REF_SUFFIX = "_lob_ref"
+
+# Glue types the content hash renders the same way in Spark and in the
+# source's SQL, as long as the source type is not one of UNHASHED_TYPES.
+INTEGER_TYPES = ("tinyint", "smallint", "int", "integer", "bigint", "long")
+HASH_TYPES = INTEGER_TYPES + ("string", "varchar", "boolean", "date", "timestamp")
+DECIMAL_TYPE = re.compile(r"decimal(?:\((\d+),\s*(\d+)\))?$")
+
+# Source types, without their length, precision or sign, that the Glue
+# type of their column does not say how to render, or that the source
+# cannot hash in SQL: floating point text differs between Spark and every
+# source, SQL Server renders time, datetime2 and datetimeoffset with other
+# fractions or dates than Spark, and Oracle's STANDARD_HASH takes no LOBs.
+UNHASHED_TYPES = {
+    "mysql": ("float", "double", "real", "time", "json"),
+    "mssql": ("float", "real", "time", "datetime2", "datetimeoffset", "smalldatetime",
+              "sql_variant", "timestamp", "rowversion", "xml"),
+    "oracle": ("float", "binary_float", "binary_double", "clob", "nclob", "long",
+               "timestamp with time zone", "timestamp with local time zone",
+               "interval year to month", "interval day to second"),
+}
+
+
+def table_bytes(tbl):
+    return int(tbl.get("statistics", {}).get("data_bytes") or 0)
+
+
+def uses_extractor(item, tbl):
+    """Return whether the table is archived by the small table extract function.
+
+    That function writes plain, unpartitioned files of the whole table, so
+    partitioned, bucketed and incremental tables always go to Glue, as do
+    tables whose size is unknown. A small_table_mb of 0 sends every table to Glue.
+    """
+
+    small_table_mb = int(item["configuration"]["glue"].get("small_table_mb", DEFAULT_SMALL_TABLE_MB))
+    data_bytes = tbl.get("statistics", {}).get("data_bytes")
+    return (small_table_mb > 0 and data_bytes is not None
+            and int(data_bytes) <= small_table_mb * 1024 ** 2
+            and not tbl.get("output_partition") and not tbl.get("output_bucket")
+            and not tbl.get("incremental"))
+
+
+def table_workers(item, tbl):
+    """Return the workers to archive the table with.
+
+    Tables get one worker per RUN_BYTES of source data, but never fewer
+    than the archive's glue_capacity nor more than MAX_WORKERS.
+    """
+
+    capacity = int(item["configuration"]["glue"]["glue_capacity"])
+    return min(max(capacity, math.ceil(table_bytes(tbl) / RUN_BYTES)), max(capacity, MAX_WORKERS))
+
+
+def duplicate_tables(item):
+    """Return the table names the archive has more than once.
+
+    Output prefixes and catalog tables are named after the table alone, so
+    tables of the same name in different SQL Server schemas or Oracle
+    owners would write over each other.
+    """
+
+    names = [tbl["table"] for tbl in item["table_details"]]
+    return sorted({name for name in names if names.count(name) > 1})
+
+
+def plan_runs(item):
+    """Pack the tables of an archive into job runs.
+
+    Tables over LARGE_TABLE_BYTES get dedicated runs sized by
+    table_workers, up to MAX_RUNS - 1 of them so one run is left for the
+    rest; any further large tables are logged and packed with the others.
+    Those are spread over as many shared runs as it takes to hold about
+    RUN_BYTES each, longest table first onto the least loaded run, which
+    keeps the runs' durations, and so the archive's makespan, close to
+    even. Runs are returned longest first, each with the indexes of its
+    tables in table_details, also longest first. Tables for the small
+    table extract function are left out. Archives with duplicate_tables
+    are rejected with a ValueError.
+    """
+
+    duplicates = duplicate_tables(item)
+    if duplicates:
+        raise ValueError("Tables of the same name in different schemas cannot be archived "
+                         f"together: {', '.join(duplicates)}")
+
+    tables = sorted((index for index, tbl in enumerate(item["table_details"])
+                     if not uses_extractor(item, tbl)),
+                    key=lambda index: table_bytes(item["table_details"][index]), reverse=True)
+    large = [index for index in tables
+             if table_bytes(item["table_details"][index]) > LARGE_TABLE_BYTES]
+    if len(large) > MAX_RUNS - 1:
+        print(f"{len(large) - (MAX_RUNS - 1)} large tables go to shared runs, as only "
+              f"{MAX_RUNS - 1} get runs of their own: "
+              + ", ".join(item["table_details"][index]["table"] for index in large[MAX_RUNS - 1:]))
+        large = large[:MAX_RUNS - 1]
+    small = [index for index in tables if index not in large]
+
+    runs = [{"tables": [index],
+             "workers": table_workers(item, item["table_details"][index]),
+             "estimated_bytes": table_bytes(item["table_details"][index])}
+            for index in large]
+
+    if small:
+        total = sum(table_bytes(item["table_details"][index]) for index in small)
+        shared = [{"tables": [], "workers": int(item["configuration"]["glue"]["glue_capacity"]),
+                   "estimated_bytes": 0}
+                  for _ in range(min(MAX_RUNS - len(runs), max(1, math.ceil(total / RUN_BYTES))))]
+        for index in small:
+            run = min(shared, key=lambda candidate: candidate["estimated_bytes"])
+            run["tables"].append(index)
+            run["estimated_bytes"] += table_bytes(item["table_details"][index])
+        runs.extend(run for run in shared if run["tables"])
+
+    return sorted(runs, key=lambda run: run["estimated_bytes"], reverse=True)
+
+
+def lob_options(item, tbl):
+    """Return how the table's large binary values are archived, or None.
+
+    Tables whose discovery found large object columns and a primary key
+    have their binary columns read in LOB mode: values up to the threshold
+    stay in the Parquet files, larger ones are read in chunks and written
+    to content addressed S3 objects, referenced from a <column>_lob_ref
+    column. That covers MySQL blobs, SQL Server varbinary and image and
+    Oracle BLOBs; character LOBs are archived inline as strings. A
+    lob_threshold_kb of 0 turns LOB mode off.
+    """
+
+    threshold_kb = int(item["configuration"].get("output", {}).get(
+        "lob_threshold_kb", DEFAULT_LOB_THRESHOLD_KB))
+    statistics = tbl.get("statistics", {})
+    columns = [schema["key"] for schema in tbl["schema"] if schema["value"] == "binary"]
+    if threshold_kb <= 0 or not statistics.get("has_lob") or not columns \
+            or not statistics.get("primary_key"):
+        return None
+    return {"columns": columns, "keys": list(statistics["primary_key"]),
+            "threshold_bytes": threshold_kb * 1024, "chunk_bytes": LOB_CHUNK_BYTES}
+
+
+def parquet_layout(tbl):
+    """Return the table's Parquet tuning as the writers take it.
+
+    The table's parquet_layout gives row_group_mb, page_kb, dictionary and
+    sort_by; sizes are returned in bytes, and settings the table leaves out
+    are left to the writer's defaults.
+    """
+
+    parquet = tbl.get("parquet_layout") or {}
+    layout = {}
+    if parquet.get("row_group_mb"):
+        layout["row_group_bytes"] = int(parquet["row_group_mb"]) * 1024 ** 2
+    if parquet.get("page_kb"):
+        layout["page_bytes"] = int(parquet["page_kb"]) * 1024
+    if "dictionary" in parquet:
+        layout["dictionary"] = bool(parquet["dictionary"])
+    if parquet.get("sort_by"):
+        layout["sort_by"] = list(parquet["sort_by"])
+    return layout
+
+
+def source_type(column):
+    """Return the column's source type, lower case, without its length, precision or sign."""
+
+    origin = re.sub(r"\([^)]*\)|\b(unsigned|zerofill)\b", "", column.get("origin_type") or "")
+    return " ".join(origin.lower().split())
+
+
+def hash_columns(item, tbl):
+    """Return the [column, Glue type] pairs of the table's content hash.
+
+    Columns are hashed when their Glue type is in HASH_TYPES or a decimal
+    and their source type is not in UNHASHED_TYPES. On SQL Server and
+    Oracle only columns with a source type are hashed, as a Glue string
+    column can hold any of their unhashed types; MySQL maps those to no
+    Glue type at all.
+    """
+
+    engine = item["database_engine"]
+    hashed = []
+    for column in tbl["schema"]:
+        glue_type = column["value"] or ""
+        if glue_type not in HASH_TYPES and not DECIMAL_TYPE.match(glue_type):
+            continue
+        if engine != "mysql" and not column.get("origin_type"):
+            continue
+        if source_type(column) in UNHASHED_TYPES.get(engine, ()):
+            continue
+        hashed.append([column["key"], glue_type])
+    return hashed
@@ -14,11 +14,108 @@ permissions and limitations under the License.
 """
 
 import boto3
+import json
+import job_plan
 
 client = boto3.client('glue', region_name='us-east-1')
 dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
 ssm = boto3.client('ssm')
 
+# Archives created before the output codec was configurable are written
+# with the default codec on their next run.
+DEFAULT_COMPRESSION = 'snappy'
+
+
+# Granularities a date or timestamp partition column can be derived at.
+PARTITION_GRANULARITIES = ('year', 'month', 'day')
+
+
+def output_compression(item):
+    return item["configuration"].get("output", {}).get("compression", DEFAULT_COMPRESSION)
+
+
+def partition_columns(tbl, columns):
+    """Split the table columns into data columns and partition keys.
+
+    A derived partition column, named <column>_<granularity> like the Glue
+    scripts name it, is added as a string key. Partitioning on a column's
+    own values moves that column out of the data files into the key.
+    """
+
+    partition = tbl.get("output_partition") or {}
+    column = partition.get("column")
+    if not column:
+        return columns, []
+
+    granularity = partition.get("granularity")
+    if granularity:
+        if granularity not in PARTITION_GRANULARITIES:
+            raise ValueError(f'Unsupported partition granularity: {granularity}')
+        return columns, [{'Name': f'{column}_{granularity}'.lower(), 'Type': 'string',
+                          'Comment': ''}]
+
+    return ([c for c in columns if c['Name'] != column],
+            [c for c in columns if c['Name'] == column])
+
+
+def table_input(event, tbl, columns, bucket_name):
+    compression = output_compression(event["Item"])
+    parameters = {
+        'classification': 'parquet',
+        'typeOfData': 'file',
+    }
+    if compression != 'uncompressed':
+        parameters['parquet.compression'] = compression.upper()
+    # Compaction rewrites the files with the layout they were written with.
+    layout = job_plan.parquet_layout(tbl)
+    if layout:
+        parameters['archive.parquet_layout'] = json.dumps(layout, sort_keys=True)
+
+    columns, keys = partition_columns(tbl, columns)
+
+    # Bucket files are named and hashed as Spark names and hashes them, so
+    # Athena reads one bucket for an equality predicate on the column.
+    bucket = tbl.get("output_bucket") or {}
+    if bucket:
+        parameters['bucketing_format'] = 'spark'
+
+    return {
+        'Name': f'{event["Item"]["id"]}-{event["Item"]["database"]}-{tbl["table"]}-table',
+        'Description': 'TO ADD',
+        'PartitionKeys': keys,
+        'StorageDescriptor': {
+            'Columns': columns,
+            'Location': f's3://{bucket_name}/{event["Item"]["id"]}/{event["Item"]["database"]}/{tbl["table"]}',
+            'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
+            'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
+            'Compressed': compression != 'uncompressed',
+            'NumberOfBuckets': int(bucket['buckets']) if bucket else 0,
+            'BucketColumns': [bucket['column']] if bucket else [],
+            'SerdeInfo': {'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'}
+        },
+        'TableType': "EXTERNAL_TABLE",
+        'Parameters': parameters,
+    }
+
+
+def table_changed(existing_table, new_table):
+    existing_columns = (existing_table["StorageDescriptor"]["Columns"]
+                        + existing_table.get("PartitionKeys", []))
+    new_columns = new_table["StorageDescriptor"]["Columns"] + new_table["PartitionKeys"]
+    return ([(c["Name"], c["Type"]) for c in existing_columns] !=
+            [(c["Name"], c["Type"]) for c in new_columns]
+            or len(existing_table.get("PartitionKeys", [])) != len(new_table["PartitionKeys"])
+            or existing_table["StorageDescriptor"].get("Compressed", False) !=
+            new_table["StorageDescriptor"]["Compressed"]
+            or existing_table["StorageDescriptor"].get("BucketColumns", []) !=
+            new_table["StorageDescriptor"]["BucketColumns"]
+            or max(0, existing_table["StorageDescriptor"].get("NumberOfBuckets", 0)) !=
+            new_table["StorageDescriptor"]["NumberOfBuckets"]
+            or any(existing_table.get("Parameters", {}).get(name) !=
+                   new_table["Parameters"].get(name)
+                   for name in ("parquet.compression", "archive.parquet_layout",
+                                "bucketing_format")))
+
 
 def lambda_handler(event, context):
 
@@ -38,33 +135,33 @@ def lambda_handler(event, context):
                 print(schema)
                 columns.append({'Name': schema["key"], 'Type': schema["value"],
                                 'Comment': ''})
+            # Large binary values are archived as S3 objects referenced
+            # from a column next to the binary one.
+            lobs = job_plan.lob_options(event["Item"], tbl)
+            for column in (lobs or {}).get("columns", []):
+                columns.append({'Name': f'{column}{job_plan.LOB_REF_SUFFIX}', 'Type': 'string',
+                                'Comment': ''})
+            bucketName = bucketParameter['Parameter']['Value']
             try:
-                client.get_table(
+                response = client.get_table(
                     DatabaseName=f'{event["Item"]["id"]}-{event["Item"]["database"]}-database',
                     Name=f'{event["Item"]["id"]}-{event["Item"]["database"]}-{tbl["table"]}-table',
                 )
 
-            except:
-                bucketName = bucketParameter['Parameter']['Value']
+                # Only tables whose columns, partition keys, buckets, codec or
+                # layout changed since the last run are rewritten, so re-archiving an
+                # unchanged source is cheap.
+                new_table = table_input(event, tbl, columns, bucketName)
+                if table_changed(response["Table"], new_table):
+                    client.update_table(
+                        DatabaseName=f'{event["Item"]["id"]}-{event["Item"]["database"]}-database',
+                        TableInput=new_table
+                    )
+
+            except client.exceptions.EntityNotFoundException:
                 client.create_table(
                     DatabaseName=f'{event["Item"]["id"]}-{event["Item"]["database"]}-database',
-                    TableInput={
-                        'Name': f'{event["Item"]["id"]}-{event["Item"]["database"]}-{tbl["table"]}-table',
-                        'Description': 'TO ADD',
-                        'StorageDescriptor': {
-                            'Columns': columns,
-                            'Location': f's3://{bucketName}/{event["Item"]["id"]}/{event["Item"]["database"]}/{tbl["table"]}',
-                            'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
-                            'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
-                            'Compressed': False,
-                            'SerdeInfo': {'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'}
-                        },
-                        'TableType': "EXTERNAL_TABLE",
-                        'Parameters': {
-                            'classification': 'parquet',
-                            'typeOfData': 'file',
-                        }
-                    }
+                    TableInput=table_input(event, tbl, columns, bucketName)
                 )
             tbl["archive_id"] = event["Item"]["id"]
             tbl["database"] = event["Item"]["database"]
@@ -73,6 +170,17 @@ def lambda_handler(event, context):
             tbl["oracle_owner"] = event["Item"]["oracle_owner"]
             tbl["glue_capacity"] = event["Item"]["configuration"]["glue"]["glue_capacity"]
             tbl["glue_worker"] = event["Item"]["configuration"]["glue"]["glue_worker"]
+            tbl["compression"] = output_compression(event["Item"])
+            tbl["job_mode"] = event["Item"]["configuration"]["glue"].get("job_mode", "table")
+
+        # Tables archived by one job are packed into runs by size up front,
+        # so step nine starts the same runs however its map is scheduled.
+        if event["Item"]["configuration"]["glue"].get("job_mode") == "archive":
+            table.update_item(
+                Key={'id': event["Item"]["id"]},
+                UpdateExpression="SET job_plan= :p",
+                ExpressionAttributeValues={':p': job_plan.plan_runs(event["Item"])},
+            )
 
     except:
         table.update_item(
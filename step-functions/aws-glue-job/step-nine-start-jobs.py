@@ -16,7 +16,10 @@ permissions and limitations under the License.
 import boto3
 from botocore.config import Config
 import json
+import job_plan
+import math
 import os
+import uuid
 
 REGION = os.environ["REGION"]
 
@@ -27,8 +30,259 @@ client = boto3.client(
                   retries={"max_attempts": 20}),
 )
 dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+lambda_client = boto3.client("lambda")
+s3 = boto3.client("s3")
 ssm = boto3.client("ssm")
 
+# Spark cores per Glue worker type, used to size parallel source reads.
+WORKER_CORES = {"Standard": 4, "G.1X": 4, "G.2X": 8, "G.4X": 16, "G.8X": 32}
+
+# Codec of archives that predate configuration.output; matches step four.
+DEFAULT_COMPRESSION = "snappy"
+
+# Tables are not split into more partitions than they have millions of rows.
+ROWS_PER_PARTITION = 1000000
+
+# Glue connection types of the source engines.
+CONNECTION_TYPES = {"mysql": "mysql", "mssql": "sqlserver", "oracle": "oracle"}
+
+# Tables an archive run reads at the same time.
+ARCHIVE_RUN_CONCURRENCY = 4
+
+# Target size of archived files for archives that predate target_file_mb.
+DEFAULT_TARGET_FILE_MB = 128
+
+# Rough size of the Parquet output relative to the source table's storage,
+# used to estimate the output size before anything is written.
+PARQUET_SIZE_RATIO = 0.25
+
+
+def find_table_details(item, event):
+    """Return the archived table record for the table of this job."""
+    for tbl in item.get("table_details", []):
+        if tbl["table"] != event["table"]:
+            continue
+        if tbl.get("mssql_schema", event.get("mssql_schema")) != event.get("mssql_schema"):
+            continue
+        if tbl.get("oracle_owner", event.get("oracle_owner")) != event.get("oracle_owner"):
+            continue
+        return tbl
+    return {}
+
+
+def output_compression(item):
+    return item["configuration"].get("output", {}).get("compression", DEFAULT_COMPRESSION)
+
+
+def split_options(item, event, workers):
+    """Return the --SPLIT argument that lets the job read the table in parallel.
+
+    The table is read with one partition per Spark core of the workers the
+    run is started with, but never more partitions than it has millions of
+    estimated rows.
+    """
+
+    partitions = WORKER_CORES.get(item["configuration"]["glue"]["glue_worker"], 4) * int(workers)
+
+    tbl = find_table_details(item, event)
+    estimated_rows = tbl.get("statistics", {}).get("estimated_rows")
+    if estimated_rows is not None:
+        partitions = max(1, min(partitions, int(estimated_rows) // ROWS_PER_PARTITION))
+
+    split = {"partitions": partitions}
+    split_key = tbl.get("split_key")
+    if split_key:
+        split.update(column=split_key["column"], type=split_key["type"],
+                     lower=split_key.get("lower"), upper=split_key.get("upper"))
+    elif len(tbl.get("statistics", {}).get("primary_key", [])) == 1:
+        split["column"] = tbl["statistics"]["primary_key"][0]
+    return json.dumps(split)
+
+
+def layout_options(item, event):
+    """Return the --LAYOUT argument that sizes the files the job writes.
+
+    The file count is the estimated Parquet size over the target file size.
+    Unless the archive sets max_records_per_file, files are also capped at
+    the number of rows estimated to fill one target sized file, which keeps
+    large partition values from ending up in a single file. The table's
+    parquet_layout adds the row group and page sizes, dictionary encoding
+    and the columns to sort each file by, and its output_bucket the column
+    and number of buckets to hash the rows into.
+    """
+
+    output = item["configuration"].get("output", {})
+    target_bytes = int(output.get("target_file_mb", DEFAULT_TARGET_FILE_MB)) * 1024 * 1024
+
+    tbl = find_table_details(item, event)
+    statistics = tbl.get("statistics", {})
+    estimated_rows = statistics.get("estimated_rows")
+    data_bytes = statistics.get("data_bytes")
+
+    layout = {}
+    if data_bytes:
+        output_bytes = int(data_bytes) * PARQUET_SIZE_RATIO
+        layout["files"] = max(1, math.ceil(output_bytes / target_bytes))
+        if estimated_rows:
+            layout["max_records_per_file"] = max(
+                1, int(target_bytes * int(estimated_rows) / output_bytes))
+    if output.get("max_records_per_file"):
+        layout["max_records_per_file"] = int(output["max_records_per_file"])
+
+    # Parquet tuning of the table, when it has any.
+    layout.update(job_plan.parquet_layout(tbl))
+
+    bucket = tbl.get("output_bucket")
+    if bucket:
+        layout["bucket"] = {"column": bucket["column"], "buckets": int(bucket["buckets"])}
+    return json.dumps(layout)
+
+
+def incremental_options(item, event):
+    """Return the --INCREMENTAL argument for tables archived incrementally.
+
+    It carries the watermark the last successful run reached, which the
+    glue job status function stores on the table, so only newer rows are
+    read.
+    """
+
+    tbl = find_table_details(item, event)
+    if not tbl.get("incremental"):
+        return json.dumps({})
+    return json.dumps({"column": tbl["incremental"]["column"],
+                       "watermark": tbl.get("watermark")})
+
+
+def lob_options(item, event):
+    """Return the --LOBS argument, set for tables with large binary values."""
+
+    return json.dumps(job_plan.lob_options(item, find_table_details(item, event)) or {})
+
+
+def source_table(item, tbl):
+    """Return the dbtable the job reads the table from."""
+    if item["database_engine"] == "mssql":
+        return f'{tbl["mssql_schema"]}.{tbl["table"]}'
+    if item["database_engine"] == "oracle":
+        return f'{item["oracle_owner"]}.{tbl["table"]}'
+    return tbl["table"]
+
+
+def table_spec(item, tbl, workers):
+    """Return the arguments of one table of an archive run with workers.
+
+    They are the per-table job arguments, parsed, in the form
+    archive_glue.archive_table takes them.
+    """
+
+    event = {"table": tbl["table"], "mssql_schema": tbl.get("mssql_schema"),
+             "oracle_owner": item.get("oracle_owner")}
+    return {
+        "table": tbl["table"],
+        "dbtable": source_table(item, tbl),
+        "mappings": [[schema["key"], schema["value"], schema["key"], schema["value"]]
+                     for schema in tbl["schema"]],
+        "split": json.loads(split_options(item, event, workers)),
+        "partition": tbl.get("output_partition") or {},
+        "layout": json.loads(layout_options(item, event)),
+        "row_filter": tbl.get("row_filter") or "",
+        "incremental": json.loads(incremental_options(item, event)),
+        "lobs": json.loads(lob_options(item, event)),
+        "hash_columns": job_plan.hash_columns(item, tbl),
+    }
+
+
+def start_archive_run(table, item, bucket, temp_dir, run):
+    """Start one run of the archive job for the tables of a planned run.
+
+    The table arguments can outgrow the job arguments, so they are written
+    to the Glue temp bucket and the run reads them from there.
+    """
+
+    job_name = f'{item["id"]}-{item["database"]}'
+    tables = [item["table_details"][int(index)] for index in run["tables"]]
+    tables_key = f'archives/{item["id"]}/{uuid.uuid4()}.json'
+    s3.put_object(
+        Bucket=temp_dir,
+        Key=tables_key,
+        Body=json.dumps([table_spec(item, tbl, run["workers"]) for tbl in tables]),
+    )
+
+    response = client.start_job_run(
+        JobName=job_name,
+        Arguments={
+            "--job-language": "python",
+            "--job-bookmark-option": "job-bookmark-disable",
+            "--TempDir": f"s3://{temp_dir}/temporary/",
+            "--enable-job-insights": "false",
+            "--ENGINE": CONNECTION_TYPES[item["database_engine"]],
+            "--BUCKET": bucket,
+            "--DATABASE": item["database"],
+            "--ARCHIVE_ID": item["id"],
+            "--CONNECTION": f'{item["id"]}-{item["database"]}-connection',
+            "--COMPRESSION": output_compression(item),
+            "--TABLES_PATH": f"s3://{temp_dir}/{tables_key}",
+            "--CONCURRENCY": str(ARCHIVE_RUN_CONCURRENCY),
+        },
+        Timeout=2880,
+        WorkerType=item["configuration"]["glue"]["glue_worker"],
+        NumberOfWorkers=int(run["workers"]),
+    )
+
+    table.update_item(
+        Key={"id": item["id"]},
+        UpdateExpression=f'set jobs.{response["JobRunId"]} = :newJob',
+        ExpressionAttributeValues={
+            ":newJob": {
+                "job_name": job_name,
+                "job_run_id": response["JobRunId"],
+                "state": "RUNNING",
+                "timestamp": response["ResponseMetadata"]["HTTPHeaders"]["date"],
+                "message": "",
+                "tables": [{"table": tbl["table"], "state": "RUNNING", "message": ""}
+                           for tbl in tables],
+            }
+        },
+    )
+
+
+def start_extract(table, item, event):
+    """Archive a small table with the small table extract function.
+
+    The function is invoked asynchronously under the job name and a run id
+    of the table, and reports back through the glue job status function
+    like a Glue job run would.
+    """
+
+    job_name = f'{event["archive_id"]}-{event["database"]}-{event["table"]}'
+    job_run_id = f"lx_{uuid.uuid4().hex}"
+    response = lambda_client.invoke(
+        FunctionName=os.environ["SMALL_TABLE_EXTRACT_FUNCTION"],
+        InvocationType="Event",
+        Payload=json.dumps({
+            "archive_id": event["archive_id"],
+            "table": event["table"],
+            "mssql_schema": event.get("mssql_schema"),
+            "hash_columns": job_plan.hash_columns(item, find_table_details(item, event)),
+            "job_name": job_name,
+            "job_run_id": job_run_id,
+        }),
+    )
+
+    table.update_item(
+        Key={"id": item["id"]},
+        UpdateExpression=f"set jobs.{job_run_id} = :newJob",
+        ExpressionAttributeValues={
+            ":newJob": {
+                "job_name": job_name,
+                "job_run_id": job_run_id,
+                "state": "RUNNING",
+                "timestamp": response["ResponseMetadata"]["HTTPHeaders"]["date"],
+                "message": "",
+            }
+        },
+    )
+
 
 def lambda_handler(event, context):
 
@@ -46,6 +300,24 @@ def lambda_handler(event, context):
 
     try:
 
+        item = dynamodb_response["Item"]
+        tbl = find_table_details(item, event)
+        archive_mode = item["configuration"]["glue"].get("job_mode") == "archive"
+
+        # Every table maps to this step; in archive job mode the first one
+        # starts the runs step four planned for all of them, longest first.
+        if archive_mode and tbl is item["table_details"][0]:
+            for run in item.get("job_plan") or job_plan.plan_runs(item):
+                start_archive_run(table, item, bucketParameter["Parameter"]["Value"],
+                                  temp_dir_parameter_value, run)
+
+        if job_plan.uses_extractor(item, tbl):
+            start_extract(table, item, event)
+            return {"Payload": event}
+        if archive_mode:
+            return {"Payload": event}
+
+        workers = job_plan.table_workers(item, tbl)
         mappings = []
 
         for schema in event["table_details"]:
@@ -67,14 +339,22 @@ def lambda_handler(event, context):
                     "--ARCHIVE_ID": event["archive_id"],
                     "--CONNECTION": f'{event["archive_id"]}-{event["database"]}-connection',
                     "--MAPPINGS": json.dumps(mappings),
+                    "--SPLIT": split_options(dynamodb_response["Item"], event, workers),
+                    "--COMPRESSION": output_compression(dynamodb_response["Item"]),
+                    "--PARTITION": json.dumps(
+                        find_table_details(dynamodb_response["Item"], event).get("output_partition") or {}),
+                    "--LAYOUT": layout_options(dynamodb_response["Item"], event),
+                    "--ROW_FILTER": json.dumps(
+                        find_table_details(dynamodb_response["Item"], event).get("row_filter") or ""),
+                    "--INCREMENTAL": incremental_options(dynamodb_response["Item"], event),
+                    "--LOBS": lob_options(dynamodb_response["Item"], event),
+                    "--HASH_COLUMNS": json.dumps(job_plan.hash_columns(item, tbl)),
                 },
                 Timeout=2880,
                 WorkerType=dynamodb_response["Item"]["configuration"]["glue"][
                     "glue_worker"
                 ],
-                NumberOfWorkers=int(
-                    dynamodb_response["Item"]["configuration"]["glue"]["glue_capacity"]
-                ),
+                NumberOfWorkers=workers,
             )
 
             table.update_item(
@@ -106,14 +386,22 @@ def lambda_handler(event, context):
                     "--ARCHIVE_ID": event["archive_id"],
                     "--CONNECTION": f'{event["archive_id"]}-{event["database"]}-connection',
                     "--MAPPINGS": json.dumps(mappings),
+                    "--SPLIT": split_options(dynamodb_response["Item"], event, workers),
+                    "--COMPRESSION": output_compression(dynamodb_response["Item"]),
+                    "--PARTITION": json.dumps(
+                        find_table_details(dynamodb_response["Item"], event).get("output_partition") or {}),
+                    "--LAYOUT": layout_options(dynamodb_response["Item"], event),
+                    "--ROW_FILTER": json.dumps(
+                        find_table_details(dynamodb_response["Item"], event).get("row_filter") or ""),
+                    "--INCREMENTAL": incremental_options(dynamodb_response["Item"], event),
+                    "--LOBS": lob_options(dynamodb_response["Item"], event),
+                    "--HASH_COLUMNS": json.dumps(job_plan.hash_columns(item, tbl)),
                 },
                 Timeout=2880,
                 WorkerType=dynamodb_response["Item"]["configuration"]["glue"][
                     "glue_worker"
                 ],
-                NumberOfWorkers=int(
-                    dynamodb_response["Item"]["configuration"]["glue"]["glue_capacity"]
-                ),
+                NumberOfWorkers=workers,
             )
 
             table.update_item(
@@ -146,14 +434,22 @@ def lambda_handler(event, context):
                     "--CONNECTION": f'{event["archive_id"]}-{event["database"]}-connection',
                     "--ARCHIVE_ID": event["archive_id"],
                     "--MAPPINGS": json.dumps(mappings),
+                    "--SPLIT": split_options(dynamodb_response["Item"], event, workers),
+                    "--COMPRESSION": output_compression(dynamodb_response["Item"]),
+                    "--PARTITION": json.dumps(
+                        find_table_details(dynamodb_response["Item"], event).get("output_partition") or {}),
+                    "--LAYOUT": layout_options(dynamodb_response["Item"], event),
+                    "--ROW_FILTER": json.dumps(
+                        find_table_details(dynamodb_response["Item"], event).get("row_filter") or ""),
+                    "--INCREMENTAL": incremental_options(dynamodb_response["Item"], event),
+                    "--LOBS": lob_options(dynamodb_response["Item"], event),
+                    "--HASH_COLUMNS": json.dumps(job_plan.hash_columns(item, tbl)),
                 },
                 Timeout=2880,
                 WorkerType=dynamodb_response["Item"]["configuration"]["glue"][
                     "glue_worker"
                 ],
-                NumberOfWorkers=int(
-                    dynamodb_response["Item"]["configuration"]["glue"]["glue_capacity"]
-                ),
+                NumberOfWorkers=workers,
             )
 
             table.update_item(
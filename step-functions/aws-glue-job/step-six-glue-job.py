@@ -14,6 +14,7 @@ permissions and limitations under the License.
 """
 
 import boto3
+import job_plan
 import os
 from botocore.config import Config
 
@@ -25,6 +26,80 @@ dynamodb = boto3.resource('dynamodb', region_name=REGION)
 ssm = boto3.client('ssm')
 
 
+# The archive jobs collect their metrics while writing with Spark 3.3's
+# Observation, and write zstd, which both need Glue 4.0.
+GLUE_VERSION = '4.0'
+
+# Fields of a job definition that UpdateJob takes back.
+JOB_UPDATE_FIELDS = ('Description', 'LogUri', 'Role', 'ExecutionProperty', 'Command',
+                     'DefaultArguments', 'NonOverridableArguments', 'Connections',
+                     'MaxRetries', 'Timeout', 'NumberOfWorkers', 'WorkerType',
+                     'SecurityConfiguration', 'NotificationProperty', 'ExecutionClass')
+
+
+def job_name(event):
+    if event.get("job_mode") == "archive":
+        return f'{event["archive_id"]}-{event["database"]}'
+    return f'{event["archive_id"]}-{event["database"]}-{event["table"]}'
+
+
+def upgrade_glue_version(name, version):
+    """Move an existing job to version when it runs on an older Glue version.
+
+    Jobs created before the archive jobs needed GLUE_VERSION run on Glue
+    3.0, which cannot run the current archive_glue. UpdateJob replaces
+    the whole definition, so the job's current one is sent back with the
+    new version. Jobs on a newer version are left as they are.
+    """
+
+    job = client.get_job(JobName=name)["Job"]
+    current = tuple(int(part) for part in job.get("GlueVersion", "0.9").split("."))
+    if current >= tuple(int(part) for part in version.split(".")):
+        return
+
+    update = {field: job[field] for field in JOB_UPDATE_FIELDS if field in job}
+    client.update_job(JobName=name, JobUpdate=dict(update, GlueVersion=version))
+    print(f'Job {name} moved from Glue {job.get("GlueVersion")} to {version}')
+
+
+def create_archive_job(event, bucket, temp_bucket, role):
+    """Create the job that archives the tables of the archive, several per run.
+
+    Every table of the archive maps to this step, so all but the first
+    find the job already created.
+    """
+
+    default_arguments = {
+        '--TempDir': f's3://{temp_bucket}/temp/',
+        '--job-bookmark-option': 'job-bookmark-disable',
+        '--extra-py-files': f's3://{bucket}/lib/archive_glue.py'
+    }
+    if event["database_engine"] == "mssql":
+        default_arguments['--disable-proxy-v2'] = 'true'
+
+    client.create_job(
+        Name=f'{event["archive_id"]}-{event["database"]}',
+        Role=role,
+        Command={
+            'Name': 'glueetl',
+            'ScriptLocation': f's3://{bucket}/scripts/multi-table-1-0-0.py',
+            'PythonVersion': '3'
+        },
+        DefaultArguments=default_arguments,
+        # Step nine starts one run per run of the archive's job plan.
+        ExecutionProperty={'MaxConcurrentRuns': job_plan.MAX_RUNS},
+        MaxRetries=0,
+        GlueVersion=GLUE_VERSION,
+        NumberOfWorkers=int(event["glue_capacity"]),
+        WorkerType=event["glue_worker"],
+        Connections={
+            'Connections': [
+                f'{event["archive_id"]}-{event["database"]}-connection',
+            ]
+        }
+    )
+
+
 def lambda_handler(event, context):
 
     # Get SSM Parameter for DynamoDB Table name
@@ -36,7 +111,11 @@ def lambda_handler(event, context):
         Name='/glue/glue-role', WithDecryption=True)
 
     try:
-        if event["database_engine"] == "mysql":
+        if event.get("job_mode") == "archive":
+            create_archive_job(event, bucket_parm["Parameter"]["Value"],
+                               temp_glue_bucket_parm["Parameter"]["Value"],
+                               aws_glue_role["Parameter"]["Value"])
+        elif event["database_engine"] == "mysql":
             client.create_job(
                 Name=f'{event["archive_id"]}-{event["database"]}-{event["table"]}',
                 Role=aws_glue_role["Parameter"]["Value"],
@@ -47,10 +126,11 @@ def lambda_handler(event, context):
                 },
                 DefaultArguments={
                     '--TempDir': f's3://{temp_glue_bucket_parm["Parameter"]["Value"]}/temp/',
-                    '--job-bookmark-option': 'job-bookmark-disable'
+                    '--job-bookmark-option': 'job-bookmark-disable',
+                    '--extra-py-files': f's3://{bucket_parm["Parameter"]["Value"]}/lib/archive_glue.py'
                 },
                 MaxRetries=0,
-                GlueVersion='3.0',
+                GlueVersion=GLUE_VERSION,
                 NumberOfWorkers=int(event["glue_capacity"]),
                 WorkerType=event["glue_worker"],
                 Connections={
@@ -71,10 +151,11 @@ def lambda_handler(event, context):
                 DefaultArguments={
                     '--TempDir': f's3://{temp_glue_bucket_parm["Parameter"]["Value"]}/temp/',
                     '--job-bookmark-option': 'job-bookmark-disable',
-                    '--disable-proxy-v2': 'true'
+                    '--disable-proxy-v2': 'true',
+                    '--extra-py-files': f's3://{bucket_parm["Parameter"]["Value"]}/lib/archive_glue.py'
                 },
                 MaxRetries=0,
-                GlueVersion='3.0',
+                GlueVersion=GLUE_VERSION,
                 NumberOfWorkers=int(event["glue_capacity"]),
                 WorkerType=event["glue_worker"],
                 Connections={
@@ -94,10 +175,11 @@ def lambda_handler(event, context):
                 },
                 DefaultArguments={
                     '--TempDir': f's3://{temp_glue_bucket_parm["Parameter"]["Value"]}/temp/',
-                    '--job-bookmark-option': 'job-bookmark-disable'
+                    '--job-bookmark-option': 'job-bookmark-disable',
+                    '--extra-py-files': f's3://{bucket_parm["Parameter"]["Value"]}/lib/archive_glue.py'
                 },
                 MaxRetries=0,
-                GlueVersion='3.0',
+                GlueVersion=GLUE_VERSION,
                 NumberOfWorkers=int(event["glue_capacity"]),
                 WorkerType=event["glue_worker"],
                 Connections={
@@ -107,6 +189,12 @@ def lambda_handler(event, context):
                 }
             )
 
+    except client.exceptions.AlreadyExistsException:
+        # The archive is being run again, for instance to pick up the rows
+        # added to an incrementally archived table; reuse its job.
+        print(f'Job for {event["table"]} already exists')
+        upgrade_glue_version(job_name(event), GLUE_VERSION)
+
     except Exception as ex:
         print(ex)
         print('error')
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The step functions import job_plan as their deployment package lays it
+# out, with the function directory on the path.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,88 @@
+import pytest
+
+import job_plan
+
+GB = 1024 ** 3
+
+
+def archive(*sizes, capacity=2, small_table_mb=0):
+    return {
+        "configuration": {"glue": {"glue_capacity": capacity, "small_table_mb": small_table_mb}},
+        "table_details": [{"table": f"t{index}", "statistics": {"data_bytes": size}}
+                          for index, size in enumerate(sizes)],
+    }
+
+
+def test_table_workers_never_below_capacity():
+    item = archive(1 * GB, capacity=5)
+    assert job_plan.table_workers(item, item["table_details"][0]) == 5
+
+
+def test_table_workers_one_per_run_bytes():
+    item = archive(35 * GB)
+    assert job_plan.table_workers(item, item["table_details"][0]) == 4
+
+
+def test_table_workers_capped_at_max_workers():
+    item = archive(1000 * GB)
+    assert job_plan.table_workers(item, item["table_details"][0]) == job_plan.MAX_WORKERS
+
+
+def test_table_workers_capacity_above_max_workers():
+    item = archive(1000 * GB, capacity=30)
+    assert job_plan.table_workers(item, item["table_details"][0]) == 30
+
+
+def test_table_workers_unknown_size():
+    item = archive(None, capacity=3)
+    assert job_plan.table_workers(item, item["table_details"][0]) == 3
+
+
+def test_large_tables_get_dedicated_runs():
+    item = archive(1 * GB, 50 * GB, 2 * GB, 20 * GB)
+    runs = job_plan.plan_runs(item)
+    assert runs == [
+        {"tables": [1], "workers": 5, "estimated_bytes": 50 * GB},
+        {"tables": [3], "workers": 2, "estimated_bytes": 20 * GB},
+        {"tables": [2, 0], "workers": 2, "estimated_bytes": 3 * GB},
+    ]
+
+
+def test_small_tables_balanced_over_shared_runs():
+    item = archive(6 * GB, 5 * GB, 4 * GB, 3 * GB, 2 * GB)
+    runs = job_plan.plan_runs(item)
+    assert len(runs) == 2
+    assert sorted(index for run in runs for index in run["tables"]) == [0, 1, 2, 3, 4]
+    assert [run["estimated_bytes"] for run in runs] == [11 * GB, 9 * GB]
+    for run in runs:
+        sizes = [item["table_details"][index]["statistics"]["data_bytes"] for index in run["tables"]]
+        assert sizes == sorted(sizes, reverse=True)
+
+
+def test_extracted_tables_left_out():
+    item = archive(1024, 20 * GB, small_table_mb=64)
+    runs = job_plan.plan_runs(item)
+    assert [run["tables"] for run in runs] == [[1]]
+
+
+def test_large_tables_beyond_max_runs_are_shared_and_logged(capsys):
+    item = archive(*[(20 + index) * GB for index in range(job_plan.MAX_RUNS + 1)])
+    runs = job_plan.plan_runs(item)
+    assert len(runs) == job_plan.MAX_RUNS
+    dedicated = [run for run in runs if len(run["tables"]) == 1]
+    assert len(dedicated) == job_plan.MAX_RUNS - 1
+    assert [run["tables"] for run in runs if len(run["tables"]) > 1] == [[1, 0]]
+    assert "t1, t0" in capsys.readouterr().out
+
+
+def test_no_tables():
+    assert job_plan.plan_runs(archive()) == []
+
+
+def test_duplicate_table_names_rejected():
+    item = archive(1 * GB, 2 * GB, 3 * GB)
+    item["table_details"][0]["mssql_schema"] = "dbo"
+    item["table_details"][2].update(table="t0", mssql_schema="sales")
+    assert job_plan.duplicate_tables(item) == ["t0"]
+    with pytest.raises(ValueError, match="t0"):
+        job_plan.plan_runs(item)
@@ -0,0 +1,210 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+import datetime
+import decimal
+import math
+import re
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Rows fetched from the source and written to Parquet at a time.
+BATCH_ROWS = 10000
+
+# Arrow types of the Glue types the schema discovery maps columns to.
+# Unknown types are archived as strings, as ApplyMapping would.
+ARROW_TYPES = {
+    "string": pa.string(),
+    "varchar": pa.string(),
+    "tinyint": pa.int8(),
+    "smallint": pa.int16(),
+    "int": pa.int32(),
+    "bigint": pa.int64(),
+    "long": pa.int64(),
+    "float": pa.float32(),
+    "double": pa.float64(),
+    "boolean": pa.bool_(),
+    "binary": pa.binary(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us"),
+}
+
+DECIMAL_TYPE = re.compile(r"decimal(?:\((\d+),\s*(\d+)\))?$")
+
+# Content hash columns and buckets as the Glue jobs pick them; see hash_spec
+# in archive_glue.py. The hash itself is summed by the source database.
+HASH_BUCKETS = 16
+INTEGER_TYPES = ("tinyint", "smallint", "int", "integer", "bigint", "long")
+HASH_TYPES = INTEGER_TYPES + ("string", "varchar", "boolean", "date", "timestamp")
+
+
+def arrow_type(glue_type):
+    match = DECIMAL_TYPE.match(glue_type or "")
+    if match:
+        return pa.decimal128(int(match.group(1) or 10), int(match.group(2) or 0))
+    return ARROW_TYPES.get(glue_type, pa.string())
+
+
+def arrow_schema(columns):
+    """Return the Arrow schema of the table's mapped columns."""
+    return pa.schema([(column["key"], arrow_type(column["value"])) for column in columns])
+
+
+def convert(value, arrow):
+    """Convert a value fetched by the driver to what the Arrow type takes."""
+
+    if value is None:
+        return None
+    if pa.types.is_string(arrow):
+        if isinstance(value, bytes):
+            return value.decode("utf-8", "replace")
+        return value if isinstance(value, str) else str(value)
+    if pa.types.is_integer(arrow):
+        return int(value)
+    if pa.types.is_floating(arrow):
+        return float(value)
+    if pa.types.is_decimal(arrow):
+        return decimal.Decimal(str(value)).quantize(
+            decimal.Decimal(1).scaleb(-arrow.scale), rounding=decimal.ROUND_HALF_UP)
+    if pa.types.is_date(arrow) and isinstance(value, datetime.datetime):
+        return value.date()
+    if pa.types.is_binary(arrow) and isinstance(value, str):
+        return value.encode("utf-8")
+    return value
+
+
+def row_batches(cursor, schema):
+    """Build record batches from the row tuples of an executed cursor.
+
+    Every cell goes through convert, so this is the path for drivers that
+    only fetch rows.
+    """
+
+    while True:
+        rows = cursor.fetchmany(BATCH_ROWS)
+        if not rows:
+            break
+        yield pa.record_batch(
+            [pa.array([convert(row[index], field.type) for row in rows], type=field.type)
+             for index, field in enumerate(schema)],
+            schema=schema)
+
+
+def oracle_batches(connection, query, schema, batch_rows=BATCH_ROWS):
+    """Fetch record batches of an Oracle query straight into Arrow columns.
+
+    python-oracledb fills the columns of each batch without creating a
+    Python object per cell. NUMBER arrives as decimal128 with the column's
+    precision and scale, and DATE and TIMESTAMP as timestamps, and each
+    batch is cast to the schema in one vectorized step.
+
+    Data frame fetches only take fetch_decimals from the driver's
+    defaults, so it is set for this fetch and put back afterwards, leaving
+    the row fetches of the same container as they were.
+    """
+
+    import oracledb
+    fetch_decimals = oracledb.defaults.fetch_decimals
+    oracledb.defaults.fetch_decimals = True
+    try:
+        for frame in connection.fetch_df_batches(statement=query, size=batch_rows):
+            table = pa.interchange.from_dataframe(frame).rename_columns(schema.names)
+            for batch in table.cast(schema).to_batches():
+                yield batch
+    finally:
+        oracledb.defaults.fetch_decimals = fetch_decimals
+
+
+def hash_spec(hash_columns, columns, split_key):
+    """Describe how the table's rows are content hashed, as the Glue jobs do.
+
+    hash_columns are the [column, Glue type] pairs step nine picked by the
+    columns' source types.
+    """
+
+    glue_types = {column["key"]: column["value"] for column in columns}
+    hashed = [[name, glue_type] for name, glue_type in hash_columns
+              if glue_types.get(name) == glue_type
+              and (glue_type in HASH_TYPES or DECIMAL_TYPE.match(glue_type))]
+
+    split_key = split_key or {}
+    key_type = glue_types.get(split_key.get("column"), "")
+    match = DECIMAL_TYPE.match(key_type)
+    integral = key_type in INTEGER_TYPES or (match and not int(match.group(2) or 0))
+
+    bucket = None
+    if integral and split_key.get("lower") is not None and split_key.get("upper") is not None:
+        lower = int(decimal.Decimal(split_key["lower"]))
+        width = max(1, -(-(int(decimal.Decimal(split_key["upper"])) - lower + 1) // HASH_BUCKETS))
+        bucket = {"column": split_key["column"], "lower": lower, "width": width}
+    return {"columns": hashed, "bucket": bucket}
+
+
+def new_metrics(schema):
+    return {"rows": 0,
+            "columns": {field.name: {"nulls": 0, "sum": None, "min": None, "max": None}
+                        for field in schema}}
+
+
+def add_metrics(metrics, batch):
+    """Fold a record batch into the metrics of its table.
+
+    The metrics are the ones the Glue jobs put in their manifests: the row
+    count and each column's nulls, sum, min and max, with integer sums
+    taken as decimal so they cannot overflow and binary columns only
+    getting a null count.
+    """
+
+    metrics["rows"] += batch.num_rows
+    for field, array in zip(batch.schema, batch.columns):
+        column = metrics["columns"][field.name]
+        column["nulls"] += array.null_count
+        if array.null_count == len(array):
+            continue
+
+        if pa.types.is_integer(field.type):
+            total = pc.sum(array.cast(pa.decimal128(38, 0))).as_py()
+        elif pa.types.is_floating(field.type) or pa.types.is_decimal(field.type):
+            total = pc.sum(array).as_py()
+        else:
+            total = None
+        if total is not None:
+            column["sum"] = total if column["sum"] is None else column["sum"] + total
+
+        if not pa.types.is_binary(field.type):
+            bounds = pc.min_max(array).as_py()
+            if column["min"] is None or bounds["min"] < column["min"]:
+                column["min"] = bounds["min"]
+            if column["max"] is None or bounds["max"] > column["max"]:
+                column["max"] = bounds["max"]
+
+
+def metric_value(value):
+    """Return a metric as a JSON value, exact numbers and times as strings."""
+
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    if isinstance(value, decimal.Decimal) or (isinstance(value, float) and not math.isfinite(value)):
+        return str(value)
+    return value
+
+
+def finish_metrics(metrics):
+    """Return the metrics as the JSON the manifests hold."""
+
+    return {"rows": metrics["rows"],
+            "columns": {name: {key: metric_value(value) for key, value in column.items()}
+                        for name, column in metrics["columns"].items()}}
@@ -0,0 +1,78 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+
+Compares row tuple and Arrow fetching of an Oracle table, the two paths
+the small table extractor has. Run it from a host that can reach the
+database, with pyarrow and python-oracledb installed:
+
+  python benchmark.py --dsn host:1521/service --user archive \
+      --table OWNER.ORDERS --columns '[{"key": "ID", "value": "decimal(10,0)"}]'
+
+The password is read from ORACLE_PASSWORD.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import arrow_batches
+import oracledb
+
+
+def fetch_rows(connection, query, schema, arraysize):
+    cursor = connection.cursor()
+    cursor.arraysize = arraysize
+    cursor.prefetchrows = arraysize + 1
+    try:
+        cursor.execute(query)
+        return sum(batch.num_rows for batch in arrow_batches.row_batches(cursor, schema))
+    finally:
+        cursor.close()
+
+
+def fetch_arrow(connection, query, schema, arraysize):
+    return sum(batch.num_rows
+               for batch in arrow_batches.oracle_batches(connection, query, schema, arraysize))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time row tuple and Arrow fetching of an Oracle table.")
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--columns", required=True,
+                        help="the table's schema as stored in the archive record")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    columns = json.loads(args.columns)
+    schema = arrow_batches.arrow_schema(columns)
+    query = f'SELECT {", ".join(column["key"] for column in columns)} FROM {args.table}'
+
+    with oracledb.connect(user=args.user, password=os.environ["ORACLE_PASSWORD"],
+                          dsn=args.dsn) as connection:
+        for name, fetch in (("rows", fetch_rows), ("arrow", fetch_arrow)):
+            timings = []
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                rows = fetch(connection, query, schema, arrow_batches.BATCH_ROWS)
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            print(f"{name:>6}: {rows} rows, best of {args.rounds} {best:.3f}s, "
+                  f"{rows / best if best else 0:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
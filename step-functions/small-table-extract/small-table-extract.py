@@ -0,0 +1,258 @@
+"""
+Copyright 2023 Amazon.com, Inc. and its affiliates. All Rights Reserved.
+
+Licensed under the Amazon Software License (the "License").
+You may not use this file except in compliance with the License.
+A copy of the License is located at
+
+  http://aws.amazon.com/asl/
+
+or in the "license" file accompanying this file. This file is distributed
+on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+express or implied. See the License for the specific language governing
+permissions and limitations under the License.
+"""
+
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import os
+import traceback
+
+import arrow_batches
+import boto3
+import content_hash
+import pyarrow as pa
+import pyarrow.parquet as pq
+import source_connector
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+logger = logging.getLogger()
+if logger.hasHandlers():
+    logger.setLevel(LOG_LEVEL)
+else:
+    logging.basicConfig(level=LOG_LEVEL)
+
+ssm = boto3.client('ssm')
+dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+secrets = boto3.client('secretsmanager')
+s3 = boto3.client('s3')
+events = boto3.client('events')
+
+# Source of the job state change events this function sends; the glue job
+# status function handles them like those of Glue job runs.
+EVENT_SOURCE = "simple-database-archival.extractor"
+
+# Identifier quotes of each source engine; see archive_glue.py.
+IDENTIFIER_QUOTES = {"mysql": ("`", "`"), "mssql": ("[", "]"), "oracle": ('"', '"')}
+
+
+def quote_identifier(engine, name):
+    open_quote, close_quote = IDENTIFIER_QUOTES[engine]
+    return open_quote + name.replace(close_quote, close_quote * 2) + close_quote
+
+
+def source_relation(item, tbl):
+    engine = item["database_engine"]
+    if engine == "mssql":
+        return f'{tbl["mssql_schema"]}.{tbl["table"]}'
+    if engine == "oracle":
+        return f'{item["oracle_owner"]}.{tbl["table"]}'
+    return tbl["table"]
+
+
+def source_query(item, tbl):
+    """Return the query selecting the table's mapped columns and filtered rows."""
+
+    engine = item["database_engine"]
+    select = ", ".join(quote_identifier(engine, schema["key"]) for schema in tbl["schema"])
+    query = f"SELECT {select} FROM {source_relation(item, tbl)}"
+    if tbl.get("row_filter"):
+        query += f' WHERE {tbl["row_filter"]}'
+    # The table is written as one file, so its sort order is the query's.
+    sort_by = (tbl.get("parquet_layout") or {}).get("sort_by")
+    if sort_by:
+        query += " ORDER BY " + ", ".join(quote_identifier(engine, column) for column in sort_by)
+    return query
+
+
+def open_cursor(engine, connection):
+    """Return a cursor that streams rows instead of buffering the result."""
+
+    if engine == "mysql":
+        import pymysql
+        return connection.cursor(pymysql.cursors.SSCursor)
+    return connection.cursor()
+
+
+def writer_options(tbl):
+    """Return the ParquetWriter options of the table's parquet_layout."""
+
+    layout = tbl.get("parquet_layout") or {}
+    options = {}
+    if layout.get("page_kb"):
+        options["data_page_size"] = int(layout["page_kb"]) * 1024
+    if "dictionary" in layout:
+        options["use_dictionary"] = bool(layout["dictionary"])
+    return options
+
+
+class RowGroupWriter:
+    """Write record batches to a ParquetWriter in row groups of about row_group_bytes.
+
+    Without a size each batch is a row group of its own.
+    """
+
+    def __init__(self, writer, row_group_bytes):
+        self.writer = writer
+        self.row_group_bytes = row_group_bytes
+        self.batches = []
+        self.buffered_bytes = 0
+
+    def write(self, batch):
+        if not self.row_group_bytes:
+            self.writer.write_batch(batch)
+            return
+        self.batches.append(batch)
+        self.buffered_bytes += batch.nbytes
+        if self.buffered_bytes >= self.row_group_bytes:
+            self.flush()
+
+    def flush(self):
+        if self.batches:
+            table = pa.Table.from_batches(self.batches)
+            self.writer.write_table(table, row_group_size=table.num_rows)
+        self.batches = []
+        self.buffered_bytes = 0
+
+
+def extract(item, tbl, password, path, compression, hash_columns):
+    """Stream the table into a Parquet file at path and return its metrics.
+
+    Oracle rows are fetched straight into Arrow columns; the other engines
+    fetch row tuples through a server-side cursor. Row groups are sized by
+    the table's parquet_layout; its byte size is measured in memory, so
+    the compressed row groups come out smaller, as they do from Spark.
+
+    The content hash covers hash_columns, as step nine picked them. The
+    source sums it in one query once the rows are written, so rows that
+    change in between show up as mismatched buckets at validation.
+    """
+
+    engine = item["database_engine"]
+    schema = arrow_batches.arrow_schema(tbl["schema"])
+    query = source_query(item, tbl)
+    metrics = arrow_batches.new_metrics(schema)
+    spec = arrow_batches.hash_spec(hash_columns, tbl["schema"], tbl.get("split_key"))
+    row_group_mb = (tbl.get("parquet_layout") or {}).get("row_group_mb")
+
+    with source_connector.connect(engine, item["hostname"], item["port"],
+                                  item["username"], password, item["database"]) as connection:
+        # Timestamps are written as INT96, like the Glue jobs write them.
+        with pq.ParquetWriter(path, schema, compression=compression,
+                              use_deprecated_int96_timestamps=True,
+                              **writer_options(tbl)) as parquet_writer:
+            writer = RowGroupWriter(parquet_writer, int(row_group_mb or 0) * 1024 ** 2)
+            if engine == "oracle":
+                for batch in arrow_batches.oracle_batches(connection, query, schema):
+                    writer.write(batch)
+                    arrow_batches.add_metrics(metrics, batch)
+                writer.flush()
+            else:
+                cursor = open_cursor(engine, connection)
+                try:
+                    cursor.execute(query)
+                    for batch in arrow_batches.row_batches(cursor, schema):
+                        writer.write(batch)
+                        arrow_batches.add_metrics(metrics, batch)
+                    writer.flush()
+                finally:
+                    cursor.close()
+
+        # Without columns there is nothing to hash, and validation skips it.
+        buckets = (content_hash.source_hash(connection, engine, source_relation(item, tbl),
+                                            tbl.get("row_filter"), spec)
+                   if spec["columns"] else {})
+    return dict(arrow_batches.finish_metrics(metrics), content_hash=dict(spec, buckets=buckets))
+
+
+def put_object(bucket, key, body):
+    # Puts to a bucket with Object Lock need a Content-MD5.
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=body,
+        ContentMD5=base64.b64encode(hashlib.md5(body).digest()).decode("ascii"),
+    )
+
+
+def send_state(event, state, message, started_on):
+    events.put_events(Entries=[{
+        "Source": EVENT_SOURCE,
+        "DetailType": "Glue Job State Change",
+        "Detail": json.dumps({
+            "jobName": event["job_name"],
+            "jobRunId": event["job_run_id"],
+            "state": state,
+            "message": message,
+            "startedOn": str(started_on),
+            "completedOn": str(datetime.datetime.now(datetime.timezone.utc)),
+        }),
+    }])
+
+
+def lambda_handler(event, context):
+    """
+    Archives a small table without Spark.
+
+    Step nine invokes this function asynchronously, in place of a Glue job
+    run, for tables small enough that Spark startup would dominate. The
+    table is written to the same prefix and with the same codec a Glue job
+    would use, and the outcome is sent as a job state change event with
+    the job name and run id step nine recorded.
+    """
+
+    started_on = datetime.datetime.now(datetime.timezone.utc)
+    try:
+        table_parameter = ssm.get_parameter(Name='/archive/dynamodb-table', WithDecryption=True)
+        bucket_parameter = ssm.get_parameter(Name='/job/s3-bucket-table-data', WithDecryption=True)
+        bucket = bucket_parameter["Parameter"]["Value"]
+
+        item = dynamodb.Table(table_parameter["Parameter"]["Value"]).get_item(
+            Key={"id": event["archive_id"]})["Item"]
+        password = secrets.get_secret_value(SecretId=item["secret_arn"])["SecretString"]
+
+        tbl = next(tbl for tbl in item["table_details"]
+                   if tbl["table"] == event["table"]
+                   and tbl.get("mssql_schema") == event.get("mssql_schema"))
+
+        compression = item["configuration"].get("output", {}).get("compression", "snappy")
+        prefix = f'{item["id"]}/{item["database"]}/{tbl["table"]}/'
+        path = f'/tmp/{event["job_run_id"]}.parquet'
+
+        key = f'{prefix}part-00000-{event["job_run_id"]}.{compression}.parquet'
+
+        try:
+            metrics = extract(item, tbl, password, path,
+                              None if compression == "uncompressed" else compression,
+                              event.get("hash_columns") or [])
+            footer = pq.read_metadata(path)
+            files = [{"key": key, "bytes": os.path.getsize(path),
+                      "rows": footer.num_rows, "row_groups": footer.num_row_groups}]
+            with open(path, "rb") as parquet_file:
+                put_object(bucket, key, parquet_file.read())
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+        # The same manifest the Glue jobs write.
+        manifest = dict(metrics, watermark=None, output_bytes=files[0]["bytes"], files=files)
+        put_object(bucket, f'{prefix}_manifests/{event["job_run_id"]}.json',
+                   json.dumps(manifest).encode("utf-8"))
+        send_state(event, "SUCCEEDED", "", started_on)
+
+    except Exception as ex:
+        logger.error(traceback.format_exc())
+        send_state(event, "FAILED", str(ex)[:1000], started_on)